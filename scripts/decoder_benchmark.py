@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark the compiled frame decoders vs. the hand written decoders"""
+
+import argparse
+from timeit import repeat
+from typing import Callable, List, Tuple
+
+from vand.backends import FAKE_HS075S_MFG_DATA
+from vand.govee import HS075S_DECODER, WeatherMetrics
+from vand.li3 import LI3_DECODER, Li3TelemetryStats
+
+LI3_FRAME = bytearray(b"1309,327,327,328,327,32,39,0,79,000000")
+
+
+def _li3_hand_written(data: bytearray) -> Li3TelemetryStats:
+    """Li3FrameParser.feed()'s decoding before LI3_DECODER"""
+    csv_data = data.split(b",")
+    return Li3TelemetryStats(
+        float(csv_data[0]) / 100,
+        float(csv_data[1]) / 100,
+        float(csv_data[2]) / 100,
+        float(csv_data[3]) / 100,
+        float(csv_data[4]) / 100,
+        float(csv_data[5]),
+        float(csv_data[6]),
+        float(csv_data[7]),
+        float(csv_data[8]),
+        int(csv_data[9], 16),
+    )
+
+
+def _hs075s_hand_written(mfg_data: bytes, rssi: int) -> WeatherMetrics:
+    """HS075S.process_data()'s decoding before HS075S_DECODER"""
+    encoded_data = (mfg_data[3] << 16) | (mfg_data[4] << 8) | mfg_data[5]
+    return WeatherMetrics(
+        battery_pct_left=mfg_data[6],
+        humidity=round((encoded_data % 1000) / 10, 2),
+        rssi=rssi,
+        temperature_c=round(encoded_data / 10000, 2),
+        temperature_f=round(((encoded_data / 10000) * 1.8) + 32, 2),
+    )
+
+
+def main() -> int:
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("-n", "--number", type=int, default=200000)
+    cli.add_argument("-r", "--repeat", type=int, default=5)
+    args = cli.parse_args()
+
+    # Both sides are timed as one call of the decoder with the frame
+    runs: List[Tuple[str, Callable[..., object], Callable[..., object], Tuple]] = [
+        ("Li3", _li3_hand_written, LI3_DECODER.decode, (LI3_FRAME,)),
+        (
+            "HS075S",
+            _hs075s_hand_written,
+            HS075S_DECODER.decode,
+            (FAKE_HS075S_MFG_DATA, -60),
+        ),
+    ]
+    for device, hand_written, compiled, frame in runs:
+        assert hand_written(*frame) == compiled(*frame), f"{device} decoders disagree"
+        for name, decode in (("hand written", hand_written), ("compiled", compiled)):
+            best = min(
+                repeat(
+                    "decode(*frame)",
+                    globals={"decode": decode, "frame": frame},
+                    number=args.number,
+                    repeat=args.repeat,
+                )
+            )
+            print(
+                f"{device:>6} {name:>12}: {args.number / best:,.0f} frames/s "
+                + f"({best / args.number * 1e9:.0f}ns per frame)"
+            )
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
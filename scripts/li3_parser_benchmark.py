@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmark Li3FrameParser vs. the original str concatenating handler"""
+
+import argparse
+from timeit import repeat
+from typing import Optional
+
+from vand.li3 import Li3FrameParser, Li3TelemetryStats
+from vand.tests.li3_fixtures import FAKE_LI3_BINARY_DATA
+
+
+class LegacyHandler:
+    """Li3Battery._telementary_handler before Li3FrameParser"""
+
+    def __init__(self) -> None:
+        self.str_data = ""
+        self.stats: Optional[Li3TelemetryStats] = None
+
+    def _telementary_handler(self, sender: str, data: bytes) -> None:
+        self.raw_data = data
+        tmp_str_data = data.decode("ascii")
+        if tmp_str_data.startswith(","):
+            self.str_data += tmp_str_data.strip()
+            csv_data = self.str_data.split(",")
+            self.stats = Li3TelemetryStats(
+                float(csv_data[0]) / 100,
+                float(csv_data[1]) / 100,
+                float(csv_data[2]) / 100,
+                float(csv_data[3]) / 100,
+                float(csv_data[4]) / 100,
+                float(csv_data[5]),
+                float(csv_data[6]),
+                float(csv_data[7]),
+                float(csv_data[8]),
+                int(csv_data[9], 16),
+            )
+        elif "&" not in tmp_str_data:
+            self.str_data = tmp_str_data
+
+
+LEGACY_HANDLER = LegacyHandler()
+PARSER = Li3FrameParser()
+
+
+def _legacy_run() -> None:
+    for data in FAKE_LI3_BINARY_DATA:
+        LEGACY_HANDLER._telementary_handler("bench", data)
+
+
+def _parser_run() -> None:
+    for data in FAKE_LI3_BINARY_DATA:
+        PARSER.feed(data)
+
+
+def main() -> int:
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("-n", "--number", type=int, default=100000)
+    cli.add_argument("-r", "--repeat", type=int, default=5)
+    args = cli.parse_args()
+
+    for name, func in (("legacy", _legacy_run), ("Li3FrameParser", _parser_run)):
+        best = min(repeat(func, number=args.number, repeat=args.repeat))
+        print(
+            f"{name:>16}: {args.number / best:,.0f} frames/s "
+            + f"({best / args.number * 1e6:.2f}us per {len(FAKE_LI3_BINARY_DATA)} fragments)"
+        )
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
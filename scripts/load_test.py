@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""Run vanD against fake radios fed by synthetic or recorded BLE traffic"""
+
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import statistics
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter, process_time
+from typing import Any, Dict, Optional
+
+from vand.backends import FakeBackend, get_backend
+from vand.main import async_main
+
+
+def _device_config(prefix: str, count: int, **kwargs: Any) -> Dict[str, Any]:
+    return {
+        str(dev): {
+            "dev_name": f"{prefix}-{dev}",
+            "mac_address": f"{prefix}:{dev >> 16 & 0xFF:02X}:{dev >> 8 & 0xFF:02X}:"
+            + f"{dev & 0xFF:02X}",
+            "timeout": 5.0,
+            **kwargs,
+        }
+        for dev in range(count)
+    }
+
+
+def load_test_config(
+    li3: int,
+    hs075s: int,
+    duration: float,
+    speed: float,
+    port: int,
+    recording: Optional[str] = None,
+) -> Dict[str, Any]:
+    ble_backend: Dict[str, Any] = {"type": "replay", "speed": speed}
+    if recording:
+        ble_backend["path"] = recording
+    else:
+        ble_backend["duration"] = duration * speed
+    conf: Dict[str, Any] = {
+        "vanD": {
+            "prometheus_exporter_port": port,
+            "scan_time": 5.0,
+            "statistics_refresh_interval": 30.0,
+            "stats_update_mode": "event",
+            "ble_backend": ble_backend,
+            "ble_connections": {"max_concurrent_connects": 16},
+        },
+    }
+    if li3:
+        conf["li3"] = _device_config(
+            "64:69:4E",
+            li3,
+            service_uuid="0000ffe0-0000-1000-8000-00805f9b34fb",
+            characteristic="0000ffe1-0000-1000-8000-00805f9b34fb",
+        )
+    if hs075s:
+        conf["HS075S"] = _device_config(
+            "A4:C1:38",
+            hs075s,
+            service_uuid="0000ec88-0000-1000-8000-00805f9b34fb",
+            characteristic="",
+        )
+    return conf
+
+
+async def load_test(conf: Dict[str, Any], duration: float) -> None:
+    with TemporaryDirectory() as td:
+        conf_path = Path(td) / "load_test.json"
+        conf_path.write_text(json.dumps(conf))
+        cpu_start = process_time()
+        start_time = perf_counter()
+        try:
+            await asyncio.wait_for(async_main(False, str(conf_path)), duration)
+        except asyncio.TimeoutError:
+            pass
+        run_time = perf_counter() - start_time
+        cpu_time = process_time() - cpu_start
+
+    backend = get_backend()
+    assert isinstance(backend, FakeBackend)
+    print(f"Ran {run_time:.1f}s using {cpu_time:.2f}s CPU ({cpu_time / run_time:.1%})")
+    print(
+        f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB"
+    )
+    print(
+        f"Injected {backend.injected:,} events ({backend.injected / run_time:,.0f}/s) "
+        + f"- {backend.dropped:,} dropped"
+    )
+    if len(backend.latencies) > 1:
+        quantiles = statistics.quantiles(backend.latencies, n=100)
+        print(
+            f"Handling latency: p50 {quantiles[49] * 1e6:.0f}us "
+            + f"p99 {quantiles[98] * 1e6:.0f}us max {max(backend.latencies) * 1e6:.0f}us"
+        )
+
+
+def main() -> int:
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("-d", "--duration", type=float, default=30.0, help="Seconds")
+    cli.add_argument("-H", "--hs075s", type=int, default=100)
+    cli.add_argument("-l", "--li3", type=int, default=100)
+    cli.add_argument("-p", "--port", type=int, default=31338)
+    cli.add_argument("-r", "--recording", help="Replay a recorded BLE log instead")
+    cli.add_argument("-s", "--speed", type=float, default=1.0)
+    args = cli.parse_args()
+    # Keep per device logging out of the report
+    logging.getLogger().setLevel(logging.WARNING)
+    conf = load_test_config(
+        args.li3, args.hs075s, args.duration, args.speed, args.port, args.recording
+    )
+    asyncio.run(load_test(conf, args.duration))
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""Push samples through RemoteWriteClient to a local stand-in receiver"""
+
+import argparse
+import asyncio
+from time import perf_counter
+from typing import cast
+
+from aiohttp import ClientSession, TCPConnector
+from aioprometheus import Gauge
+from aioprometheus.collectors import Registry
+from vand.remote_write import RemoteWriteClient, SampleQueue
+from vand.tests.remote_write import FakeRemoteWriteReceiver
+
+
+async def bench(devices: int, samples: int, batch_size: int) -> None:
+    registry = Registry()
+    gauge = Gauge("li3_battery_voltage", "Benchmark gauge", registry=registry)
+    for dev in range(devices):
+        gauge.set({"dev_name": f"Li3-{dev}", "mac_address": f"{dev:012X}"}, 13.09)
+
+    queue = SampleQueue(max_samples=samples + devices)
+    for tick in range(samples // devices):
+        await queue.record_registry(registry, timestamp=1700000000 + tick)
+
+    receiver = FakeRemoteWriteReceiver()
+    url = await receiver.start()
+    rwc = RemoteWriteClient(url, queue, Registry(), batch_size=batch_size)
+    total_samples = len(queue)
+    start_time = perf_counter()
+    async with ClientSession(connector=TCPConnector(limit=1)) as session:
+        while True:
+            start, batch = queue.peek(batch_size)
+            if not batch:
+                break
+            await rwc.send(session, batch)
+            queue.consume(start, len(batch))
+    run_time = perf_counter() - start_time
+    await receiver.stop()
+
+    sent_bytes = cast(float, rwc.prom_stats["sent_bytes"].get({}))
+    uncompressed_bytes = cast(float, rwc.prom_stats["uncompressed_bytes"].get({}))
+    print(
+        f"{total_samples:,} samples in {rwc.prom_stats['batches'].get({}):.0f} batches"
+    )
+    print(f"Throughput: {total_samples / run_time:,.0f} samples/s")
+    print(
+        f"On the wire: {sent_bytes:,.0f} bytes ({sent_bytes / total_samples:.2f} "
+        + f"bytes/sample) - {uncompressed_bytes:,.0f} bytes uncompressed"
+    )
+
+
+def main() -> int:
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("-b", "--batch-size", type=int, default=500)
+    cli.add_argument("-d", "--devices", type=int, default=10)
+    cli.add_argument("-s", "--samples", type=int, default=100000)
+    args = cli.parse_args()
+    asyncio.run(bench(args.devices, args.samples, args.batch_size))
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""Compare scrape latency + CPU of the plain and cached Prometheus exporters"""
+
+import argparse
+import asyncio
+import socket
+from itertools import cycle
+from statistics import quantiles
+from time import perf_counter, process_time
+from typing import Dict, List
+
+from aiohttp import ClientSession
+from aioprometheus.collectors import Registry
+from aioprometheus.service import Service
+from vand.benchmarks import _hygrometers, _li3_batteries
+from vand.exposition import CachedService
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+async def _scraper(
+    session: ClientSession, scrapes: int, etag: bool, latencies: List[float]
+) -> int:
+    """Returns how many scrapes were answered with a 304"""
+    headers: Dict[str, str] = {"Accept-Encoding": "gzip"}
+    not_modified = 0
+    for _ in range(scrapes):
+        start_time = perf_counter()
+        async with session.get("/metrics", headers=headers) as resp:
+            await resp.read()
+            if resp.status == 304:
+                not_modified += 1
+            elif etag and "ETag" in resp.headers:
+                headers["If-None-Match"] = resp.headers["ETag"]
+        latencies.append(perf_counter() - start_time)
+    return not_modified
+
+
+async def bench(
+    service_name: str,
+    devices: int,
+    scrapers: int,
+    scrapes: int,
+    change_interval: float,
+    etag: bool,
+) -> None:
+    registry = Registry()
+    rb = _li3_batteries(devices, registry)
+    rb.refresh_prom_stats()
+    _hygrometers(devices, registry).refresh_prom_stats()
+    service = CachedService(registry) if service_name == "cached" else Service(registry)
+    port = _free_port()
+    await service.start(port=port)
+
+    async def change_values() -> None:
+        """A battery's voltage changes every change_interval seconds"""
+        labels = cycle([b.prom_labels for b in rb.batteries])
+        values = cycle([13.09, 13.1, 13.11])
+        while True:
+            await asyncio.sleep(change_interval)
+            rb.prom_stats["battery_voltage"].set(next(labels), next(values))
+
+    change_task = asyncio.create_task(change_values())
+    latencies: List[float] = []
+    start_cpu = process_time()
+    start_time = perf_counter()
+    async with ClientSession(f"http://127.0.0.1:{port}") as session:
+        not_modified = sum(
+            await asyncio.gather(
+                *(_scraper(session, scrapes, etag, latencies) for _ in range(scrapers))
+            )
+        )
+    run_time = perf_counter() - start_time
+    cpu_time = process_time() - start_cpu
+    change_task.cancel()
+    await service.stop()
+
+    total = len(latencies)
+    percentiles = quantiles(latencies, n=100)
+    print(f"{service_name} exporter - {devices} devices of each type:")
+    print(f"  {total:,} scrapes in {run_time:.2f}s ({not_modified:,} 304s)")
+    print(
+        f"  Latency: p50 {percentiles[49] * 1000:.2f}ms "
+        + f"p99 {percentiles[98] * 1000:.2f}ms"
+    )
+    # Includes the scrapers' CPU - compare the two exporters, not absolutes
+    print(f"  CPU per scrape: {cpu_time / total * 1000:.3f}ms")
+
+
+def main() -> int:
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("-c", "--change-interval", type=float, default=0.1)
+    cli.add_argument("-d", "--devices", type=int, default=4)
+    cli.add_argument("-e", "--etag", action="store_true", help="Send If-None-Match")
+    cli.add_argument("-n", "--scrapes", type=int, default=200, help="Per scraper")
+    cli.add_argument("-s", "--scrapers", type=int, default=4)
+    args = cli.parse_args()
+    for service_name in ("plain", "cached"):
+        asyncio.run(
+            bench(
+                service_name,
+                args.devices,
+                args.scrapers,
+                args.scrapes,
+                args.change_interval,
+                args.etag,
+            )
+        )
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
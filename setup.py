@@ -23,6 +23,7 @@ setup(
     version="2023.11.18",
     description=("Daemon for all your Van Life needs ..."),
     packages=find_packages(),
+    package_data={"vand": ["benchmarks_baseline.json", "dashboard.html"]},
     url="http://github.com/cooperlees/vanD/",
     author="Cooper Lees",
     author_email="me@cooperlees.com",
@@ -33,8 +34,15 @@ setup(
         "Programming Language :: Python :: 3.12",
         "Development Status :: 3 - Alpha",
     ],
-    entry_points={"console_scripts": ["vanD = vand.main:main"]},
+    entry_points={
+        "console_scripts": ["vanD = vand.main:main"],
+        "vand.modules": [
+            "HS075S = vand.govee:load_module",
+            "li3 = vand.li3:load_module",
+        ],
+    },
     install_requires=["aiohttp", "aioprometheus[aiohttp]", "bleak", "bleson", "click"],
+    extras_require={"remote_write": ["python-snappy"]},
     test_require=["ptr"],
     python_requires=">=3.11",
     test_suite=ptr_params["test_suite"],
@@ -0,0 +1,162 @@
+import logging
+import re
+from typing import Any, Collection, Dict, Optional, Union
+
+from aioprometheus import Counter, Gauge
+from aioprometheus.collectors import Registry
+from bleak.exc import BleakError
+
+from vand.registry import per_registry
+
+
+LOG = logging.getLogger(__name__)
+DEFAULT_ADAPTER = "hci0"
+ADAPTER_NAME = re.compile(r"hci(\d+)")
+
+
+def details_adapter(details: Any) -> str:
+    """Adapter a BlueZ BLEDevice was seen on - from its /org/bluez/hciN/dev_X path"""
+    path = details.get("path", "") if isinstance(details, dict) else ""
+    parts = str(path).split("/")
+    if len(parts) > 3 and ADAPTER_NAME.fullmatch(parts[3]):
+        return parts[3]
+    return DEFAULT_ADAPTER
+
+
+class Adapter:
+    def __init__(
+        self, name: str, max_connections: Optional[int] = None, observe: bool = True
+    ) -> None:
+        match = ADAPTER_NAME.fullmatch(name)
+        if not match:
+            raise ValueError(f"{name} is not a HCI adapter name - e.g. hci1")
+        self.name = name
+        # bleson wants the adapter's index
+        self.id = int(match.group(1))
+        # None is no limit
+        self.max_connections = max_connections
+        # Whether advertisement observers can be placed here
+        self.observe = observe
+        self.connections = 0
+        self.observers = 0
+        self.prom_labels = {"adapter": name}
+
+    @property
+    def full(self) -> bool:
+        return (
+            self.max_connections is not None
+            and self.connections >= self.max_connections
+        )
+
+    @property
+    def utilization(self) -> float:
+        if not self.max_connections:
+            return 0.0
+        return self.connections / self.max_connections
+
+
+class AdapterPool:
+    """HCI adapters to spread BLE work across - use adapter_pool()
+
+    GATT connections go to the least utilized adapter that has seen the device
+    (unless the device is pinned to one) and advertisement observers move to
+    the adapter with the fewest connections, as a controller busy connecting
+    misses advertisements. Without configure() everything uses hci0."""
+
+    def __init__(self, registry: Registry) -> None:
+        self.adapters: Dict[str, Adapter] = {DEFAULT_ADAPTER: Adapter(DEFAULT_ADAPTER)}
+        # MAC address -> adapter holding its GATT connection
+        self.connections: Dict[str, Adapter] = {}
+
+        self.prom_stats: Dict[str, Union[Counter, Gauge]] = {
+            "connect_failures": Counter(
+                "vand_adapter_connect_failures_total",
+                "GATT connects that failed on the adapter",
+                registry=registry,
+            ),
+            "connections": Gauge(
+                "vand_adapter_connections",
+                "GATT connections held (or being made) on the adapter",
+                registry=registry,
+            ),
+            "observers": Gauge(
+                "vand_adapter_observers",
+                "Advertisement observers running on the adapter",
+                registry=registry,
+            ),
+            "utilization": Gauge(
+                "vand_adapter_utilization_ratio",
+                "Connections / max_connections of the adapter - 0 if unlimited",
+                registry=registry,
+            ),
+        }
+
+    def configure(self, adapters: Dict[str, Dict[str, Any]]) -> None:
+        """Adapter name -> Adapter settings - call before any BLE work starts"""
+        self.adapters = {
+            name: Adapter(name, **settings) for name, settings in adapters.items()
+        }
+        for adapter in self.adapters.values():
+            self._publish(adapter)
+        LOG.info(f"Spreading BLE work across {', '.join(self.adapters)}")
+
+    def _publish(self, adapter: Adapter) -> None:
+        self.prom_stats["connections"].set(adapter.prom_labels, adapter.connections)
+        self.prom_stats["observers"].set(adapter.prom_labels, adapter.observers)
+        self.prom_stats["utilization"].set(adapter.prom_labels, adapter.utilization)
+
+    def acquire_connection(
+        self, mac_address: str, seen_on: Collection[str], pinned: Optional[str] = None
+    ) -> Adapter:
+        """Least utilized adapter of seen_on with room - raises BleakError if none"""
+        self.release_connection(mac_address)
+        names = [pinned] if pinned else seen_on
+        candidates = [
+            self.adapters[name]
+            for name in names
+            if name in self.adapters and name in seen_on
+        ]
+        if not candidates:
+            raise BleakError(
+                f"{mac_address} has not been seen on adapter(s) {sorted(names)}"
+            )
+        free = [adapter for adapter in candidates if not adapter.full]
+        if not free:
+            raise BleakError(
+                f"No free connection slot for {mac_address} on "
+                + f"{[a.name for a in candidates]}"
+            )
+        adapter = min(free, key=lambda a: (a.utilization, a.observers, a.id))
+        adapter.connections += 1
+        self.connections[mac_address] = adapter
+        self._publish(adapter)
+        return adapter
+
+    def release_connection(self, mac_address: str, failed: bool = False) -> None:
+        adapter = self.connections.pop(mac_address, None)
+        if adapter is None:
+            return
+        adapter.connections -= 1
+        if failed:
+            self.prom_stats["connect_failures"].inc(adapter.prom_labels)
+        self._publish(adapter)
+
+    def acquire_observer(self) -> Adapter:
+        """Adapter with the fewest connections that's allowed to observe"""
+        candidates = [a for a in self.adapters.values() if a.observe]
+        if not candidates:
+            candidates = list(self.adapters.values())
+        adapter = min(candidates, key=lambda a: (a.connections, a.observers, a.id))
+        adapter.observers += 1
+        self._publish(adapter)
+        return adapter
+
+    def release_observer(self, adapter: Adapter) -> None:
+        adapter.observers -= 1
+        self._publish(adapter)
+
+
+@per_registry
+def adapter_pool(registry: Registry) -> AdapterPool:
+    """The AdapterPool for registry - created on first use"""
+    return AdapterPool(registry)
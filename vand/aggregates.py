@@ -0,0 +1,121 @@
+import logging
+from dataclasses import fields
+from operator import attrgetter
+from time import time
+from typing import Any, Dict, List, Optional, Protocol, Sequence, Tuple
+
+from aioprometheus import Gauge
+from aioprometheus.collectors import Registry
+
+
+LOG = logging.getLogger(__name__)
+
+
+class StatsDevice(Protocol):
+    mac_address: str
+    prom_labels: Dict[str, str]
+    stats: Any
+
+
+class Window:
+    """Running min/max/sum/count of every stats field over one tumbling window"""
+
+    __slots__ = ("length", "start", "count", "mins", "maxs", "totals", "last", "labels")
+
+    def __init__(self, length: float, field_count: int, labels: Dict[str, Any]) -> None:
+        self.length = length
+        self.start = 0.0
+        self.count = 0
+        self.mins = [0.0] * field_count
+        self.maxs = [0.0] * field_count
+        self.totals = [0.0] * field_count
+        self.last: Tuple[float, ...] = ()
+        # Prometheus labels for each aggregate
+        self.labels = labels
+
+
+class StatsAggregator:
+    """Downsample every field of a stats dataclass into windowed aggregates
+
+    Each sample is folded into every configured window in O(1) per field.
+    Windows are aligned to multiples of their length and when a sample lands
+    past the end of a window that window is exported as
+    `<prefix><field>_window{agg="min|max|mean|last|count", window="<length>s"}`
+    and restarted. So short spikes show up without shipping every sample."""
+
+    AGGREGATES = ("count", "last", "max", "mean", "min")
+
+    def __init__(
+        self,
+        stats_class: type,
+        stat_prefix: str,
+        registry: Registry,
+        windows: Sequence[float],
+    ) -> None:
+        self.field_names = [f.name for f in fields(stats_class)]
+        self.get_values = attrgetter(*self.field_names)
+        self.windows = sorted(windows)
+        self.device_windows: Dict[str, List[Window]] = {}
+        self.prom_stats = [
+            Gauge(
+                f"{stat_prefix}{field_name}_window",
+                f"{field_name} min/max/mean/last/count over windows",
+                registry=registry,
+            )
+            for field_name in self.field_names
+        ]
+
+    def _new_windows(self, device: StatsDevice) -> List[Window]:
+        device_windows = []
+        for length in self.windows:
+            labels = {
+                agg: {**device.prom_labels, "agg": agg, "window": f"{length:g}s"}
+                for agg in self.AGGREGATES
+            }
+            device_windows.append(Window(length, len(self.field_names), labels))
+        return device_windows
+
+    def publish(self, window: Window) -> None:
+        labels = window.labels
+        for idx, prom_metric in enumerate(self.prom_stats):
+            prom_metric.set(labels["count"], window.count)
+            prom_metric.set(labels["last"], window.last[idx])
+            prom_metric.set(labels["max"], window.maxs[idx])
+            prom_metric.set(labels["mean"], window.totals[idx] / window.count)
+            prom_metric.set(labels["min"], window.mins[idx])
+
+    def add_sample(
+        self, device: StatsDevice, timestamp: Optional[float] = None
+    ) -> None:
+        """stats_callbacks entry point - fold the device's latest stats in"""
+        if device.stats is None:
+            return
+
+        timestamp = timestamp or time()
+        device_windows = self.device_windows.get(device.mac_address)
+        if device_windows is None:
+            device_windows = self._new_windows(device)
+            self.device_windows[device.mac_address] = device_windows
+
+        values = self.get_values(device.stats)
+        for window in device_windows:
+            if timestamp >= window.start + window.length:
+                if window.count:
+                    self.publish(window)
+                window.start = timestamp - (timestamp % window.length)
+                window.count = 0
+                window.mins[:] = values
+                window.maxs[:] = values
+                window.totals[:] = values
+            else:
+                mins = window.mins
+                maxs = window.maxs
+                totals = window.totals
+                for idx, value in enumerate(values):
+                    if value < mins[idx]:
+                        mins[idx] = value
+                    elif value > maxs[idx]:
+                        maxs[idx] = value
+                    totals[idx] += value
+            window.count += 1
+            window.last = values
@@ -0,0 +1,381 @@
+import asyncio
+import json
+import logging
+from time import time
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple, Union
+
+import aiohttp
+from aioprometheus import Counter, Gauge
+from aioprometheus.collectors import Registry
+
+from vand.aggregates import StatsDevice
+from vand.registry import per_registry
+
+
+LOG = logging.getLogger(__name__)
+Alert = Dict[str, Any]
+# Module name -> its stats dataclass - registered as each module is imported
+STATS_CLASSES: Dict[str, type] = {}
+
+
+class AlertDevice(StatsDevice, Protocol):
+    dev_name: str
+
+
+class AlertSinkError(Exception):
+    pass
+
+
+class AlertRule:
+    """A threshold on one stats field - or on its per second rate of change
+
+    Fires once the value goes above `above` / below `below` and only resolves
+    once it's back past the threshold by `hysteresis`, so a value hovering
+    around it doesn't flap. With rate_window the rate of change over (at
+    least) that many seconds is checked instead. `changes` alerts on every
+    change of the value instead - e.g. fault_code."""
+
+    def __init__(
+        self,
+        name: str,
+        field: str,
+        module: Optional[str] = None,
+        devices: Optional[List[str]] = None,
+        above: Optional[float] = None,
+        below: Optional[float] = None,
+        hysteresis: float = 0.0,
+        rate_window: Optional[float] = None,
+        changes: bool = False,
+        severity: str = "warning",
+    ) -> None:
+        if above is None and below is None and not changes:
+            raise ValueError(f"Alert rule {name} needs above, below or changes")
+        self.name = name
+        self.field = field
+        # li3 / HS075S - None is every module with field
+        self.module = module
+        # dev_names or MAC addresses - None is every device
+        self.devices = set(devices) if devices else None
+        self.above = above
+        self.below = below
+        self.hysteresis = hysteresis
+        self.rate_window = rate_window
+        self.changes = changes
+        self.severity = severity
+
+    def check_field(self) -> None:
+        """Raise if field is in none of the stats classes the rule could match
+
+        Rules on modules that haven't registered a stats class can't be checked"""
+        if self.module is not None and self.module not in STATS_CLASSES:
+            return
+        stats_classes = (
+            [STATS_CLASSES[self.module]] if self.module else STATS_CLASSES.values()
+        )
+        field_names = {
+            name
+            for stats_class in stats_classes
+            for name in getattr(stats_class, "__dataclass_fields__", {})
+        }
+        if field_names and self.field not in field_names:
+            raise ValueError(
+                f"Alert rule {self.name} field {self.field} is not a "
+                + f"{self.module or 'module'} stats field - {sorted(field_names)}"
+            )
+
+    def applies_to(self, device: AlertDevice) -> bool:
+        return (
+            self.devices is None
+            or device.dev_name in self.devices
+            or device.mac_address in self.devices
+        )
+
+    def _active(self, firing: bool, value: float) -> bool:
+        if firing:
+            return (
+                self.above is not None and value >= self.above - self.hysteresis
+            ) or (self.below is not None and value <= self.below + self.hysteresis)
+        return (self.above is not None and value > self.above) or (
+            self.below is not None and value < self.below
+        )
+
+    def evaluate(
+        self, state: "RuleState", value: float, timestamp: float
+    ) -> Optional[str]:
+        """firing / resolved / changed if that just happened - O(1)"""
+        if self.changes:
+            previous, state.value = state.value, value
+            return "changed" if previous is not None and value != previous else None
+
+        if self.rate_window is not None:
+            if state.value is None:
+                state.value, state.timestamp = value, timestamp
+                return None
+            elapsed = timestamp - state.timestamp
+            if elapsed < self.rate_window:
+                return None
+            checked = (value - state.value) / elapsed
+            state.value, state.timestamp = value, timestamp
+        else:
+            checked = value
+
+        firing = self._active(state.firing, checked)
+        if firing == state.firing:
+            return None
+        state.firing = firing
+        return "firing" if firing else "resolved"
+
+
+class RuleState:
+    """One rule's state for one device"""
+
+    __slots__ = ("firing", "value", "timestamp")
+
+    def __init__(self) -> None:
+        self.firing = False
+        # Last value for changes / the rate's starting point
+        self.value: Optional[float] = None
+        self.timestamp = 0.0
+
+
+class LogSink:
+    def __init__(self, timeout: float = 1.0) -> None:
+        self.timeout = timeout
+
+    async def send(self, alert: Alert) -> None:
+        LOG.warning(
+            f"Alert {alert['rule']} {alert['state']}: {alert['dev_name']} "
+            + f"{alert['field']} is {alert['value']}"
+        )
+
+    async def close(self) -> None:
+        pass
+
+
+class WebhookSink:
+    """POST each alert as JSON to url"""
+
+    def __init__(
+        self, url: str, timeout: float = 5.0, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def send(self, alert: Alert) -> None:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(headers=self.headers)
+        async with self.session.post(self.url, json=alert) as resp:
+            resp.raise_for_status()
+
+    async def close(self) -> None:
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+
+class CommandSink:
+    """Run command with the alert's JSON on stdin - e.g. sound a buzzer or send an SMS"""
+
+    def __init__(self, command: List[str], timeout: float = 10.0) -> None:
+        self.command = command
+        self.timeout = timeout
+
+    async def send(self, alert: Alert) -> None:
+        process = await asyncio.create_subprocess_exec(
+            *self.command, stdin=asyncio.subprocess.PIPE
+        )
+        try:
+            await process.communicate(json.dumps(alert).encode())
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        if process.returncode:
+            raise AlertSinkError(f"{self.command[0]} exited {process.returncode}")
+
+    async def close(self) -> None:
+        pass
+
+
+AlertSink = Union[CommandSink, LogSink, WebhookSink]
+SINK_TYPES: Dict[str, Callable[..., AlertSink]] = {
+    "command": CommandSink,
+    "log": LogSink,
+    "webhook": WebhookSink,
+}
+
+
+class AlertEngine:
+    """Evaluate alert rules as each sample arrives - use alert_engine()
+
+    Rules are matched to each stats class once, so a sample only costs its
+    rules' O(1) checks. Alerts are queued for run() to hand to every sink,
+    so a slow webhook can never block BLE handling. A full queue drops new
+    alerts (counted) rather than grow."""
+
+    def __init__(self, registry: Registry) -> None:
+        self.rules: List[AlertRule] = []
+        self.sinks: Dict[str, AlertSink] = {}
+        self.queue: "asyncio.Queue[Alert]" = asyncio.Queue(256)
+        self.states: Dict[Tuple[str, str], RuleState] = {}
+        # (module, stats class) -> the rules for its fields
+        self._compiled: Dict[Tuple[str, type], List[AlertRule]] = {}
+
+        self.prom_stats: Dict[str, Union[Counter, Gauge]] = {
+            "alerts": Counter(
+                "vand_alerts_total",
+                "Alerts raised by rule and state (firing, resolved or changed)",
+                registry=registry,
+            ),
+            "dropped": Counter(
+                "vand_alerts_dropped_total",
+                "Alerts dropped as the sink queue was full",
+                registry=registry,
+            ),
+            "firing": Gauge(
+                "vand_alert_firing",
+                "1 while the rule is firing for the device",
+                registry=registry,
+            ),
+            "sink_failures": Counter(
+                "vand_alert_sink_failures_total",
+                "Alerts a sink failed to send",
+                registry=registry,
+            ),
+        }
+
+    def configure(
+        self,
+        rules: Dict[str, Dict[str, Any]],
+        sinks: Optional[Dict[str, Dict[str, Any]]] = None,
+        max_queue: int = 256,
+    ) -> None:
+        """Compile the alerts config section - call before modules add callbacks"""
+        self.rules = [AlertRule(name, **rule) for name, rule in rules.items()]
+        for rule in self.rules:
+            rule.check_field()
+        self.sinks = {}
+        for name, settings in (sinks or {"log": {"type": "log"}}).items():
+            settings = dict(settings)
+            self.sinks[name] = SINK_TYPES[settings.pop("type")](**settings)
+        self.queue = asyncio.Queue(max_queue)
+        self._compiled.clear()
+        LOG.info(f"Loaded {len(self.rules)} alert rules for {', '.join(self.sinks)}")
+
+    def _rules_for(self, module: str, stats_class: type) -> List[AlertRule]:
+        key = (module, stats_class)
+        if key not in self._compiled:
+            self._compiled[key] = [
+                rule
+                for rule in self.rules
+                if rule.module in (None, module)
+                and rule.field in getattr(stats_class, "__dataclass_fields__", {})
+            ]
+        return self._compiled[key]
+
+    def add_sample(
+        self, module: str, device: AlertDevice, timestamp: Optional[float] = None
+    ) -> None:
+        stats = device.stats
+        if stats is None:
+            return
+        rules = self._rules_for(module, type(stats))
+        if not rules:
+            return
+        timestamp = time() if timestamp is None else timestamp
+        for rule in rules:
+            if not rule.applies_to(device):
+                continue
+            key = (rule.name, device.mac_address)
+            state = self.states.get(key)
+            if state is None:
+                state = self.states[key] = RuleState()
+            value = getattr(stats, rule.field)
+            alert_state = rule.evaluate(state, value, timestamp)
+            if alert_state:
+                self._raise(rule, alert_state, module, device, value, timestamp)
+
+    def _raise(
+        self,
+        rule: AlertRule,
+        alert_state: str,
+        module: str,
+        device: AlertDevice,
+        value: float,
+        timestamp: float,
+    ) -> None:
+        self.prom_stats["alerts"].inc({"rule": rule.name, "state": alert_state})
+        if alert_state != "changed":
+            self.prom_stats["firing"].set(
+                {**device.prom_labels, "rule": rule.name},
+                int(alert_state == "firing"),
+            )
+        alert = {
+            "rule": rule.name,
+            "state": alert_state,
+            "severity": rule.severity,
+            "module": module,
+            "dev_name": device.dev_name,
+            "mac_address": device.mac_address,
+            "field": rule.field,
+            "value": value,
+            "timestamp": timestamp,
+        }
+        try:
+            self.queue.put_nowait(alert)
+        except asyncio.QueueFull:
+            self.prom_stats["dropped"].inc({})
+
+    def remove(self, mac_address: str) -> None:
+        """Forget a device's rule states - it fires afresh if it returns"""
+        for key in [key for key in self.states if key[1] == mac_address]:
+            del self.states[key]
+
+    def sample_callback(self, module: str) -> Callable[[AlertDevice], None]:
+        """A stats_callbacks entry for a module's devices"""
+
+        def _add_sample(device: AlertDevice) -> None:
+            self.add_sample(module, device)
+
+        return _add_sample
+
+    async def _send(self, name: str, sink: AlertSink, alert: Alert) -> None:
+        try:
+            await asyncio.wait_for(sink.send(alert), sink.timeout)
+        except (
+            AlertSinkError,
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+            OSError,
+        ) as e:
+            LOG.error(f"Failed to send alert {alert['rule']} to {name}: {e}")
+            self.prom_stats["sink_failures"].inc({"sink": name})
+
+    async def run(self) -> None:
+        """Hand queued alerts to every sink"""
+        try:
+            while True:
+                alert = await self.queue.get()
+                await asyncio.gather(
+                    *(
+                        self._send(name, sink, alert)
+                        for name, sink in self.sinks.items()
+                    )
+                )
+                self.queue.task_done()
+        finally:
+            for sink in self.sinks.values():
+                await sink.close()
+
+
+def register_stats_class(module: str, stats_class: type) -> None:
+    """Let alert rules on module's stats fields be checked when configured"""
+    STATS_CLASSES[module] = stats_class
+
+
+@per_registry
+def alert_engine(registry: Registry) -> AlertEngine:
+    """The AlertEngine for registry - created on first use"""
+    return AlertEngine(registry)
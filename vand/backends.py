@@ -0,0 +1,242 @@
+import asyncio
+import logging
+from array import array
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from bleak import BleakClient, BleakScanner
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+from bleak.exc import BleakError
+from bleson import BDAddress, get_provider, Observer, UUID16
+from bleson.core.types import Advertisement
+
+from vand.adapters import DEFAULT_ADAPTER, details_adapter
+
+LOG = logging.getLogger(__name__)
+_backend: Optional["BleBackend"] = None
+
+
+class BleBackend:
+    """Real radios - bleak for GATT + discovery and bleson for advertisements
+
+    Modules get their BLE objects from get_backend() so the daemon can be
+    pointed at the fakes below (or have the real radios recorded)."""
+
+    name = "ble"
+
+    def observer(self, adapter_id: int = 0) -> Any:
+        """bleson style Observer with start() / stop() / on_advertising_data"""
+        return Observer(get_provider().get_adapter(adapter_id))
+
+    def scanner(
+        self,
+        detection_callback: Callable[[BLEDevice, AdvertisementData], None],
+        service_uuids: List[str],
+        adapter: str = DEFAULT_ADAPTER,
+    ) -> Any:
+        """Async context manager scanning for bleak devices on adapter"""
+        return BleakScanner(
+            detection_callback, service_uuids=service_uuids, bluez={"adapter": adapter}
+        )
+
+    def client(
+        self, device: BLEDevice, timeout: float, services: Optional[List[str]] = None
+    ) -> Any:
+        """services limits GATT discovery to just those service UUIDs"""
+        return BleakClient(device, timeout=timeout, services=services)
+
+
+class FakeObserver:
+    def __init__(self) -> None:
+        self.on_advertising_data: Optional[Callable[[Any], None]] = None
+        self.scanning = False
+
+    def start(self) -> None:
+        self.scanning = True
+
+    def stop(self) -> None:
+        self.scanning = False
+
+
+class FakeScanner:
+    def __init__(
+        self,
+        backend: "FakeBackend",
+        detection_callback: Callable[[BLEDevice, AdvertisementData], None],
+        adapter: str = DEFAULT_ADAPTER,
+    ) -> None:
+        self.backend = backend
+        self.detection_callback = detection_callback
+        self.adapter = adapter
+
+    async def __aenter__(self) -> "FakeScanner":
+        self.backend.scanners.append(self)
+        for mac_address in self.backend.gatt_devices:
+            self.backend.detect(mac_address)
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.backend.scanners.remove(self)
+
+
+class FakeClient:
+    # Handle of every fake device's one characteristic
+    HANDLE = 14
+
+    def __init__(self, backend: "FakeBackend", device: BLEDevice) -> None:
+        self.backend = backend
+        self.mac_address = device.address
+        # Which adapter's BlueZ device object we were handed
+        self.adapter = details_adapter(device.details)
+        self.is_connected = False
+        self.notify_callback: Optional[Callable[[Any, bytearray], None]] = None
+        service_uuid, characteristic = backend.gatt_devices.get(
+            self.mac_address, ("", "")
+        )
+        self.services = [
+            SimpleNamespace(
+                uuid=service_uuid,
+                characteristics=[
+                    SimpleNamespace(uuid=characteristic, handle=self.HANDLE)
+                ],
+            )
+        ]
+
+    async def connect(self) -> None:
+        if self.mac_address not in self.backend.gatt_devices:
+            raise BleakError(f"Device with address {self.mac_address} was not found")
+        self.is_connected = True
+        self.backend.clients[self.mac_address] = self
+
+    async def disconnect(self) -> None:
+        self.is_connected = False
+        self.notify_callback = None
+        self.backend.clients.pop(self.mac_address, None)
+
+    async def start_notify(
+        self,
+        characteristic: Union[int, str],
+        callback: Callable[[Any, bytearray], None],
+    ) -> None:
+        if characteristic not in (
+            self.HANDLE,
+            self.services[0].characteristics[0].uuid,
+        ):
+            raise BleakError(f"Characteristic {characteristic} was not found!")
+        self.notify_callback = callback
+
+    async def stop_notify(self, characteristic: str) -> None:
+        self.notify_callback = None
+
+
+class FakeBackend(BleBackend):
+    """In process fake radios - inject advertisements and notifications
+
+    Every injection measures how long until the daemon has handled it:
+    notifications are handled synchronously and advertisements are handed to
+    the event loop, so we time a callback queued straight behind them."""
+
+    name = "fake"
+    H5075_UPDATE_UUID16 = UUID16(0xEC88)
+
+    def __init__(self) -> None:
+        self.observers: List[FakeObserver] = []
+        self.scanners: List[FakeScanner] = []
+        self.clients: Dict[str, FakeClient] = {}
+        # MAC -> (service_uuid, characteristic) that can be connected to
+        self.gatt_devices: Dict[str, Tuple[str, str]] = {}
+        self.injected = 0
+        self.dropped = 0
+        self.latencies = array("d")
+
+    def observer(self, adapter_id: int = 0) -> FakeObserver:
+        observer = FakeObserver()
+        self.observers.append(observer)
+        return observer
+
+    def scanner(
+        self,
+        detection_callback: Callable[[BLEDevice, AdvertisementData], None],
+        service_uuids: List[str],
+        adapter: str = DEFAULT_ADAPTER,
+    ) -> FakeScanner:
+        return FakeScanner(self, detection_callback, adapter)
+
+    def client(
+        self, device: BLEDevice, timeout: float, services: Optional[List[str]] = None
+    ) -> FakeClient:
+        return FakeClient(self, device)
+
+    def add_gatt_devices(self, devices: Sequence[Tuple[str, str, str]]) -> None:
+        """Register (mac_address, service_uuid, characteristic) fake GATT devices"""
+        for mac_address, service_uuid, characteristic in devices:
+            self.gatt_devices[mac_address] = (service_uuid, characteristic)
+            self.detect(mac_address)
+
+    def detect(self, mac_address: str, rssi: int = -60) -> None:
+        """Every scanner sees the device - with BlueZ like details per adapter"""
+        advertisement_data = AdvertisementData(None, {}, {}, [], None, rssi, ())
+        for scanner in self.scanners:
+            path = f"/org/bluez/{scanner.adapter}/dev_" + mac_address.replace(":", "_")
+            device = BLEDevice(mac_address, "", {"path": path})
+            scanner.detection_callback(device, advertisement_data)
+
+    def _record_latency(self, inject_time: float) -> None:
+        self.latencies.append(perf_counter() - inject_time)
+
+    def advertise(self, mac_address: str, mfg_data: bytes, rssi: int = -60) -> None:
+        inject_time = perf_counter()
+        advertisement = Advertisement(address=BDAddress(mac_address), rssi=rssi)
+        advertisement.mfg_data = mfg_data
+        advertisement.uuid16s = [self.H5075_UPDATE_UUID16]
+        delivered = False
+        for observer in self.observers:
+            if observer.scanning and observer.on_advertising_data:
+                observer.on_advertising_data(advertisement)
+                delivered = True
+        self.injected += 1
+        if not delivered:
+            self.dropped += 1
+            return
+        asyncio.get_running_loop().call_soon(self._record_latency, inject_time)
+
+    def notify(self, mac_address: str, data: bytes) -> None:
+        inject_time = perf_counter()
+        self.injected += 1
+        client = self.clients.get(mac_address)
+        if client is None or client.notify_callback is None:
+            self.dropped += 1
+            return
+        client.notify_callback(mac_address, bytearray(data))
+        self._record_latency(inject_time)
+
+
+# 21.75C / 50.2% humidity / 100% battery
+FAKE_HS075S_MFG_DATA = bytes.fromhex("88ec0003519e6400")
+
+
+def fake_advertisement(
+    mac_address: str, mfg_data: bytes = FAKE_HS075S_MFG_DATA, rssi: int = -60
+) -> SimpleNamespace:
+    """A HS075S advertisement as handed to process_data() - for tests + benchmarks"""
+    return SimpleNamespace(
+        address=BDAddress(mac_address),
+        mfg_data=mfg_data,
+        rssi=rssi,
+        uuid16s=[FakeBackend.H5075_UPDATE_UUID16],
+    )
+
+
+def get_backend() -> BleBackend:
+    global _backend
+    if _backend is None:
+        _backend = BleBackend()
+    return _backend
+
+
+def set_backend(backend: BleBackend) -> None:
+    global _backend
+    LOG.info(f"Using the {backend.name} BLE backend")
+    _backend = backend
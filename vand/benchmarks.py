@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+
+import argparse
+import gc
+import json
+import logging
+import platform
+import sys
+import tracemalloc
+import weakref
+from itertools import count, cycle
+from pathlib import Path
+from time import monotonic
+from timeit import Timer
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from aioprometheus.collectors import Registry
+from aioprometheus.renderer import render
+
+from vand.alerts import alert_engine
+from vand.backends import fake_advertisement, FAKE_HS075S_MFG_DATA
+from vand.derived import DerivedMetrics
+from vand.exposition import CachedExposition
+from vand.govee import decode_batch, HS075S_DECODER, Hygrometers
+from vand.history import history_store
+from vand.li3 import RevelBatteries
+from vand.observer_worker import mac_bytes, ObserverProcess, SampleRing, SampleWriter
+from vand.replay import NOTIFICATION, synthetic_events
+
+
+LOG = logging.getLogger(__name__)
+BASELINE_PATH = Path(__file__).parent / "benchmarks_baseline.json"
+# Our vans have a few of each device - stress is a fleet / test bench
+DEVICE_COUNTS = {"realistic": 4, "stress": 256}
+DEFAULT_THRESHOLD = 0.25
+# Absolute slack so tiny memory numbers don't flap the gate
+PEAK_MEMORY_SLACK = 4096
+ALLOC_BLOCKS_SLACK = 1.0
+
+Operation = Callable[[], None]
+
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    devices: int
+    ops_per_sec: float
+    # tracemalloc peak above the starting point while running memory_ops
+    peak_memory_bytes: int
+    # Net allocated blocks per op - growth here is a leak or unbounded cache
+    alloc_blocks_per_op: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.devices}]"
+
+
+def _mac_address(prefix: str, dev: int) -> str:
+    return f"{prefix}:{dev >> 16 & 0xFF:02X}:{dev >> 8 & 0xFF:02X}:{dev & 0xFF:02X}"
+
+
+def _li3_batteries(devices: int, registry: Registry) -> RevelBatteries:
+    config = {
+        "li3": {
+            str(dev): {
+                "dev_name": f"Li3-{dev}",
+                "mac_address": _mac_address("64:69:4E", dev),
+                "service_uuid": "0000ffe0-0000-1000-8000-00805f9b34fb",
+                "characteristic": "0000ffe1-0000-1000-8000-00805f9b34fb",
+                "timeout": 5.0,
+            }
+            for dev in range(devices)
+        }
+    }
+    rb = RevelBatteries(config, registry)
+    # Give every battery stats to publish
+    for frame in _li3_frames(1):
+        for battery in rb.batteries:
+            battery._telementary_handler("bench", frame)
+    return rb
+
+
+def _hygrometers(devices: int, registry: Registry) -> Hygrometers:
+    config = {
+        str(dev): {
+            "dev_name": f"HS075S-{dev}",
+            "mac_address": _mac_address("A4:C1:38", dev),
+            "service_uuid": "0000ec88-0000-1000-8000-00805f9b34fb",
+            "characteristic": "",
+            "timeout": 5.0,
+        }
+        for dev in range(devices)
+    }
+    h = Hygrometers(config, registry)
+    for hygrometer in h.hygrometers:
+        hygrometer.process_data(fake_advertisement(hygrometer.mac_address))
+    return h
+
+
+def _li3_frames(ticks: int) -> List[bytes]:
+    return [
+        e.payload
+        for e in synthetic_events(["00:00:00:00:00:00"], [], ticks)
+        if e.kind == NOTIFICATION
+    ]
+
+
+def bench_li3_notifications(devices: int) -> Operation:
+    """One Li3 frame (3 notifications) through the handler + event mode gauges"""
+    rb = _li3_batteries(devices, Registry())
+    for battery in rb.batteries:
+        battery.stats_callbacks.append(rb.update_prom_stats)
+    handlers = cycle([b._telementary_handler for b in rb.batteries])
+    frames = cycle(_li3_frames(60))
+
+    def op() -> None:
+        handler = next(handlers)
+        handler("bench", next(frames))
+        handler("bench", next(frames))
+        handler("bench", next(frames))
+
+    return op
+
+
+def bench_hs075s_advertisements(devices: int) -> Operation:
+    """One HS075S advertisement through process_data + event mode gauges"""
+    h = _hygrometers(devices, Registry())
+    for hygrometer in h.hygrometers:
+        hygrometer.stats_callbacks.append(h.update_prom_stats)
+    advertisements = [
+        (hygrometer.process_data, fake_advertisement(hygrometer.mac_address, e.payload))
+        for e in synthetic_events([], ["00:00:00:00:00:00"], 60)
+        for hygrometer in h.hygrometers
+    ]
+    advertisement_cycle = cycle(advertisements)
+
+    def op() -> None:
+        process_data, advertisement = next(advertisement_cycle)
+        process_data(advertisement)
+
+    return op
+
+
+def bench_observer_ring(devices: int) -> Operation:
+    """A new reading per HS075S written by the observer worker + drained by us"""
+    h = _hygrometers(devices, Registry())
+    process = ObserverProcess(
+        h.scanner.sample_handlers,
+        lambda received: None,
+        "vand.govee:HS075S_DECODER",
+        0xEC88,
+    )
+    ring = process.ring = SampleRing.create(devices, process.record)
+    writer = SampleWriter(ring, HS075S_DECODER, 0xEC88)
+    macs = [mac_bytes(hygrometer.mac_address) for hygrometer in h.hygrometers]
+    writer.allowed = frozenset(macs)
+    payloads = cycle(
+        [e.payload for e in synthetic_events([], ["00:00:00:00:00:00"], 60)]
+    )
+
+    def op() -> None:
+        # The worker's side then ours
+        payload = next(payloads)
+        for mac in macs:
+            writer.write(mac, -60, [0xEC88], payload, monotonic())
+        process.drain()
+
+    weakref.finalize(op, ring.close, True)
+    return op
+
+
+def bench_hs075s_duplicate_advertisements(devices: int) -> Operation:
+    """One repeated HS075S advertisement - what Govee sensors mostly send"""
+    h = _hygrometers(devices, Registry())
+    for hygrometer in h.hygrometers:
+        hygrometer.stats_callbacks.append(h.update_prom_stats)
+    advertisements = cycle(
+        [
+            (hygrometer.process_data, fake_advertisement(hygrometer.mac_address))
+            for hygrometer in h.hygrometers
+        ]
+    )
+
+    def op() -> None:
+        process_data, advertisement = next(advertisements)
+        process_data(advertisement)
+
+    return op
+
+
+def bench_hs075s_batch_decode(devices: int) -> Operation:
+    """decode_batch() of 1000 captured advertisements"""
+    payloads = b"".join(
+        e.payload for e in synthetic_events([], ["00:00:00:00:00:00"], 1000)
+    )
+
+    def op() -> None:
+        decode_batch(payloads)
+
+    return op
+
+
+def bench_hs075s_decode(devices: int) -> Operation:
+    """Decode one HS075S advertisement's manufacturer data with HS075S_DECODER"""
+    decode = HS075S_DECODER.decode
+
+    def op() -> None:
+        decode(FAKE_HS075S_MFG_DATA, -60)
+
+    return op
+
+
+def bench_li3_stats_refresh(devices: int) -> Operation:
+    """One poll mode stats_refresh pass over every battery"""
+    return _li3_batteries(devices, Registry()).refresh_prom_stats
+
+
+def bench_hs075s_stats_refresh(devices: int) -> Operation:
+    """One poll mode stats_refresh pass over every hygrometer"""
+    return _hygrometers(devices, Registry()).refresh_prom_stats
+
+
+def bench_alert_rules(devices: int) -> Operation:
+    """One Li3 sample through threshold, rate + change alert rules - none firing"""
+    registry = Registry()
+    engine = alert_engine(registry)
+    engine.configure(
+        {
+            "cell_low": {"field": "cell_1_voltage", "below": 2.9, "hysteresis": 0.1},
+            "fault": {"field": "fault_code", "changes": True},
+            "hot": {"field": "battery_temperature", "above": 60.0},
+            "soc_falling": {"field": "battery_soc", "below": -1.0, "rate_window": 60},
+        }
+    )
+    batteries = cycle(_li3_batteries(devices, registry).batteries)
+    timestamps = count(1.0, 1.0 / devices)
+
+    def op() -> None:
+        engine.add_sample("li3", next(batteries), next(timestamps))
+
+    return op
+
+
+def bench_derived_metrics(devices: int) -> Operation:
+    """One Li3 sample into the energy counters, imbalance + smoothed current"""
+    registry = Registry()
+    derived = DerivedMetrics(registry, "li3_", capacity_ah=100.0)
+    batteries = cycle(_li3_batteries(devices, registry).batteries)
+    timestamps = count(1.0, 1.0 / devices)
+
+    def op() -> None:
+        derived.add_sample(next(batteries), next(timestamps))
+
+    return op
+
+
+def bench_history_ingest(devices: int) -> Operation:
+    """One Li3 sample's 10 fields into the in memory history - never allocates"""
+    registry = Registry()
+    history_store(registry).configure(capacity=60, max_memory=1 << 30)
+    batteries = cycle(_li3_batteries(devices, registry).batteries)
+    add_sample = history_store(registry).add_sample
+
+    def op() -> None:
+        add_sample(next(batteries))
+
+    return op
+
+
+def bench_exposition(devices: int) -> Operation:
+    """Render the shared registry as Prometheus text - i.e. one scrape"""
+    registry = Registry()
+    _li3_batteries(devices, registry).refresh_prom_stats()
+    _hygrometers(devices, registry).refresh_prom_stats()
+
+    def op() -> None:
+        render(registry, [])
+
+    return op
+
+
+def bench_exposition_cached(devices: int) -> Operation:
+    """A scrape of the cached exposition after one battery's voltage changed"""
+    registry = Registry()
+    rb = _li3_batteries(devices, registry)
+    rb.refresh_prom_stats()
+    _hygrometers(devices, registry).refresh_prom_stats()
+    exposition = CachedExposition(registry, coalesce_interval=0)
+    exposition.refresh()
+    voltage = rb.prom_stats["battery_voltage"]
+    labels = cycle([b.prom_labels for b in rb.batteries])
+    # Odd length so every battery's value changes on each pass
+    values = cycle([13.09, 13.1, 13.11])
+
+    def op() -> None:
+        voltage.set(next(labels), next(values))
+        exposition.refresh()
+        exposition.gzip_body
+
+    return op
+
+
+# name -> (setup returning the op to time, device counts to run at)
+BENCHMARKS: Dict[str, Tuple[Callable[[int], Operation], Sequence[int]]] = {
+    "alert_rules": (bench_alert_rules, tuple(DEVICE_COUNTS.values())),
+    "derived_metrics": (bench_derived_metrics, tuple(DEVICE_COUNTS.values())),
+    "exposition": (bench_exposition, tuple(DEVICE_COUNTS.values())),
+    "exposition_cached": (bench_exposition_cached, tuple(DEVICE_COUNTS.values())),
+    "hs075s_advertisements": (
+        bench_hs075s_advertisements,
+        tuple(DEVICE_COUNTS.values()),
+    ),
+    "hs075s_batch_decode": (bench_hs075s_batch_decode, (1,)),
+    "hs075s_decode": (bench_hs075s_decode, (1,)),
+    "hs075s_duplicate_advertisements": (
+        bench_hs075s_duplicate_advertisements,
+        tuple(DEVICE_COUNTS.values()),
+    ),
+    "hs075s_stats_refresh": (bench_hs075s_stats_refresh, tuple(DEVICE_COUNTS.values())),
+    "history_ingest": (bench_history_ingest, tuple(DEVICE_COUNTS.values())),
+    "li3_notifications": (bench_li3_notifications, tuple(DEVICE_COUNTS.values())),
+    "li3_stats_refresh": (bench_li3_stats_refresh, tuple(DEVICE_COUNTS.values())),
+    "observer_ring": (bench_observer_ring, tuple(DEVICE_COUNTS.values())),
+}
+
+
+def measure(
+    name: str,
+    devices: int,
+    op: Operation,
+    number: Optional[int] = None,
+    repeat: int = 5,
+    memory_ops: int = 100,
+) -> BenchmarkResult:
+    """Best of repeat timings (number calibrated to ~0.2s if not set) + memory"""
+    timer = Timer(op)
+    if number is None:
+        number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+
+    # Memory separately as tracemalloc slows everything down
+    op()
+    # Timer disables gc - only count blocks op leaves behind, not garbage
+    gc.collect()
+    tracemalloc.start()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    start_blocks = sys.getallocatedblocks()
+    # Don't spend longer tracing than timing slow ops
+    memory_ops = min(memory_ops, number)
+    for _ in range(memory_ops):
+        op()
+    gc.collect()
+    alloc_blocks = sys.getallocatedblocks() - start_blocks
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return BenchmarkResult(
+        name,
+        devices,
+        number / best,
+        peak_memory - start_memory,
+        alloc_blocks / memory_ops,
+    )
+
+
+def run_benchmarks(
+    names: Optional[Sequence[str]] = None,
+    number: Optional[int] = None,
+    repeat: int = 5,
+    memory_ops: int = 100,
+) -> List[BenchmarkResult]:
+    results = []
+    # Time the code not per device INFO logging (bleson sets the root logger to INFO)
+    logging.disable(logging.INFO)
+    try:
+        for name, (setup, device_counts) in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            for devices in device_counts:
+                results.append(
+                    measure(name, devices, setup(devices), number, repeat, memory_ops)
+                )
+    finally:
+        logging.disable(logging.NOTSET)
+    return results
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    with path.open("rb") as bfp:
+        return dict(json.load(bfp))
+
+
+def save_baseline(
+    results: Sequence[BenchmarkResult], path: Path = BASELINE_PATH
+) -> None:
+    baseline = {
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "results": {
+            r.key: {**r._asdict(), "ops_per_sec": round(r.ops_per_sec, 1)}
+            for r in results
+        },
+    }
+    with path.open("w") as bfp:
+        json.dump(baseline, bfp, indent=2, sort_keys=True)
+        bfp.write("\n")
+
+
+def find_regressions(
+    results: Sequence[BenchmarkResult],
+    baseline: Dict[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[str]:
+    """Describe every result that's regressed more than threshold vs. baseline"""
+    if baseline.get("machine") != platform.machine():
+        LOG.warning(
+            f"Benchmark baseline is from {baseline.get('machine')} not "
+            + f"{platform.machine()} - update it on this box for a fair comparison"
+        )
+
+    regressions = []
+    baseline_results = baseline.get("results", {})
+    for result in results:
+        base = baseline_results.get(result.key)
+        if not base:
+            LOG.info(f"{result.key} has no baseline")
+            continue
+
+        if result.ops_per_sec < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{result.key}: {result.ops_per_sec:,.0f} ops/s vs. "
+                + f"{base['ops_per_sec']:,.0f} baseline"
+            )
+        peak_memory_limit = base["peak_memory_bytes"] * (1 + threshold)
+        if result.peak_memory_bytes > peak_memory_limit + PEAK_MEMORY_SLACK:
+            regressions.append(
+                f"{result.key}: {result.peak_memory_bytes:,} bytes peak memory vs. "
+                + f"{base['peak_memory_bytes']:,} baseline"
+            )
+        alloc_blocks_limit = base["alloc_blocks_per_op"] * (1 + threshold)
+        if result.alloc_blocks_per_op > alloc_blocks_limit + ALLOC_BLOCKS_SLACK:
+            regressions.append(
+                f"{result.key}: {result.alloc_blocks_per_op:.2f} blocks allocated per "
+                + f"op vs. {base['alloc_blocks_per_op']:.2f} baseline"
+            )
+    return regressions
+
+
+def main() -> int:
+    cli = argparse.ArgumentParser(
+        description="Benchmark vanD's hot paths and gate regressions vs. a baseline"
+    )
+    cli.add_argument("-b", "--baseline", type=Path, default=BASELINE_PATH)
+    cli.add_argument("-c", "--check", action="store_true", help="Exit 1 on regression")
+    cli.add_argument("-n", "--number", type=int, help="Ops per timing run")
+    cli.add_argument("-r", "--repeat", type=int, default=5)
+    cli.add_argument("-t", "--threshold", type=float, default=DEFAULT_THRESHOLD)
+    cli.add_argument("-u", "--update-baseline", action="store_true")
+    cli.add_argument("names", nargs="*", help=f"Benchmarks: {', '.join(BENCHMARKS)}")
+    args = cli.parse_args()
+
+    results = run_benchmarks(args.names, args.number, args.repeat)
+    for result in results:
+        print(
+            f"{result.key:>36}: {result.ops_per_sec:>12,.0f} ops/s "
+            + f"{result.peak_memory_bytes:>9,} bytes peak "
+            + f"{result.alloc_blocks_per_op:>6.2f} blocks/op"
+        )
+
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Wrote baseline to {args.baseline}")
+        return 0
+
+    if args.check:
+        regressions = find_regressions(
+            results, load_baseline(args.baseline), args.threshold
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
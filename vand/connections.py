@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import random
+from time import time
+from typing import Any, Dict, Protocol, Union
+
+from aioprometheus import Counter, Gauge
+from aioprometheus.collectors import Registry
+from bleak.exc import BleakError
+
+
+LOG = logging.getLogger(__name__)
+
+
+class GattDevice(Protocol):
+    dev_name: str
+    prom_labels: Dict[str, str]
+    # time() of the last notification received
+    last_notification: float
+    # Set by discovery when the device is seen advertising
+    seen: asyncio.Event
+
+    async def connect(self) -> Any:
+        """Connect and start notifying - returns a BleakClient"""
+
+    async def disconnect(self, client: Any) -> None:
+        """Stop notifying and disconnect"""
+
+
+class ConnectionManager:
+    """Supervise a BLE GATT session per device
+
+    Each device gets a supervise() task that connects, watches the session and
+    reconnects with capped exponential backoff + jitter when it drops, fails
+    or goes silent (no notifications for inactivity_timeout). Connects only
+    start once discovery has seen the device, so a failed device waits to be
+    seen advertising again rather than blindly retrying. BlueZ handles
+    parallel connects badly so connect attempts share a semaphore. Failures
+    never propagate, so one bad battery can't take the daemon down."""
+
+    def __init__(
+        self,
+        registry: Registry,
+        stat_prefix: str,
+        max_concurrent_connects: int = 1,
+        min_backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        inactivity_timeout: float = 60.0,
+        check_interval: float = 1.0,
+    ) -> None:
+        self.connect_semaphore = asyncio.Semaphore(max_concurrent_connects)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.inactivity_timeout = inactivity_timeout
+        self.check_interval = check_interval
+
+        self.prom_stats: Dict[str, Union[Counter, Gauge]] = {
+            "connect_failures": Counter(
+                f"{stat_prefix}connect_failures_total",
+                "BLE connect attempts that failed",
+                registry=registry,
+            ),
+            "connect_latency": Gauge(
+                f"{stat_prefix}connect_latency_seconds",
+                "Time the last successful BLE connect + notify start took",
+                registry=registry,
+            ),
+            "connected": Gauge(
+                f"{stat_prefix}connected",
+                "1 if we have a BLE session to the device",
+                registry=registry,
+            ),
+            "connection_uptime": Gauge(
+                f"{stat_prefix}connection_uptime_seconds",
+                "How long the current BLE session has been up",
+                registry=registry,
+            ),
+            "connects": Counter(
+                f"{stat_prefix}connects_total",
+                "Successful BLE connects",
+                registry=registry,
+            ),
+        }
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.min_backoff * (2**attempt)))
+
+    async def _watch(self, device: GattDevice, client: Any) -> None:
+        """Return once the session drops or goes silent"""
+        connected_time = time()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            now = time()
+            self.prom_stats["connection_uptime"].set(
+                device.prom_labels, now - connected_time
+            )
+            if not client.is_connected:
+                LOG.warning(f"{device.dev_name} disconnected")
+                return
+            if now - device.last_notification > self.inactivity_timeout:
+                LOG.warning(
+                    f"{device.dev_name} has not notified for "
+                    + f"{self.inactivity_timeout}s - reconnecting"
+                )
+                return
+
+    async def supervise(self, device: GattDevice) -> None:
+        attempt = 0
+        while True:
+            await device.seen.wait()
+            try:
+                async with self.connect_semaphore:
+                    LOG.info(f"Connecting to {device.dev_name}")
+                    connect_start_time = time()
+                    client = await device.connect()
+                self.prom_stats["connect_latency"].set(
+                    device.prom_labels, time() - connect_start_time
+                )
+                self.prom_stats["connects"].inc(device.prom_labels)
+                self.prom_stats["connected"].set(device.prom_labels, 1)
+                attempt = 0
+                try:
+                    await self._watch(device, client)
+                finally:
+                    self.prom_stats["connected"].set(device.prom_labels, 0)
+                    self.prom_stats["connection_uptime"].set(device.prom_labels, 0)
+                    try:
+                        await device.disconnect(client)
+                    except (BleakError, asyncio.TimeoutError, OSError) as e:
+                        LOG.debug(
+                            f"Failed to cleanly disconnect {device.dev_name}: {e}"
+                        )
+            except (BleakError, asyncio.TimeoutError, OSError) as e:
+                LOG.error(f"{device.dev_name} BLE session failed: {e}")
+                self.prom_stats["connect_failures"].inc(device.prom_labels)
+                device.seen.clear()
+
+            backoff = self.backoff(attempt)
+            attempt += 1
+            LOG.info(f"Reconnecting to {device.dev_name} in {backoff:.1f}s")
+            await asyncio.sleep(backoff)
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import logging
+from dataclasses import fields
+from operator import attrgetter
+from pathlib import Path
+from time import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+from aioprometheus import Gauge
+from aioprometheus.collectors import Registry
+
+from vand.aggregates import StatsDevice
+from vand.history import history_store
+from vand.registry import per_registry
+
+
+LOG = logging.getLogger(__name__)
+DASHBOARD_HTML_PATH = Path(__file__).parent / "dashboard.html"
+
+
+def _sse_event(event: str, data: Any) -> bytes:
+    data_json = json.dumps(data, separators=(",", ":"))
+    return f"event: {event}\ndata: {data_json}\n\n".encode()
+
+
+class Dashboard:
+    """On box web dashboard - device stats pushed to browsers over Server-Sent Events
+
+    Device stats callbacks only note the device as changed, so the sensor hot
+    path costs the same with no viewers or hundreds. Every push_interval the
+    changed devices are diffed against what was last sent, the changed fields
+    are encoded once as a delta event and that same bytes object is queued for
+    every viewer. A viewer too slow to keep up has its queue replaced with a
+    full snapshot rather than slowing everyone else down."""
+
+    def __init__(self, registry: Registry) -> None:
+        self.push_interval = 1.0
+        self.max_queue = 32
+        # Latest device with a new sample by MAC - filled by the stats callbacks
+        self.pending: Dict[str, Tuple[str, StatsDevice]] = {}
+        self.wake = asyncio.Event()
+        # What viewers have been sent by MAC
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self.viewers: Set["asyncio.Queue[bytes]"] = set()
+        self._getters: Dict[type, Tuple[List[str], Callable[[Any], Tuple]]] = {}
+        self.history_store = history_store(registry)
+
+        self.prom_stats = {
+            "viewers": Gauge(
+                "vand_dashboard_viewers",
+                "Browsers connected to the dashboard's live event stream",
+                registry=registry,
+            ),
+        }
+
+    def sample_callback(self, module: str) -> Callable[[StatsDevice], None]:
+        """A stats_callbacks entry for a module's devices"""
+
+        def _add_sample(device: StatsDevice) -> None:
+            self.pending[device.mac_address] = (module, device)
+            self.wake.set()
+
+        return _add_sample
+
+    def _field_getter(self, stats_class: type) -> Tuple[List[str], Callable]:
+        if stats_class not in self._getters:
+            field_names = [f.name for f in fields(stats_class)]
+            self._getters[stats_class] = (field_names, attrgetter(*field_names))
+        return self._getters[stats_class]
+
+    def remove(self, mac_address: str) -> None:
+        """Forget a device - viewers stop getting it from the next snapshot"""
+        self.pending.pop(mac_address, None)
+        self.state.pop(mac_address, None)
+
+    def snapshot(self) -> bytes:
+        return _sse_event("snapshot", self.state)
+
+    def collect_deltas(self, now: float) -> Dict[str, Dict[str, Any]]:
+        """Fold pending samples into state - returns only what changed"""
+        pending, self.pending = self.pending, {}
+        deltas: Dict[str, Dict[str, Any]] = {}
+        for mac_address, (module, device) in pending.items():
+            stats = device.stats
+            if stats is None:
+                continue
+            field_names, get_values = self._field_getter(type(stats))
+
+            delta: Dict[str, Any] = {}
+            device_state = self.state.get(mac_address)
+            if device_state is None:
+                device_state = self.state[mac_address] = {"module": module, "stats": {}}
+                delta["module"] = module
+            dev_name = device.prom_labels["dev_name"]
+            if device_state.get("dev_name") != dev_name:
+                device_state["dev_name"] = delta["dev_name"] = dev_name
+
+            values = get_values(stats)
+            previous = device_state["stats"]
+            changed = {
+                name: value
+                for name, value in zip(field_names, values)
+                if previous.get(name) != value
+            }
+            if changed:
+                previous.update(changed)
+                delta["stats"] = changed
+            if delta:
+                device_state["updated"] = delta["updated"] = now
+                deltas[mac_address] = delta
+        return deltas
+
+    def broadcast(self, message: bytes) -> None:
+        for viewer in self.viewers:
+            try:
+                viewer.put_nowait(message)
+            except asyncio.QueueFull:
+                LOG.debug("Dashboard viewer too slow - resyncing with a snapshot")
+                while not viewer.empty():
+                    viewer.get_nowait()
+                viewer.put_nowait(self.snapshot())
+
+    def history_json(
+        self, mac_address: Optional[str] = None, last: int = 300
+    ) -> Dict[str, Any]:
+        """{MAC: {"time": [...], <field>: [...]}} columns of the last samples kept
+        in the history store - a device's fields are all sampled together"""
+        history: Dict[str, Dict[str, List[float]]] = {}
+        for (mac, field_name), series in self.history_store.series.items():
+            if mac_address and mac != mac_address:
+                continue
+            timestamps, values = series.last(last)
+            columns = history.get(mac)
+            if columns is None:
+                columns = history[mac] = {"time": timestamps.tolist()}
+            columns[field_name] = values.tolist()
+        return history
+
+    async def _index(self, request: web.Request) -> web.FileResponse:
+        return web.FileResponse(DASHBOARD_HTML_PATH)
+
+    async def _state(self, request: web.Request) -> web.Response:
+        return web.json_response(self.state)
+
+    async def _history(self, request: web.Request) -> web.Response:
+        """Optional ?mac= + last=N samples per field (default 300)"""
+        try:
+            last = int(request.query.get("last", 300))
+        except ValueError as ve:
+            raise web.HTTPBadRequest(text=str(ve))
+        return web.json_response(self.history_json(request.query.get("mac"), last))
+
+    async def _query(self, request: web.Request) -> web.Response:
+        """?mac=&field= then last=N or start=&end= (+ step= to downsample)"""
+        query = request.query
+        series = self.history_store.get(query.get("mac", ""), query.get("field", ""))
+        if series is None:
+            raise web.HTTPNotFound(text="No history for that mac + field")
+        try:
+            if "last" in query:
+                timestamps, values = series.last(int(query["last"]))
+                return web.json_response(
+                    {"time": timestamps.tolist(), "value": values.tolist()}
+                )
+            start = float(query.get("start", 0))
+            end = float(query.get("end", time()))
+            if "step" not in query:
+                timestamps, values = series.between(start, end)
+                return web.json_response(
+                    {"time": timestamps.tolist(), "value": values.tolist()}
+                )
+            step = float(query["step"])
+            if step <= 0:
+                raise ValueError("step must be positive")
+        except ValueError as ve:
+            raise web.HTTPBadRequest(text=str(ve))
+        downsampled = series.downsample(start, end, step)
+        return web.json_response(
+            {
+                "time": downsampled.timestamps.tolist(),
+                "min": downsampled.mins.tolist(),
+                "max": downsampled.maxs.tolist(),
+                "mean": downsampled.means.tolist(),
+            }
+        )
+
+    async def _events(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        viewer: "asyncio.Queue[bytes]" = asyncio.Queue(self.max_queue)
+        viewer.put_nowait(self.snapshot())
+        self.viewers.add(viewer)
+        self.prom_stats["viewers"].set({}, len(self.viewers))
+        try:
+            while True:
+                message = await viewer.get()
+                if not message:
+                    break
+                await response.write(message)
+        except ConnectionResetError:
+            LOG.debug("Dashboard viewer went away")
+        finally:
+            self.viewers.discard(viewer)
+            self.prom_stats["viewers"].set({}, len(self.viewers))
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self._index)
+        app.router.add_get("/api/state", self._state)
+        app.router.add_get("/api/history", self._history)
+        app.router.add_get("/api/query", self._query)
+        app.router.add_get("/events", self._events)
+        return app
+
+    async def push(self) -> None:
+        """Send viewers what changed every push_interval"""
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            deltas = self.collect_deltas(time())
+            if deltas and self.viewers:
+                self.broadcast(_sse_event("delta", deltas))
+            # Coalesce bursts of samples into one delta
+            await asyncio.sleep(self.push_interval)
+
+    async def run(
+        self,
+        port: int,
+        push_interval: float = 1.0,
+        max_queue: int = 32,
+    ) -> None:
+        self.push_interval = push_interval
+        self.max_queue = max_queue
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        site = web.TCPSite(runner, port=port)
+        await site.start()
+        LOG.info(f"Serving the dashboard on port {port}")
+        try:
+            await self.push()
+        finally:
+            # End every event stream so the runner isn't waiting on them
+            for viewer in self.viewers:
+                while not viewer.empty():
+                    viewer.get_nowait()
+                viewer.put_nowait(b"")
+            await runner.cleanup()
+
+
+@per_registry
+def dashboard(registry: Registry) -> Dashboard:
+    """The Dashboard for registry - created on first use"""
+    return Dashboard(registry)
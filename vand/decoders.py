@@ -0,0 +1,222 @@
+import keyword
+import struct
+from array import array
+from dataclasses import fields, make_dataclass
+from typing import Any, Callable, Dict, Optional, Union
+
+from aioprometheus import Gauge
+from aioprometheus.collectors import Registry
+
+FRAME_FORMATS = ("csv", "struct")
+FIELD_TYPES = {"float": float, "hex": int, "int": int}
+# decode_batch() column array typecodes
+ARRAY_TYPECODES = {"float": "d", "hex": "q", "int": "q"}
+# Transform -> operator - applied in this order like the hand written decoders did
+TRANSFORMS = {"mask": "&", "modulo": "%", "divide": "/", "scale": "*", "offset": "+"}
+
+
+class FieldSpec:
+    """One decoded stats field - where it's read from + how it's scaled"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str = "",
+        column: Optional[int] = None,
+        index: Optional[int] = None,
+        argument: bool = False,
+        type: str = "float",
+        mask: Optional[int] = None,
+        modulo: Optional[int] = None,
+        divide: Optional[Union[int, float]] = None,
+        scale: Optional[Union[int, float]] = None,
+        offset: Optional[Union[int, float]] = None,
+        round: Optional[int] = None,
+        unit: str = "",
+        metric: Optional[str] = None,
+    ) -> None:
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise ValueError(f"{name!r} is not a valid field name")
+        if type not in FIELD_TYPES:
+            raise ValueError(f"{name} has unknown type {type} - {sorted(FIELD_TYPES)}")
+        self.name = name
+        self.help = help or name
+        # csv column / struct.Struct index / a decode() keyword argument
+        self.column = column
+        self.index = index
+        self.argument = argument
+        self.type = type
+        self.transforms = {
+            transform: value
+            for transform, value in zip(
+                TRANSFORMS, (mask, modulo, divide, scale, offset)
+            )
+            if value is not None
+        }
+        for transform, value in self.transforms.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError(f"{name} {transform} must be a number - not {value!r}")
+        self.round = None if round is None else int(round)
+        self.unit = unit
+        self.metric = metric or name
+
+    def expression(self, raw: str, text: bool) -> str:
+        """Python expression decoding raw - a csv column's bytes if text"""
+        if self.type == "hex":
+            expression = f"int({raw}, 16)"
+        elif text:
+            expression = f"{self.type}({raw})"
+        else:
+            expression = raw
+        for transform, value in self.transforms.items():
+            expression = f"({expression} {TRANSFORMS[transform]} {value!r})"
+        if self.round is not None:
+            expression = f"round({expression}, {self.round})"
+        return expression
+
+
+class FrameDecoder:
+    """A device's frame spec compiled to a decode() function + its gauges
+
+    A spec describes a csv (ASCII) frame by column or a binary frame by
+    struct layout, and each stats field's scaling, unit, metric name and
+    help. compile_decoder() generates decode() once at load time - one
+    split() or precomputed struct.Struct unpack then straight line scaling
+    expressions - so it's as fast as a hand written parser."""
+
+    def __init__(
+        self,
+        spec: Dict[str, Any],
+        stats_class: Optional[type] = None,
+    ) -> None:
+        self.name = spec["name"]
+        self.format = spec.get("format", "csv")
+        if self.format not in FRAME_FORMATS:
+            raise ValueError(f"{self.name} format must be one of {FRAME_FORMATS}")
+        self.fields = [FieldSpec(**field) for field in spec["fields"]]
+        self.separator = spec.get("separator", ",").encode()
+        self.struct = struct.Struct(spec["layout"]) if self.format == "struct" else None
+        self.columns = 1 + max(
+            (f.column for f in self.fields if f.column is not None), default=-1
+        )
+        self.arguments = [f.name for f in self.fields if f.argument]
+        self.stats_class = stats_class or make_dataclass(
+            self.name,
+            [(f.name, FIELD_TYPES[f.type]) for f in self.fields],
+            frozen=True,
+            slots=True,
+        )
+        class_fields = {f.name for f in fields(self.stats_class)}
+        if class_fields != {f.name for f in self.fields}:
+            raise ValueError(
+                f"{self.name} fields don't match {self.stats_class.__name__}'s "
+                + f"{sorted(class_fields)}"
+            )
+        self.decode: Callable[..., Any] = self._compile()
+        self._decode_batch: Optional[Callable[..., Dict[str, array]]] = None
+        # decode_batch() record size -> its padded struct's iter_unpack
+        self._batch_unpackers: Dict[int, Callable[..., Any]] = {}
+        if self.struct:
+            self._decode_batch = self._compile_batch()
+
+    def _raw(self, field: FieldSpec) -> str:
+        if field.argument:
+            return field.name
+        if self.format == "csv":
+            if field.column is None:
+                raise ValueError(f"{self.name} csv field {field.name} needs a column")
+            return f"column_{field.column}"
+        if field.index is None:
+            raise ValueError(f"{self.name} struct field {field.name} needs an index")
+        return f"values[{field.index}]"
+
+    def _compile(self) -> Callable[..., Any]:
+        if self.format == "csv":
+            # Unpacking into locals raises ValueError on the wrong column count
+            # for free + locals are cheaper than indexing a list
+            columns = "".join(f"column_{idx}, " for idx in range(self.columns))
+            lines = [f"    {columns}= data.split({self.separator!r})"]
+        else:
+            lines = ["    values = unpack_from(data)"]
+        text = self.format == "csv"
+        # Positional in the stats class' field order - cheaper than keywords
+        by_name = {f.name: f for f in self.fields}
+        lines.append("    return stats_class(")
+        for class_field in fields(self.stats_class):
+            field = by_name[class_field.name]
+            raw = self._raw(field)
+            lines.append(
+                f"        {field.expression(raw, text and not field.argument)},"
+            )
+        lines.append("    )")
+        arguments = "".join(f", {argument}" for argument in self.arguments)
+        source = f"def decode(data{arguments}):\n" + "\n".join(lines) + "\n"
+        namespace: Dict[str, Any] = {
+            "stats_class": self.stats_class,
+            "unpack_from": self.struct.unpack_from if self.struct else None,
+        }
+        exec(compile(source, f"<{self.name} decoder>", "exec"), namespace)
+        self.source = source
+        decode: Callable[..., Any] = namespace["decode"]
+        return decode
+
+    def _compile_batch(self) -> Callable[..., Dict[str, array]]:
+        assert self.struct is not None
+        # Transpose the records once (in C) then decode a column at a time
+        width = len(self.struct.unpack(bytes(self.struct.size)))
+        lines = [f"    columns = list(zip(*iter_unpack(data))) or [()] * {width}"]
+        lines.append("    return {")
+        for field in self.fields:
+            if field.argument:
+                continue
+            column = f"columns[{field.index}]"
+            expression = field.expression("v", False)
+            if expression != "v":
+                column = f"[{expression} for v in {column}]"
+            lines.append(
+                f"        {field.name!r}: array({ARRAY_TYPECODES[field.type]!r}, {column}),"
+            )
+        lines.append("    }")
+        source = "def decode_batch(data, iter_unpack):\n" + "\n".join(lines) + "\n"
+        namespace: Dict[str, Any] = {"array": array}
+        exec(compile(source, f"<{self.name} batch decoder>", "exec"), namespace)
+        self.batch_source = source
+        decode_batch: Callable[..., Dict[str, array]] = namespace["decode_batch"]
+        return decode_batch
+
+    def decode_batch(
+        self, data: Union[bytes, bytearray, memoryview], record_size: int = 0
+    ) -> Dict[str, array]:
+        """Decode back to back struct frames - an array column per field
+
+        record_size (default the layout's size) pads each record, e.g. for
+        captured payloads with trailing bytes. decode() arguments aren't in
+        the frames so they aren't columns."""
+        if self.struct is None or self._decode_batch is None:
+            raise ValueError(f"{self.name} batch decoding needs a struct format")
+        record_size = record_size or self.struct.size
+        iter_unpack = self._batch_unpackers.get(record_size)
+        if iter_unpack is None:
+            padding = record_size - self.struct.size
+            if padding < 0:
+                raise ValueError(
+                    f"{self.name} records are at least {self.struct.size} bytes"
+                )
+            iter_unpack = self._batch_unpackers[record_size] = struct.Struct(
+                f"{self.struct.format}{padding}x"
+            ).iter_unpack
+        return self._decode_batch(data, iter_unpack)
+
+    def gauges(self, registry: Registry, stat_prefix: str) -> Dict[str, Gauge]:
+        """A Gauge per field - keyed by field name"""
+        return {
+            f.name: Gauge(f"{stat_prefix}{f.metric}", f.help, registry=registry)
+            for f in self.fields
+        }
+
+
+def compile_decoder(
+    spec: Dict[str, Any], stats_class: Optional[type] = None
+) -> FrameDecoder:
+    """Compile a device frame spec - stats_class is generated if not passed"""
+    return FrameDecoder(spec, stats_class)
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import logging
+from math import exp, inf
+from pathlib import Path
+from typing import Dict, Optional, Protocol, Tuple, Union
+
+from aioprometheus import Counter, Gauge
+from aioprometheus.collectors import Registry
+
+from vand.aggregates import StatsDevice
+
+
+LOG = logging.getLogger(__name__)
+# Persisted per battery - the counters that must survive restarts
+TOTALS = ("charge_in", "charge_out", "energy_in", "energy_out")
+
+
+class BatteryDevice(StatsDevice, Protocol):
+    # perf_counter() the latest stats arrived
+    notification_received: float
+
+
+class BatteryState:
+    """Running derived values of one battery - updated in O(1) per sample"""
+
+    __slots__ = (
+        "last_time",
+        "last_current",
+        "current",
+        "charge_in",
+        "charge_out",
+        "energy_in",
+        "energy_out",
+        "cell_min",
+        "cell_max",
+        "soc",
+    )
+
+    def __init__(self, totals: Dict[str, float]) -> None:
+        self.last_time = 0.0
+        self.last_current = 0.0
+        # Exponentially smoothed current
+        self.current = 0.0
+        self.charge_in = totals.get("charge_in", 0.0)
+        self.charge_out = totals.get("charge_out", 0.0)
+        self.energy_in = totals.get("energy_in", 0.0)
+        self.energy_out = totals.get("energy_out", 0.0)
+        self.cell_min = 0.0
+        self.cell_max = 0.0
+        self.soc = 0.0
+
+    def totals(self) -> Dict[str, float]:
+        return {total: getattr(self, total) for total in TOTALS}
+
+
+class DerivedMetrics:
+    """Energy counters, cell imbalance and time to empty / full from Li3 samples
+
+    battery_power is treated as amps - positive charging, negative
+    discharging. It's integrated (trapezoidal, over the exact time between
+    notifications) into Ah + Wh in / out counters that are saved to
+    state_path so they survive restarts. Gaps over max_gap seconds (e.g. a
+    disconnect) aren't integrated. The current is exponentially smoothed
+    with a smoothing second time constant for the time to empty / full,
+    which needs each battery's capacity_ah. Bank wide values are computed
+    in collect() - once per vand_ metrics probe, not per sample."""
+
+    def __init__(
+        self,
+        registry: Registry,
+        stat_prefix: str,
+        state_path: Optional[str] = None,
+        capacity_ah: Optional[float] = None,
+        smoothing: float = 300.0,
+        max_gap: float = 30.0,
+        idle_current: float = 0.5,
+        save_interval: float = 60.0,
+    ) -> None:
+        self.state_path = Path(state_path) if state_path else None
+        self.capacity_ah = capacity_ah
+        self.smoothing = smoothing
+        self.max_gap = max_gap
+        self.idle_current = idle_current
+        self.save_interval = save_interval
+        self.states: Dict[str, BatteryState] = {}
+        # Totals loaded from state_path for batteries we've not heard from yet
+        self.saved_totals: Dict[str, Dict[str, float]] = self._load()
+        self.dirty = False
+
+        self.prom_stats: Dict[str, Union[Counter, Gauge]] = {
+            "bank_cell_imbalance": Gauge(
+                f"{stat_prefix}bank_cell_imbalance_volts",
+                "Highest minus lowest cell voltage across every battery",
+                registry=registry,
+            ),
+            "bank_time_to_empty": Gauge(
+                f"{stat_prefix}bank_time_to_empty_seconds",
+                "Seconds until every battery is empty at the smoothed current",
+                registry=registry,
+            ),
+            "bank_time_to_full": Gauge(
+                f"{stat_prefix}bank_time_to_full_seconds",
+                "Seconds until every battery is full at the smoothed current",
+                registry=registry,
+            ),
+            "cell_imbalance": Gauge(
+                f"{stat_prefix}cell_imbalance_volts",
+                "Highest minus lowest cell voltage of the battery",
+                registry=registry,
+            ),
+            "charge": Counter(
+                f"{stat_prefix}charge_amp_hours_total",
+                "Amp hours into (direction=in) or out of the battery",
+                registry=registry,
+            ),
+            "current_smoothed": Gauge(
+                f"{stat_prefix}current_smoothed_amps",
+                "Exponentially smoothed battery current - negative is discharging",
+                registry=registry,
+            ),
+            "energy": Counter(
+                f"{stat_prefix}energy_watt_hours_total",
+                "Watt hours into (direction=in) or out of the battery",
+                registry=registry,
+            ),
+            "time_to_empty": Gauge(
+                f"{stat_prefix}time_to_empty_seconds",
+                "Seconds until empty at the smoothed current - +Inf if not discharging",
+                registry=registry,
+            ),
+            "time_to_full": Gauge(
+                f"{stat_prefix}time_to_full_seconds",
+                "Seconds until full at the smoothed current - +Inf if not charging",
+                registry=registry,
+            ),
+        }
+
+    def _load(self) -> Dict[str, Dict[str, float]]:
+        if not self.state_path or not self.state_path.exists():
+            return {}
+        try:
+            with self.state_path.open("rb") as sfp:
+                return dict(json.load(sfp))
+        except (TypeError, ValueError) as e:
+            LOG.error(f"Ignoring corrupt derived metrics state {self.state_path}: {e}")
+            return {}
+
+    def save(self) -> None:
+        if not self.state_path or not self.dirty:
+            return
+        totals = {
+            **self.saved_totals,
+            **{mac: state.totals() for mac, state in self.states.items()},
+        }
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with tmp_path.open("w") as sfp:
+            json.dump(totals, sfp)
+        tmp_path.replace(self.state_path)
+        self.dirty = False
+
+    def add_sample(
+        self, device: BatteryDevice, timestamp: Optional[float] = None
+    ) -> None:
+        """stats_callbacks entry point - fold the battery's latest stats in"""
+        stats = device.stats
+        if stats is None:
+            return
+
+        timestamp = device.notification_received if timestamp is None else timestamp
+        state = self.states.get(device.mac_address)
+        if state is None:
+            state = self.states[device.mac_address] = BatteryState(
+                self.saved_totals.pop(device.mac_address, {})
+            )
+        current = stats.battery_power
+        delta = timestamp - state.last_time
+        if state.last_time and 0 < delta <= self.max_gap:
+            amp_hours = (state.last_current + current) / 2 * delta / 3600
+            if amp_hours >= 0:
+                state.charge_in += amp_hours
+                state.energy_in += amp_hours * stats.battery_voltage
+            else:
+                state.charge_out -= amp_hours
+                state.energy_out -= amp_hours * stats.battery_voltage
+            state.current += (1 - exp(-delta / self.smoothing)) * (
+                current - state.current
+            )
+            self.dirty = True
+        else:
+            state.current = current
+        state.last_time = timestamp
+        state.last_current = current
+
+        cells = (
+            stats.cell_1_voltage,
+            stats.cell_2_voltage,
+            stats.cell_3_voltage,
+            stats.cell_4_voltage,
+        )
+        state.cell_min = min(cells)
+        state.cell_max = max(cells)
+        state.soc = stats.battery_soc
+
+    def time_to(
+        self, soc: float, current: float, batteries: int = 1
+    ) -> Tuple[float, float]:
+        """(seconds to empty, seconds to full) of batteries at soc % and current"""
+        if not self.capacity_ah or abs(current) < self.idle_current * batteries:
+            return inf, inf
+        capacity = self.capacity_ah * batteries
+        if current < 0:
+            return capacity * soc / 100 / -current * 3600, inf
+        return inf, capacity * (100 - soc) / 100 / current * 3600
+
+    def publish(self, device: StatsDevice) -> None:
+        state = self.states.get(device.mac_address)
+        if state is None:
+            return
+        labels = device.prom_labels
+        for direction, charge, energy in (
+            ("in", state.charge_in, state.energy_in),
+            ("out", state.charge_out, state.energy_out),
+        ):
+            direction_labels = {**labels, "direction": direction}
+            self.prom_stats["charge"].set(direction_labels, charge)
+            self.prom_stats["energy"].set(direction_labels, energy)
+        self.prom_stats["cell_imbalance"].set(labels, state.cell_max - state.cell_min)
+        self.prom_stats["current_smoothed"].set(labels, state.current)
+        if self.capacity_ah:
+            time_to_empty, time_to_full = self.time_to(state.soc, state.current)
+            self.prom_stats["time_to_empty"].set(labels, time_to_empty)
+            self.prom_stats["time_to_full"].set(labels, time_to_full)
+
+    def collect(self) -> None:
+        """vand_ metrics collector - bank wide values across every battery"""
+        states = self.states.values()
+        if not states:
+            return
+        self.prom_stats["bank_cell_imbalance"].set(
+            {},
+            max(s.cell_max for s in states) - min(s.cell_min for s in states),
+        )
+        if self.capacity_ah:
+            time_to_empty, time_to_full = self.time_to(
+                sum(s.soc for s in states) / len(states),
+                sum(s.current for s in states),
+                len(states),
+            )
+            self.prom_stats["bank_time_to_empty"].set({}, time_to_empty)
+            self.prom_stats["bank_time_to_full"].set({}, time_to_full)
+
+    def remove(self, mac_address: str) -> None:
+        """Forget a battery - e.g. removed from the config"""
+        self.states.pop(mac_address, None)
+        self.saved_totals.pop(mac_address, None)
+        self.dirty = True
+
+    def evict(self, mac_address: str) -> None:
+        """Free a silent battery's state - its totals are kept (+ saved) for when
+        it returns"""
+        state = self.states.pop(mac_address, None)
+        if state is not None:
+            self.saved_totals[mac_address] = state.totals()
+
+    async def run(self) -> None:
+        """Save the counters every save_interval + on the way out"""
+        try:
+            while True:
+                await asyncio.sleep(self.save_interval)
+                self.save()
+        finally:
+            self.save()
@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import logging
+from time import monotonic
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp.web
+from aiohttp.hdrs import ACCEPT_ENCODING, IF_NONE_MATCH
+from aioprometheus import Histogram
+from aioprometheus.collectors import Collector, Registry
+from aioprometheus.formats.text import TEXT_CONTENT_TYPE, TextFormatter
+from aioprometheus.service import Service
+
+LOG = logging.getLogger(__name__)
+
+
+def _fingerprint(collector: Collector) -> Tuple[Any, ...]:
+    """Every series' labels + value - histograms mutate in place so use counts"""
+    store = collector.values.store
+    if isinstance(collector, Histogram):
+        return tuple(store), tuple(h.observations for h in store.values())
+    return tuple(store), tuple(store.values())
+
+
+class CachedExposition:
+    """Prometheus text exposition only re-rendered when a series changes
+
+    Each collector's text block is cached with a fingerprint of its series
+    (labels + values) so a refresh only re-renders collectors that changed.
+    The body, its ETag (a hash of the body) and gzip'd body are only rebuilt
+    when a block changed. Refreshes within coalesce_interval of the last one
+    are skipped so a burst of scrapes shares one check."""
+
+    def __init__(
+        self,
+        registry: Registry,
+        coalesce_interval: float = 0.5,
+        gzip_level: int = 6,
+    ) -> None:
+        self.registry = registry
+        self.coalesce_interval = coalesce_interval
+        self.gzip_level = gzip_level
+        self.formatter = TextFormatter()
+        # Collector name -> (fingerprint, rendered text block)
+        self.blocks: Dict[str, Tuple[Tuple[Any, ...], str]] = {}
+        self.body = b""
+        self.etag = ""
+        self._gzip_body: Optional[bytes] = None
+        self._last_refresh = float("-inf")
+        # Bodies rendered + collector blocks rendered - for measuring the cache
+        self.renders = 0
+        self.block_renders = 0
+
+    def refresh(self, force: bool = False) -> None:
+        now = monotonic()
+        if not force and now - self._last_refresh < self.coalesce_interval:
+            return
+        self._last_refresh = now
+
+        changed = False
+        blocks = {}
+        for collector in self.registry.get_all():
+            fingerprint = _fingerprint(collector)
+            cached = self.blocks.get(collector.name)
+            if cached is None or cached[0] != fingerprint:
+                cached = (fingerprint, self.formatter.marshall_collector(collector))
+                self.block_renders += 1
+                changed = True
+            blocks[collector.name] = cached
+        # A collector unregistered
+        changed |= len(blocks) != len(self.blocks)
+        self.blocks = blocks
+        if not changed and self.body:
+            return
+
+        # Same layout as aioprometheus' TextFormatter.marshall()
+        self.body = ("\n".join(sorted(b for _, b in blocks.values())) + "\n").encode()
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=8).hexdigest()}"'
+        self._gzip_body = None
+        self.renders += 1
+
+    @property
+    def gzip_body(self) -> bytes:
+        """Compressed on first use after each change"""
+        if self._gzip_body is None:
+            self._gzip_body = gzip.compress(self.body, self.gzip_level, mtime=0)
+        return self._gzip_body
+
+
+class CachedService(Service):
+    """aioprometheus Service serving a CachedExposition
+
+    Answers If-None-Match with a 304 when nothing changed and sends the
+    cached gzip body to scrapers accepting gzip."""
+
+    def __init__(
+        self,
+        registry: Registry,
+        coalesce_interval: float = 0.5,
+        gzip_level: int = 6,
+    ) -> None:
+        super().__init__(registry=registry)
+        self.exposition = CachedExposition(registry, coalesce_interval, gzip_level)
+
+    async def handle_metrics(
+        self, request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        self.exposition.refresh()
+        headers = {"ETag": self.exposition.etag, "Vary": ACCEPT_ENCODING}
+        if_none_match = {
+            etag.strip().removeprefix("W/")
+            for header in request.headers.getall(IF_NONE_MATCH, [])
+            for etag in header.split(",")
+        }
+        if self.exposition.etag in if_none_match:
+            return aiohttp.web.Response(status=304, headers=headers)
+
+        headers["Content-Type"] = TEXT_CONTENT_TYPE
+        if "gzip" in request.headers.get(ACCEPT_ENCODING, ""):
+            headers["Content-Encoding"] = "gzip"
+            return aiohttp.web.Response(body=self.exposition.gzip_body, headers=headers)
+        return aiohttp.web.Response(body=self.exposition.body, headers=headers)
@@ -0,0 +1,108 @@
+import json
+import logging
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from time import time
+from typing import Any, Dict, Optional
+
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedGattDevice:
+    name: str
+    # OS connect details - BlueZ's {"path": ...} lets bleak connect without a scan
+    details: Dict[str, Any]
+    service_uuid: str
+    characteristic: str
+    # Characteristic handle we last started notifying on
+    handle: int
+    updated: float
+
+
+class GattCache:
+    """On disk cache of where to find each device's notify characteristic
+
+    Keyed by MAC address. On restart devices with a valid entry are connected
+    straight away using the cached connect details + handle rather than
+    waiting on a scan and walking every service. Entries expire after max_age,
+    are ignored when the configured service_uuid / characteristic no longer
+    match and are dropped when a cached connect fails - so the next attempt
+    does a full discovery and re-caches."""
+
+    def __init__(self, path: str, max_age: float = 7 * 24 * 60 * 60) -> None:
+        self.path = Path(path)
+        self.max_age = max_age
+        self.devices: Dict[str, CachedGattDevice] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with self.path.open("rb") as cfp:
+                devices = json.load(cfp)
+            for mac_address, device in devices.items():
+                self.devices[mac_address] = CachedGattDevice(**device)
+        except (TypeError, ValueError) as e:
+            LOG.error(f"Ignoring corrupt GATT cache {self.path}: {e}")
+            self.devices.clear()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with tmp_path.open("w") as cfp:
+            json.dump({mac: asdict(d) for mac, d in self.devices.items()}, cfp)
+        tmp_path.replace(self.path)
+
+    def get(
+        self, mac_address: str, service_uuid: str, characteristic: str
+    ) -> Optional[CachedGattDevice]:
+        """Valid cached entry for mac_address - stale or mismatched ones are dropped"""
+        device = self.devices.get(mac_address.upper())
+        if device is None:
+            return None
+        if time() - device.updated > self.max_age:
+            LOG.info(f"GATT cache for {mac_address} expired")
+        elif (device.service_uuid, device.characteristic) != (
+            service_uuid,
+            characteristic,
+        ):
+            LOG.info(f"GATT cache for {mac_address} is for another characteristic")
+        else:
+            return device
+        self.invalidate(mac_address)
+        return None
+
+    def update(
+        self,
+        mac_address: str,
+        name: str,
+        details: Any,
+        service_uuid: str,
+        characteristic: str,
+        handle: int,
+    ) -> None:
+        # Only BlueZ details are plain data we can connect with later
+        if not isinstance(details, dict) or "path" not in details:
+            return
+        now = time()
+        device = CachedGattDevice(
+            name, {"path": details["path"]}, service_uuid, characteristic, handle, now
+        )
+        cached = self.devices.get(mac_address.upper())
+        # Reconnects rarely change anything - only write (SD card) when they do,
+        # or to refresh updated before an entry in use reaches max_age
+        if (
+            cached is not None
+            and replace(cached, updated=now) == device
+            and now - cached.updated < self.max_age / 2
+        ):
+            return
+        self.devices[mac_address.upper()] = device
+        self._save()
+
+    def invalidate(self, mac_address: str) -> None:
+        if self.devices.pop(mac_address.upper(), None) is not None:
+            self._save()
@@ -1,13 +1,27 @@
 import asyncio
 import logging
-from dataclasses import dataclass
-from time import sleep, time
-from typing import Any, Awaitable, Dict, Sequence
+import struct
+from array import array
+from dataclasses import dataclass, replace
+from functools import partial
+from time import perf_counter, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Union
 
 import bleson
-from aioprometheus import Gauge
 from aioprometheus.collectors import Registry
-from bleson import get_provider, Observer, UUID16
+from bleson import UUID16
+
+from vand.adapters import adapter_pool
+from vand.aggregates import StatsAggregator
+from vand.alerts import alert_engine, register_stats_class
+from vand.dashboard import dashboard
+from vand.decoders import compile_decoder
+from vand.history import history_store
+from vand.instrumentation import vand_metrics
+from vand.reload import config_reloader, relabel_series, remove_series
+from vand.scanner import AdvertisementScanner
+from vand.staleness import StalenessTracker
+from vand.supervisor import Restartable
 
 
 # Disable warnings from bleeson
@@ -15,9 +29,11 @@ bleson.logger.set_level(bleson.logger.ERROR)
 
 
 LOG = logging.getLogger(__name__)
+# Config settings that are also prom_labels
+RELABELED_SETTINGS = ("characteristic", "dev_name", "service_uuid")
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class WeatherMetrics:
     battery_pct_left: float
     humidity: float
@@ -26,8 +42,11 @@ class WeatherMetrics:
     temperature_f: float
 
 
+register_stats_class("HS075S", WeatherMetrics)
+
+
 class HS075S:
-    FORMAT_PRECISION = ".2f"
+    PRECISION = 2
     H5075_UPDATE_UUID16 = UUID16(0xEC88)
 
     def __init__(
@@ -44,6 +63,21 @@ class HS075S:
         self.service_uuid = service_uuid
         self.characteristic = characteristic
         self.timeout = timeout
+        self.prom_labels = {
+            "dev_name": dev_name,
+            "mac_address": mac_address,
+            "characteristic": characteristic,
+            "service_uuid": service_uuid,
+        }
+        # Each is called with ourself after every new stats sample
+        self.stats_callbacks: List[Callable[["HS075S"], None]] = []
+        # Advertisements without our service UUID
+        self.advertisements_ignored = 0
+        # Govee repeats each reading many times - we only decode new payloads
+        self.last_mfg_data = b""
+        # time() the latest advertisement with our UUID arrived
+        self.last_seen = 0.0
+        self.duplicates_suppressed = 0
         self.stats = WeatherMetrics(
             battery_pct_left=0,
             humidity=0,
@@ -52,129 +86,340 @@ class HS075S:
             temperature_f=0,
         )
 
-        self.adapter = get_provider().get_adapter()
-        self.observer = Observer(self.adapter)
-        self.observer.on_advertising_data = self.process_data
-
-    def __del__(self) -> None:
-        self.observer.stop()
-
-    def decode_temp_in_c(self, encoded_data: int) -> float:
-        """Decode H5075 Temperature into degrees Celcius"""
-        return float(format((encoded_data / 10000), self.FORMAT_PRECISION))
-
-    def decode_temp_in_f(self, encoded_data: int) -> float:
-        """Decode H5075 Temperature into degrees Fahrenheit"""
-        return float(
-            format((((encoded_data / 10000) * 1.8) + 32), self.FORMAT_PRECISION)
-        )
-
-    def decode_humidity(self, encoded_data: int) -> float:
-        """Decode H5075 percent humidity"""
-        return float(format(((encoded_data % 1000) / 10), self.FORMAT_PRECISION))
-
-    # Ran in asyncio executor thread
-    def listen(self) -> None:
-        while True:
-            self.observer.start()
-            sleep(2)  # TODO: Maybe make configurable
-            self.observer.stop()
-
     # TODO: workout the type
+    # AdvertisementScanner only dispatches advertisements from our MAC address
     def process_data(self, advertisement: Any) -> None:
-        if advertisement.address.address != self.mac_address:
-            LOG.debug(f"Ignoring advertisement from {advertisement.address.address}")
-            return
-
         if self.H5075_UPDATE_UUID16 not in advertisement.uuid16s:
+            self.advertisements_ignored += 1
             LOG.debug(
                 f"Ignoring advertisement from {self.mac_address} as we don't have the correct UUID"
             )
             return
 
-        encoded_data = int(advertisement.mfg_data.hex()[6:12], 16)
-        self.stats = WeatherMetrics(
-            battery_pct_left=int(advertisement.mfg_data.hex()[12:14], 16),
-            humidity=self.decode_humidity(encoded_data),
-            rssi=advertisement.rssi if advertisement.rssi is not None else 0,
-            temperature_c=self.decode_temp_in_c(encoded_data),
-            temperature_f=self.decode_temp_in_f(encoded_data),
-        )
+        self.last_seen = time()
+        rssi = advertisement.rssi if advertisement.rssi is not None else 0
+        mfg_data = advertisement.mfg_data
+        if mfg_data == self.last_mfg_data:
+            self.duplicates_suppressed += 1
+            if rssi == self.stats.rssi:
+                return
+            self.stats = replace(self.stats, rssi=rssi)
+        else:
+            self.last_mfg_data = mfg_data
+            self.stats = HS075S_DECODER.decode(mfg_data, rssi)
+        for stats_callback in self.stats_callbacks:
+            stats_callback(self)
+
+    def process_sample(self, stats: WeatherMetrics) -> None:
+        """A new reading the observer worker already filtered + decoded"""
+        self.last_seen = time()
+        self.stats = stats
+        for stats_callback in self.stats_callbacks:
+            stats_callback(self)
+
+
+# Manufacturer data: company id, 0x00, temperature + humidity, battery %, 0x00
+HS075S_MFG_DATA = struct.Struct(">HIBB")
+# Bytes 3-5 are big endian temperature + humidity
+ENCODED_DATA_MASK = 0xFFFFFF
+HS075S_DECODER = compile_decoder(
+    {
+        "name": "WeatherMetrics",
+        "format": "struct",
+        # Without the trailing 0x00 which we don't need
+        "layout": HS075S_MFG_DATA.format[:-1],
+        "fields": [
+            {
+                "name": "battery_pct_left",
+                "index": 2,
+                "unit": "percent",
+                "help": "Percentage of battery left",
+            },
+            {
+                "name": "humidity",
+                "index": 1,
+                "mask": ENCODED_DATA_MASK,
+                "modulo": 1000,
+                "divide": 10,
+                "round": HS075S.PRECISION,
+                "unit": "percent",
+                "help": "Humidity percentage",
+            },
+            {
+                "name": "rssi",
+                "argument": True,
+                "type": "int",
+                "unit": "dBm",
+                "help": "RSSI - Bluetooth signal strength I think?",
+            },
+            {
+                "name": "temperature_c",
+                "index": 1,
+                "mask": ENCODED_DATA_MASK,
+                "divide": 10000,
+                "round": HS075S.PRECISION,
+                "unit": "celsius",
+                "help": "Current temperature in sane Celsius",
+            },
+            {
+                "name": "temperature_f",
+                "index": 1,
+                "mask": ENCODED_DATA_MASK,
+                "divide": 10000,
+                "scale": 1.8,
+                "offset": 32,
+                "round": HS075S.PRECISION,
+                "unit": "fahrenheit",
+                "help": "Current temperature in Fahrenheit freedom units",
+            },
+        ],
+    },
+    WeatherMetrics,
+)
+
+
+def decode_batch(
+    payloads: Union[bytes, bytearray, memoryview],
+    record_size: int = HS075S_MFG_DATA.size,
+) -> Dict[str, array]:
+    """Decode a buffer of back to back captured HS075S manufacturer data
+
+    For offline analysis - b"".join() a list of payloads. Returns a column
+    (array) per WeatherMetrics field in the advertisement via HS075S_DECODER."""
+    return HS075S_DECODER.decode_batch(payloads, record_size)
 
 
 class Hygrometers:
     def __init__(
-        self, config: Dict, registry: Registry, stat_preifx: str = "govee_"
+        self,
+        config: Dict,
+        registry: Registry,
+        stat_preifx: str = "govee_",
+        aggregate_windows: Sequence[float] = (),
+        observer_worker: Optional[Dict[str, Any]] = None,
+        staleness: Optional[Dict[str, Any]] = None,
     ) -> None:
         self.config = config
         self.prom_registry = registry
         self.stat_preifx = stat_preifx
         self.hygrometers = []
+        self.published_stats: Dict[str, WeatherMetrics] = {}
+        self.event_stats = False
+        self.metrics = vand_metrics(registry)
+        self.dashboard = dashboard(registry)
+        self.dashboard_callback = self.dashboard.sample_callback("HS075S")
+        self.history = history_store(registry)
+        self.alerts = alert_engine(registry)
+        self.alerts_callback = self.alerts.sample_callback("HS075S")
+        self.metrics.collectors.append(self.collect_metrics)
+        # The worker filters + decodes so only new readings reach our loop
+        worker = None
+        if observer_worker is not None:
+            worker = {
+                "decoder": "vand.govee:HS075S_DECODER",
+                "service_uuid16": HS075S.H5075_UPDATE_UUID16.uuid,
+                **observer_worker,
+            }
+        self.scanner = AdvertisementScanner(
+            metrics=self.metrics,
+            module="HS075S",
+            adapter_pool=adapter_pool(registry),
+            worker=worker,
+        )
         for id, h_settings in self.config.items():
             LOG.debug(f"Loading hygrometer {id}: {h_settings}")
-            self.hygrometers.append(HS075S(**h_settings))
-
-        self.prom_stats = {
-            "battery_pct_left": Gauge(
-                f"{self.stat_preifx}battery_pct_left",
-                "Percentage of battery left",
-                registry=self.prom_registry,
-            ),
-            "humidity": Gauge(
-                f"{self.stat_preifx}humidity",
-                "Humidity percentage",
-                registry=self.prom_registry,
-            ),
-            "rssi": Gauge(
-                f"{self.stat_preifx}rssi",
-                "RSSI - Bluetooth signal strength I think?",
-                registry=self.prom_registry,
-            ),
-            "temperature_c": Gauge(
-                f"{self.stat_preifx}temperature_c",
-                "Current temperature in sane Celsius",
-                registry=self.prom_registry,
-            ),
-            "temperature_f": Gauge(
-                f"{self.stat_preifx}temperature_f",
-                "Current temperature in Fahrenheit freedom units",
-                registry=self.prom_registry,
-            ),
-        }
+            hygrometer = HS075S(**h_settings)
+            self._register(hygrometer)
+            self.hygrometers.append(hygrometer)
+
+        self.prom_stats = HS075S_DECODER.gauges(self.prom_registry, self.stat_preifx)
+        # Last seen + sample age - drops the series of hygrometers gone silent
+        self.staleness = StalenessTracker(
+            self.prom_registry, self.stat_preifx, **(staleness or {})
+        )
+
+        # Windowed aggregates of every sample
+        self.aggregator: Optional[StatsAggregator] = None
+        if aggregate_windows:
+            self.aggregator = StatsAggregator(
+                WeatherMetrics, self.stat_preifx, self.prom_registry, aggregate_windows
+            )
+
+    def _register(self, hygrometer: HS075S) -> None:
+        self.scanner.register(
+            hygrometer.mac_address, hygrometer.process_data, hygrometer.process_sample
+        )
+
+    def refresh_prom_stats(self) -> None:
+        """Set every gauge from every device's latest stats"""
+        for hydrometer in self.hygrometers:
+            if not hydrometer.stats:
+                LOG.error(
+                    f"{hydrometer.dev_name} does not have valid stats ... skipping."
+                )
+                continue
+            if not self.staleness.fresh(hydrometer):
+                continue
+
+            for stat_name, prom_metric in self.prom_stats.items():
+                prom_metric.set(
+                    hydrometer.prom_labels, getattr(hydrometer.stats, stat_name)
+                )
+            LOG.debug(f"Updated {hydrometer.dev_name} stats")
 
     async def stats_refresh(self, refresh_interval: float) -> None:
         while True:
-            stat_collect_start_time = time()
-            for hydrometer in self.hygrometers:
-                if not hydrometer.stats:
-                    LOG.error(
-                        f"{hydrometer.dev_name} does not have valid stats ... skipping."
-                    )
-                    continue
-
-                for stat_name, prom_metric in self.prom_stats.items():
-                    prom_metric.set(
-                        {
-                            "dev_name": hydrometer.dev_name,
-                            "mac_address": hydrometer.mac_address,
-                            "characteristic": hydrometer.characteristic,
-                            "service_uuid": hydrometer.service_uuid,
-                        },
-                        getattr(hydrometer.stats, stat_name),
-                    )
-                LOG.info(f"Updated {hydrometer.dev_name} stats")
-            run_time = time() - stat_collect_start_time
+            stat_collect_start_time = perf_counter()
+            self.refresh_prom_stats()
+            run_time = perf_counter() - stat_collect_start_time
+            self.metrics.histograms["stats_refresh_duration"].observe(
+                {"module": "HS075S"}, run_time
+            )
             sleep_time = (
                 refresh_interval - run_time if run_time < refresh_interval else 0
             )
-            LOG.info(
+            LOG.debug(
                 f"{HS075S.__name__} has refreshed prometheus stats in {run_time}s. "
                 + f"Sleeping for {sleep_time}s"
             )
             await asyncio.sleep(sleep_time)
 
-    async def get_awaitables(self, refresh_interval: float) -> Sequence[Awaitable[Any]]:
-        loop = asyncio.get_running_loop()
-        coros = [self.stats_refresh(refresh_interval)]
-        coros.extend([loop.run_in_executor(None, b.listen) for b in self.hygrometers])  # type: ignore
+    def _expire(self, hygrometer: HS075S) -> None:
+        """Free a silent hygrometer's samples - its next advertisement is decoded"""
+        self.published_stats.pop(hygrometer.mac_address, None)
+        if self.aggregator:
+            self.aggregator.device_windows.pop(hygrometer.mac_address, None)
+        self.history.remove(hygrometer.mac_address)
+        self.alerts.remove(hygrometer.mac_address)
+        self.dashboard.remove(hygrometer.mac_address)
+        # Else a returning hygrometer repeating its last reading is suppressed
+        hygrometer.last_mfg_data = b""
+        if self.scanner.worker_process:
+            self.scanner.worker_process.forget(hygrometer.mac_address)
+
+    def collect_metrics(self) -> None:
+        """Copy filter + observer worker counters into the vand_ metrics + expire"""
+        for hygrometer in self.staleness.check(self.hygrometers):
+            self._expire(hygrometer)
+        worker_process = self.scanner.worker_process
+        self.metrics.prom_stats["advertisements_ignored"].set(
+            {"module": "HS075S", "filter": "mac_address"}, self.scanner.ignored
+        )
+        service_uuid_ignored = sum(h.advertisements_ignored for h in self.hygrometers)
+        if worker_process and worker_process.ring:
+            service_uuid_ignored += worker_process.ring.ignored
+        self.metrics.prom_stats["advertisements_ignored"].set(
+            {"module": "HS075S", "filter": "service_uuid"}, service_uuid_ignored
+        )
+        if worker_process:
+            self.metrics.prom_stats["observer_worker_restarts"].set(
+                {"module": "HS075S"}, worker_process.restarts
+            )
+            if worker_process.ring:
+                self.metrics.prom_stats["observer_ring_dropped"].set(
+                    {"module": "HS075S"}, worker_process.ring.dropped
+                )
+
+    def update_prom_stats(self, hygrometer: HS075S) -> None:
+        """Set only the gauges whose value changed since we last published"""
+        previous = self.published_stats.get(hygrometer.mac_address)
+        for stat_name, prom_metric in self.prom_stats.items():
+            value = getattr(hygrometer.stats, stat_name)
+            if previous is None or getattr(previous, stat_name) != value:
+                prom_metric.set(hygrometer.prom_labels, value)
+        self.published_stats[hygrometer.mac_address] = hygrometer.stats
+
+    def _add_stats_callbacks(self, hygrometer: HS075S) -> None:
+        # First so alerts aren't delayed by any other callback
+        if self.alerts.rules:
+            hygrometer.stats_callbacks.append(self.alerts_callback)
+        if self.aggregator:
+            hygrometer.stats_callbacks.append(self.aggregator.add_sample)
+        if self.event_stats:
+            hygrometer.stats_callbacks.append(self.update_prom_stats)
+        hygrometer.stats_callbacks.append(self.history.add_sample)
+        hygrometer.stats_callbacks.append(self.dashboard_callback)
+
+    async def reload(self, conf: Dict[str, Any]) -> None:
+        """Diff conf's HS075S section - only (un)registering hygrometers that changed"""
+        wanted = {
+            settings["mac_address"].upper(): settings
+            for settings in conf.get("HS075S", {}).values()
+        }
+        for hygrometer in list(self.hygrometers):
+            mac_address = hygrometer.mac_address.upper()
+            settings = wanted.get(mac_address)
+            if settings is None:
+                LOG.info(f"Removing {hygrometer.dev_name} ({hygrometer.mac_address})")
+                self.scanner.unregister(mac_address)
+                self.hygrometers.remove(hygrometer)
+                self.published_stats.pop(hygrometer.mac_address, None)
+                if self.aggregator:
+                    self.aggregator.device_windows.pop(hygrometer.mac_address, None)
+                self.history.remove(hygrometer.mac_address)
+                self.alerts.remove(hygrometer.mac_address)
+                self.dashboard.remove(hygrometer.mac_address)
+                self.staleness.remove(hygrometer.mac_address)
+                remove_series(
+                    self.prom_registry, {"mac_address": hygrometer.mac_address}
+                )
+                continue
+
+            # Passively observed so just relabel - no session to restart
+            new_labels = {
+                label: settings[label]
+                for label in RELABELED_SETTINGS
+                if settings[label] != getattr(hygrometer, label)
+            }
+            if new_labels:
+                LOG.info(f"Relabeling {hygrometer.dev_name} with {new_labels}")
+                relabel_series(
+                    self.prom_registry,
+                    {"mac_address": hygrometer.mac_address},
+                    new_labels,
+                )
+                for label, value in new_labels.items():
+                    setattr(hygrometer, label, value)
+                    hygrometer.prom_labels[label] = value
+                if self.aggregator:
+                    self.aggregator.device_windows.pop(hygrometer.mac_address, None)
+
+        known = {h.mac_address.upper() for h in self.hygrometers}
+        for mac_address, settings in wanted.items():
+            if mac_address in known:
+                continue
+            LOG.info(f"Adding {settings['dev_name']} ({settings['mac_address']})")
+            hygrometer = HS075S(**settings)
+            self._add_stats_callbacks(hygrometer)
+            self._register(hygrometer)
+            self.hygrometers.append(hygrometer)
+        self.config = conf.get("HS075S", {})
+
+    async def get_awaitables(
+        self, refresh_interval: float, event_stats: bool = False
+    ) -> Sequence[Awaitable[Any]]:
+        coros: List[Awaitable[Any]] = [Restartable(self.scanner.listen)]
+        self.event_stats = event_stats
+        if not event_stats:
+            coros.append(Restartable(partial(self.stats_refresh, refresh_interval)))
+        for h in self.hygrometers:
+            self._add_stats_callbacks(h)
         return coros
+
+
+async def load_module(
+    conf: Dict[str, Any], prom_registry: Registry
+) -> Sequence[Awaitable[Any]]:
+    """vand.modules entry point: Monitor HS075S Hygrometers"""
+    h = Hygrometers(
+        conf["HS075S"],
+        prom_registry,
+        aggregate_windows=conf["vanD"].get("aggregate_windows", []),
+        observer_worker=conf["vanD"].get("observer_worker"),
+        staleness=conf["vanD"].get("staleness"),
+    )
+    config_reloader(prom_registry).handlers.append(h.reload)
+    return await h.get_awaitables(
+        conf["vanD"]["statistics_refresh_interval"],
+        conf["vanD"].get("stats_update_mode", "poll") == "event",
+    )
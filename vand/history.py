@@ -0,0 +1,206 @@
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import fields
+from operator import attrgetter
+from time import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from aioprometheus import Counter, Gauge
+from aioprometheus.collectors import Registry
+
+from vand.aggregates import StatsDevice
+from vand.registry import per_registry
+
+
+LOG = logging.getLogger(__name__)
+# A float64 timestamp + a float64 value
+BYTES_PER_SAMPLE = 16
+
+
+class Downsampled(NamedTuple):
+    # Start of each step long bucket that had samples
+    timestamps: array
+    mins: array
+    maxs: array
+    means: array
+
+
+class Series:
+    """Fixed capacity ring of (timestamp, value) in two preallocated float64 arrays
+
+    Appends overwrite the oldest sample once full so never allocate. Samples
+    must be appended in time order so queries can binary search."""
+
+    __slots__ = ("capacity", "timestamps", "values", "head", "count")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        # Slot the next sample is written to
+        self.head = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, timestamp: float, value: float) -> None:
+        head = self.head
+        self.timestamps[head] = timestamp
+        self.values[head] = value
+        head += 1
+        self.head = 0 if head == self.capacity else head
+        if self.count < self.capacity:
+            self.count += 1
+
+    def _slot(self, idx: int) -> int:
+        """Slot of the idx'th oldest sample"""
+        return (self.head - self.count + idx) % self.capacity
+
+    def _timestamp(self, idx: int) -> float:
+        return self.timestamps[self._slot(idx)]
+
+    def _slice(self, start: int, end: int) -> Tuple[array, array]:
+        """Copies of the start'th to end'th oldest samples - at most two slices"""
+        if start >= end:
+            return array("d"), array("d")
+        first = self._slot(start)
+        last = self._slot(end - 1) + 1
+        if first < last:
+            return self.timestamps[first:last], self.values[first:last]
+        return (
+            self.timestamps[first:] + self.timestamps[:last],
+            self.values[first:] + self.values[:last],
+        )
+
+    def last(self, n: int) -> Tuple[array, array]:
+        """(timestamps, values) of the newest n samples - oldest first"""
+        return self._slice(max(self.count - n, 0), self.count)
+
+    def between(self, start: float, end: float) -> Tuple[array, array]:
+        """(timestamps, values) of samples with start <= timestamp <= end"""
+        indexes = range(self.count)
+        first = bisect_left(indexes, start, key=self._timestamp)
+        last = bisect_right(indexes, end, key=self._timestamp)
+        return self._slice(first, last)
+
+    def downsample(self, start: float, end: float, step: float) -> Downsampled:
+        """min / max / mean of samples between start and end per step seconds"""
+        downsampled = Downsampled(array("d"), array("d"), array("d"), array("d"))
+        timestamps, values = self.between(start, end)
+        bucket = -1
+        total = 0.0
+        count = 0
+        for timestamp, value in zip(timestamps, values):
+            sample_bucket = int((timestamp - start) // step)
+            if sample_bucket != bucket:
+                if count:
+                    downsampled.means.append(total / count)
+                bucket = sample_bucket
+                total = 0.0
+                count = 0
+                downsampled.timestamps.append(start + bucket * step)
+                downsampled.mins.append(value)
+                downsampled.maxs.append(value)
+            elif value < downsampled.mins[-1]:
+                downsampled.mins[-1] = value
+            elif value > downsampled.maxs[-1]:
+                downsampled.maxs[-1] = value
+            total += value
+            count += 1
+        if count:
+            downsampled.means.append(total / count)
+        return downsampled
+
+
+class HistoryStore:
+    """Recent samples of every stats field of every device - use history_store()
+
+    Each device field gets a Series of capacity samples, allocated up front
+    when the device's first sample arrives. Series are only allocated while
+    they fit in max_memory bytes - devices that don't fit aren't kept."""
+
+    def __init__(
+        self,
+        registry: Registry,
+        capacity: int = 3600,
+        max_memory: int = 16 * 1024 * 1024,
+    ) -> None:
+        self.capacity = capacity
+        self.max_memory = max_memory
+        self.memory_bytes = 0
+        # (MAC address, field name) -> Series
+        self.series: Dict[Tuple[str, str], Series] = {}
+        # MAC address -> (stats values getter, Series per field) - empty if no room
+        self._device_series: Dict[str, Tuple[Callable, List[Series]]] = {}
+
+        self.prom_stats: Dict[str, Union[Counter, Gauge]] = {
+            "devices_dropped": Counter(
+                "vand_history_devices_dropped_total",
+                "Devices not kept in history as they'd exceed max_memory",
+                registry=registry,
+            ),
+            "memory": Gauge(
+                "vand_history_memory_bytes",
+                "Bytes allocated for in memory history",
+                registry=registry,
+            ),
+        }
+
+    def configure(
+        self, capacity: int = 3600, max_memory: int = 16 * 1024 * 1024
+    ) -> None:
+        """Set limits - only applies to series allocated from now on"""
+        self.capacity = capacity
+        self.max_memory = max_memory
+
+    def _add_device(self, device: StatsDevice) -> Tuple[Callable, List[Series]]:
+        field_names = [f.name for f in fields(device.stats)]
+        series_bytes = len(field_names) * self.capacity * BYTES_PER_SAMPLE
+        device_series: List[Series] = []
+        if self.memory_bytes + series_bytes > self.max_memory:
+            LOG.warning(
+                f"Not keeping history for {device.mac_address} - {series_bytes} "
+                + f"bytes would exceed history max_memory ({self.max_memory})"
+            )
+            self.prom_stats["devices_dropped"].inc({})
+        else:
+            for field_name in field_names:
+                series = Series(self.capacity)
+                self.series[(device.mac_address, field_name)] = series
+                device_series.append(series)
+            self.memory_bytes += series_bytes
+            self.prom_stats["memory"].set({}, self.memory_bytes)
+        self._device_series[device.mac_address] = (
+            attrgetter(*field_names),
+            device_series,
+        )
+        return self._device_series[device.mac_address]
+
+    def add_sample(self, device: StatsDevice) -> None:
+        """stats_callbacks entry - append every field of the device's stats"""
+        device_series = self._device_series.get(device.mac_address)
+        if device_series is None:
+            device_series = self._add_device(device)
+        get_values, series = device_series
+        timestamp = time()
+        for field_series, value in zip(series, get_values(device.stats)):
+            field_series.append(timestamp, value)
+
+    def remove(self, mac_address: str) -> None:
+        """Free a device's history - e.g. it was removed from the config"""
+        _, device_series = self._device_series.pop(mac_address, (None, []))
+        for key in [key for key in self.series if key[0] == mac_address]:
+            del self.series[key]
+        self.memory_bytes -= sum(s.capacity * BYTES_PER_SAMPLE for s in device_series)
+        self.prom_stats["memory"].set({}, self.memory_bytes)
+
+    def get(self, mac_address: str, field_name: str) -> Optional[Series]:
+        return self.series.get((mac_address, field_name))
+
+
+@per_registry
+def history_store(registry: Registry) -> HistoryStore:
+    """The HistoryStore for registry - created on first use"""
+    return HistoryStore(registry)
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from time import perf_counter
+from typing import Callable, Dict, List, Union
+
+from aioprometheus import Counter, Gauge, Histogram
+from aioprometheus.collectors import Registry
+
+from vand.registry import per_registry
+
+
+LOG = logging.getLogger(__name__)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 1.0)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+
+
+class VandMetrics:
+    """vanD's own vand_ health metrics - use vand_metrics() to share one per Registry
+
+    Hot paths only bump plain ints on their devices. Modules append a
+    collector that copies those into counters and run() calls every
+    collector each probe_interval while measuring event loop lag."""
+
+    def __init__(self, registry: Registry) -> None:
+        # Called each probe to copy device counters into prom_stats
+        self.collectors: List[Callable[[], None]] = []
+        self.prom_stats: Dict[str, Union[Counter, Gauge]] = {
+            "advertisements_ignored": Counter(
+                "vand_advertisements_ignored_total",
+                "Advertisements dropped by MAC address or service UUID filters",
+                registry=registry,
+            ),
+            "executor_queue_depth": Gauge(
+                "vand_executor_queue_depth",
+                "Work items waiting for the event loop's default executor",
+                registry=registry,
+            ),
+            "frames_dropped": Counter(
+                "vand_frames_dropped_total",
+                "Incomplete frames dropped - e.g. a lost notification",
+                registry=registry,
+            ),
+            "frames_malformed": Counter(
+                "vand_frames_malformed_total",
+                "Frames that failed to parse",
+                registry=registry,
+            ),
+            "frames_parsed": Counter(
+                "vand_frames_parsed_total",
+                "Frames parsed into a stats sample",
+                registry=registry,
+            ),
+            "observer_ring_dropped": Counter(
+                "vand_observer_ring_dropped_total",
+                "Samples the observer worker dropped as its ring was full",
+                registry=registry,
+            ),
+            "observer_worker_restarts": Counter(
+                "vand_observer_worker_restarts_total",
+                "Times the observer worker process died and was restarted",
+                registry=registry,
+            ),
+        }
+        self.histograms: Dict[str, Histogram] = {
+            "event_loop_lag": Histogram(
+                "vand_event_loop_lag_seconds",
+                "How late the event loop woke a sleeping probe - high means overloaded",
+                registry=registry,
+                buckets=LATENCY_BUCKETS,
+            ),
+            "handler_latency": Histogram(
+                "vand_handler_latency_seconds",
+                "Notification / advertisement received until handled "
+                + "(gauges set in event mode)",
+                registry=registry,
+                buckets=LATENCY_BUCKETS,
+            ),
+            "stats_refresh_duration": Histogram(
+                "vand_stats_refresh_duration_seconds",
+                "Time a poll mode stats_refresh pass took",
+                registry=registry,
+                buckets=DURATION_BUCKETS,
+            ),
+        }
+
+    def observe_latency(self, module: str, received_time: float) -> None:
+        """received_time is the perf_counter() when the data arrived"""
+        self.histograms["handler_latency"].observe(
+            {"module": module}, perf_counter() - received_time
+        )
+
+    def collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        # No public API for this - skipped until something uses the executor
+        # or on loops (e.g. uvloop) without these private attributes
+        executor = getattr(loop, "_default_executor", None)
+        work_queue = getattr(executor, "_work_queue", None)
+        if work_queue is not None:
+            self.prom_stats["executor_queue_depth"].set({}, work_queue.qsize())
+        for collector in self.collectors:
+            collector()
+
+    async def run(self, probe_interval: float = 1.0) -> None:
+        LOG.info(f"Probing event loop lag every {probe_interval}s")
+        while True:
+            sleep_start = perf_counter()
+            await asyncio.sleep(probe_interval)
+            lag = perf_counter() - sleep_start - probe_interval
+            self.histograms["event_loop_lag"].observe({}, max(lag, 0))
+            self.collect()
+
+
+@per_registry
+def vand_metrics(registry: Registry) -> VandMetrics:
+    """The VandMetrics for registry - created on first use"""
+    return VandMetrics(registry)
@@ -1,15 +1,30 @@
 import asyncio
 import logging
 from dataclasses import dataclass
-from time import time
-from typing import Any, Awaitable, Dict, Optional, Sequence
+from functools import partial
+from time import perf_counter, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Union
 
-from aioprometheus import Gauge
 from aioprometheus.collectors import Registry
-from bleak import BleakClient, BleakScanner
 from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
 from bleak.exc import BleakError
 
+from vand.adapters import adapter_pool, AdapterPool, details_adapter
+from vand.aggregates import StatsAggregator
+from vand.alerts import alert_engine, register_stats_class
+from vand.backends import get_backend
+from vand.connections import ConnectionManager
+from vand.dashboard import dashboard
+from vand.decoders import compile_decoder
+from vand.derived import DerivedMetrics
+from vand.gatt_cache import CachedGattDevice, GattCache
+from vand.history import history_store
+from vand.instrumentation import vand_metrics
+from vand.reload import config_reloader, relabel_series, remove_series
+from vand.staleness import StalenessTracker
+from vand.supervisor import Restartable
+
 
 LOG = logging.getLogger(__name__)
 
@@ -29,6 +44,153 @@ class Li3TelemetryStats:
     fault_code: int  # This is hex converted to an int
 
 
+register_stats_class("li3", Li3TelemetryStats)
+
+
+# 1309,327,... is battery voltage, 4 cell voltages (centivolts) then temperatures,
+# power, state of charge and a hex fault code
+LI3_DECODER = compile_decoder(
+    {
+        "name": "Li3TelemetryStats",
+        "format": "csv",
+        "fields": [
+            {
+                "name": "battery_voltage",
+                "column": 0,
+                "divide": 100,
+                "unit": "volts",
+                "help": "Current volts of the battery",
+            },
+            *(
+                {
+                    "name": f"cell_{cell}_voltage",
+                    "column": cell,
+                    "divide": 100,
+                    "unit": "volts",
+                    "help": f"Battery Cell {cell} Voltage",
+                }
+                for cell in range(1, 5)
+            ),
+            {
+                "name": "bms_temperature",
+                "column": 5,
+                "unit": "celsius",
+                "help": "The temperature of the BMS",
+            },
+            {
+                "name": "battery_temperature",
+                "column": 6,
+                "unit": "celsius",
+                "help": "Battery temperature - Remember won't charge if to cold/hot",
+            },
+            {
+                "name": "battery_power",
+                "column": 7,
+                "help": "Battery current power charge or draw",
+            },
+            {
+                "name": "battery_soc",
+                "column": 8,
+                "unit": "percent",
+                "help": "Percentage of battery charge left",
+            },
+            {
+                "name": "fault_code",
+                "column": 9,
+                "type": "hex",
+                "help": "Type of Battery fault (Hex converted to int)",
+            },
+        ],
+    },
+    Li3TelemetryStats,
+)
+
+
+class Li3FrameParser:
+    """Incremental byte level parser for Li3 BLE notification fragments
+
+    A telemetry frame is 10 CSV fields split over several notifications, e.g.
+    `1309,327,327,328,327` then `,32,39,0,79,000000`. `&` fragments are a
+    different (unknown) message that can arrive mid frame, so they are skipped
+    without touching the frame being assembled. Fragments are appended to one
+    reused bytearray and a fragment that can't continue the current frame
+    either starts a new one or is counted and dropped so we resync on the next
+    frame start. Nothing here raises - bleak swallows callback exceptions."""
+
+    FIELD_SEPERATOR = ord(",")
+    FIELD_COUNT = LI3_DECODER.columns
+    IGNORED_FRAME_START = ord("&")
+    # States
+    IDLE = 0
+    IN_FRAME = 1
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.state = self.IDLE
+        self.fragments_ignored = 0
+        self.frames_malformed = 0
+        self.frames_parsed = 0
+        self.frames_partial = 0
+
+    def _reset(self) -> None:
+        self.buffer.clear()
+        self.state = self.IDLE
+
+    def feed(self, data: Union[bytes, bytearray]) -> Optional[Li3TelemetryStats]:
+        """Add a notification fragment - returns stats when it completes a frame"""
+        data = data.strip()
+        if not data:
+            return None
+
+        lead = data[0]
+        if lead == self.IGNORED_FRAME_START:
+            # no idea what &,1,114,006880 is.. throw it away for now
+            self.fragments_ignored += 1
+            return None
+
+        if lead == self.FIELD_SEPERATOR:
+            if self.state != self.IN_FRAME:
+                # Continuation of a frame we never saw the start of
+                self.frames_partial += 1
+                return None
+            self.buffer += data
+        elif 0x30 <= lead <= 0x39:
+            if self.state == self.IN_FRAME:
+                if self.buffer[-1] == self.FIELD_SEPERATOR:
+                    # Fragment split straight after a comma
+                    self.buffer += data
+                else:
+                    # The frame in progress never completed
+                    self.frames_partial += 1
+                    self.buffer[:] = data
+            else:
+                self.buffer[:] = data
+                self.state = self.IN_FRAME
+        else:
+            self.frames_malformed += 1
+            self._reset()
+            return None
+
+        seperators = self.buffer.count(self.FIELD_SEPERATOR)
+        if seperators < self.FIELD_COUNT - 1 or self.buffer[-1] == self.FIELD_SEPERATOR:
+            return None
+        if seperators >= self.FIELD_COUNT:
+            self.frames_malformed += 1
+            self._reset()
+            return None
+
+        try:
+            stats: Li3TelemetryStats = LI3_DECODER.decode(self.buffer)
+        except ValueError:
+            self.frames_malformed += 1
+            return None
+        finally:
+            self._reset()
+
+        self.frames_parsed += 1
+        return stats
+
+
 class Li3Battery:
     def __init__(
         self,
@@ -39,47 +201,99 @@ class Li3Battery:
         timeout: float,
     ) -> None:
         self.bleak_device: Optional[BLEDevice] = None
+        # Adapter name -> how that adapter's BlueZ knows us
+        self.bleak_devices: Dict[str, BLEDevice] = {}
+        # Set by RevelBatteries when a gatt_cache is configured
+        self.gatt_cache: Optional[GattCache] = None
+        # Set by RevelBatteries - adapter pinned to in config else balanced
+        self.adapter_pool: Optional[AdapterPool] = None
+        self.adapter: Optional[str] = None
         self.dev_name = dev_name
         self.mac_address = mac_address
         self.float = timeout
         self.service_uuid = service_uuid
         self.characteristic = characteristic
         self.timeout = timeout
+        self.prom_labels = {
+            "dev_name": dev_name,
+            "mac_address": mac_address,
+            "characteristic": characteristic,
+            "service_uuid": service_uuid,
+        }
 
-        self.str_data = ""
+        self.parser = Li3FrameParser()
+        self.last_notification = 0.0
+        # perf_counter() of the last notification for handler latency
+        self.notification_received = 0.0
+        # time() the latest stats sample arrived
+        self.last_seen = 0.0
+        # Set while BLE discovery has seen us advertising
+        self.seen = asyncio.Event()
         self.stats: Optional[Li3TelemetryStats] = None
+        # Each is called with ourself after every new stats sample
+        self.stats_callbacks: List[Callable[["Li3Battery"], None]] = []
+
+    def _telementary_handler(self, sender: Any, data: Union[bytes, bytearray]) -> None:
+        self.last_notification = time()
+        self.notification_received = perf_counter()
+        stats = self.parser.feed(data)
+        if stats is not None:
+            self.stats = stats
+            self.last_seen = self.last_notification
+            for stats_callback in self.stats_callbacks:
+                stats_callback(self)
+
+    def cached_gatt(self) -> Optional[CachedGattDevice]:
+        if not self.gatt_cache:
+            return None
+        return self.gatt_cache.get(
+            self.mac_address, self.service_uuid, self.characteristic
+        )
 
-    def _telementary_handler(self, sender: str, data: bytes) -> None:
-        self.raw_data = data
-        tmp_str_data = data.decode("ascii")
-        if tmp_str_data.startswith(","):
-            self.str_data += tmp_str_data.strip()
-            csv_data = self.str_data.split(",")
-            self.stats = Li3TelemetryStats(
-                float(csv_data[0]) / 100,
-                float(csv_data[1]) / 100,
-                float(csv_data[2]) / 100,
-                float(csv_data[3]) / 100,
-                float(csv_data[4]) / 100,
-                float(csv_data[5]),
-                float(csv_data[6]),
-                float(csv_data[7]),
-                float(csv_data[8]),
-                int(csv_data[9], 16),
+    def _seen_devices(self, cached: Optional[CachedGattDevice]) -> Dict[str, BLEDevice]:
+        """Adapter name -> BLEDevice we can connect to through that adapter"""
+        devices = dict(self.bleak_devices)
+        if self.bleak_device:
+            devices.setdefault(
+                details_adapter(self.bleak_device.details), self.bleak_device
             )
-        # no idea what &,1,114,006880 is.. throw it away for now
-        elif "&" not in tmp_str_data:
-            self.str_data = tmp_str_data
+        if cached:
+            devices.setdefault(
+                details_adapter(cached.details),
+                BLEDevice(self.mac_address, cached.name, cached.details),
+            )
+        return devices
+
+    async def _connect_cached(
+        self, device: Optional[BLEDevice], cached: CachedGattDevice
+    ) -> Any:
+        """Connect + notify on the cached handle - skips the scan + service walk"""
+        LOG.info(
+            f"Starting notify for {self.dev_name} on cached handle {cached.handle}"
+        )
+        device = device or BLEDevice(self.mac_address, cached.name, cached.details)
+        client = get_backend().client(
+            device, timeout=self.timeout, services=[self.service_uuid]
+        )
+        await client.connect()
+        try:
+            await client.start_notify(cached.handle, self._telementary_handler)
+        except BaseException:
+            await client.disconnect()
+            raise
+        return client
 
-    async def listen(self) -> None:
-        if not self.bleak_device:
+    async def _connect_discovered(self, device: Optional[BLEDevice]) -> Any:
+        """Connect + walk the services for our characteristic to notify on"""
+        if not device:
             raise BleakError(f"{self.dev_name} was not found in bleak scan!")
 
         LOG.info(f"Attempting to start a notify for {self.dev_name}")
-        started_notify_uuid = ""
-        async with BleakClient(self.bleak_device) as client:
-            services = await client.get_services()
-            for service in services:
+        client = get_backend().client(device, timeout=self.timeout)
+        await client.connect()
+        try:
+            started_notify_handle: Optional[int] = None
+            for service in client.services:
                 if service.uuid != self.service_uuid:
                     continue
 
@@ -92,136 +306,444 @@ class Li3Battery:
                         await client.start_notify(
                             characteristic.uuid, self._telementary_handler
                         )
-                        started_notify_uuid = characteristic.uuid
+                        started_notify_handle = characteristic.handle
 
-            if not started_notify_uuid:
-                LOG.error(
-                    f"{self.dev_name} is not listening to {started_notify_uuid}!!"
+            if started_notify_handle is None:
+                raise BleakError(
+                    f"{self.dev_name} has no {self.service_uuid}:{self.characteristic}"
                 )
-                return
+        except BaseException:
+            await client.disconnect()
+            raise
 
-            # Block while we read Bluetooth LE
-            # TODO: Find if a better asyncio way to allow clean exit
-            # Always cleanup the notify
-            try:
-                while True:
-                    await asyncio.sleep(1)
-            finally:
-                LOG.info(f"Cleaning up bleak notify for {started_notify_uuid}")
-                await client.stop_notify(started_notify_uuid)
+        if self.gatt_cache:
+            self.gatt_cache.update(
+                self.mac_address,
+                device.name or "",
+                device.details,
+                self.service_uuid,
+                self.characteristic,
+                started_notify_handle,
+            )
+        return client
+
+    async def _connect(
+        self, device: Optional[BLEDevice], cached: Optional[CachedGattDevice]
+    ) -> Any:
+        if not cached:
+            return await self._connect_discovered(device)
+        try:
+            return await self._connect_cached(device, cached)
+        except (BleakError, asyncio.TimeoutError, OSError):
+            # Next attempt waits for discovery to see us and walks the services
+            assert self.gatt_cache is not None
+            self.gatt_cache.invalidate(self.mac_address)
+            raise
+
+    async def connect(self) -> Any:
+        """Connect and start notifying - raises BleakError on failure"""
+        cached = self.cached_gatt()
+        device = self.bleak_device
+        if self.adapter_pool:
+            devices = self._seen_devices(cached)
+            adapter = self.adapter_pool.acquire_connection(
+                self.mac_address, devices, self.adapter
+            )
+            LOG.debug(f"Connecting to {self.dev_name} via {adapter.name}")
+            device = devices[adapter.name]
+        try:
+            client = await self._connect(device, cached)
+        except BaseException as e:
+            if self.adapter_pool:
+                self.adapter_pool.release_connection(
+                    self.mac_address,
+                    failed=isinstance(e, (BleakError, asyncio.TimeoutError, OSError)),
+                )
+            raise
+
+        self.last_notification = time()
+        return client
+
+    async def disconnect(self, client: Any) -> None:
+        try:
+            if client.is_connected:
+                LOG.info(f"Cleaning up bleak notify for {self.characteristic}")
+                await client.stop_notify(self.characteristic)
+            await client.disconnect()
+        finally:
+            if self.adapter_pool:
+                self.adapter_pool.release_connection(self.mac_address)
 
 
 class RevelBatteries:
     def __init__(
-        self, config: Dict, registry: Registry, stat_preifx: str = "li3_"
+        self,
+        config: Dict,
+        registry: Registry,
+        stat_preifx: str = "li3_",
+        aggregate_windows: Sequence[float] = (),
     ) -> None:
         self.config = config
         self.prom_registry = registry
         self.stat_preifx = stat_preifx
         self.batteries = []
+        self.published_stats: Dict[str, Li3TelemetryStats] = {}
+        # HCI adapters to discover on + spread connections across
+        self.adapter_pool = adapter_pool(registry)
+        # Where each battery's characteristic was last found - saves a scan
+        self.gatt_cache: Optional[GattCache] = None
+        gatt_cache_conf = self.config.get("vanD", {}).get("gatt_cache")
+        if gatt_cache_conf:
+            self.gatt_cache = GattCache(**gatt_cache_conf)
         for id, battery_settings in self.config["li3"].items():
             LOG.debug(f"Loading battery {id}: {battery_settings}")
-            self.batteries.append(Li3Battery(**battery_settings))
+            self.batteries.append(self._new_battery(battery_settings))
+        self.batteries_by_mac = {b.mac_address.upper(): b for b in self.batteries}
+        # Set once discovery has seen every battery
+        self.all_seen = asyncio.Event()
+        # Set by reload() to restart discover()'s scans with new service_uuids
+        self.rescan = asyncio.Event()
+        # ConnectionManager.supervise() task per battery MAC
+        self.supervise_tasks: Dict[str, asyncio.Task] = {}
+        self.event_stats = False
 
-        self.prom_stats = {
-            "battery_voltage": Gauge(
-                f"{self.stat_preifx}battery_voltage",
-                "Current volts of the battery",
-                registry=self.prom_registry,
-            ),
-            "cell_1_voltage": Gauge(
-                f"{self.stat_preifx}cell_1_voltage",
-                "Battery Cell 1 Voltage",
-                registry=self.prom_registry,
-            ),
-            "cell_2_voltage": Gauge(
-                f"{self.stat_preifx}cell_2_voltage",
-                "Battery Cell 2 Voltage",
-                registry=self.prom_registry,
-            ),
-            "cell_3_voltage": Gauge(
-                f"{self.stat_preifx}cell_3_voltage",
-                "Battery Cell 3 Voltage",
-                registry=self.prom_registry,
-            ),
-            "cell_4_voltage": Gauge(
-                f"{self.stat_preifx}cell_4_voltage",
-                "Battery Cell 4 Voltage",
-                registry=self.prom_registry,
-            ),
-            "bms_temperature": Gauge(
-                f"{self.stat_preifx}bms_temperature",
-                "The temperature of the BMS",
-                registry=self.prom_registry,
-            ),
-            "battery_temperature": Gauge(
-                f"{self.stat_preifx}battery_temperature",
-                "Battery temperature - Remember won't charge if to cold/hot",
-                registry=self.prom_registry,
-            ),
-            "battery_power": Gauge(
-                f"{self.stat_preifx}battery_power",
-                "Battery current power charge or draw",
-                registry=self.prom_registry,
-            ),
-            "battery_soc": Gauge(
-                f"{self.stat_preifx}battery_soc",
-                "Percentage of battery charge left",
-                registry=self.prom_registry,
-            ),
-            "fault_code": Gauge(
-                f"{self.stat_preifx}fault_code",
-                "Type of Battery fault (Hex converted to int)",
-                registry=self.prom_registry,
-            ),
+        self.prom_stats = LI3_DECODER.gauges(self.prom_registry, self.stat_preifx)
+
+        self.metrics = vand_metrics(self.prom_registry)
+        self.dashboard = dashboard(self.prom_registry)
+        self.dashboard_callback = self.dashboard.sample_callback("li3")
+        self.history = history_store(self.prom_registry)
+        self.alerts = alert_engine(self.prom_registry)
+        self.alerts_callback = self.alerts.sample_callback("li3")
+        self.metrics.collectors.append(self.collect_metrics)
+
+        # Energy counters, cell imbalance + time to empty from every sample
+        self.derived: Optional[DerivedMetrics] = None
+        derived_conf = self.config.get("vanD", {}).get("derived_metrics")
+        if derived_conf is not None:
+            self.derived = DerivedMetrics(
+                self.prom_registry, self.stat_preifx, **derived_conf
+            )
+            self.metrics.collectors.append(self.derived.collect)
+
+        # Last seen + sample age - drops the series of batteries gone silent
+        self.staleness = StalenessTracker(
+            self.prom_registry,
+            self.stat_preifx,
+            **self.config.get("vanD", {}).get("staleness", {}),
+        )
+
+        self.connection_manager = ConnectionManager(
+            self.prom_registry,
+            self.stat_preifx,
+            **self.config.get("vanD", {}).get("ble_connections", {}),
+        )
+
+        # Windowed aggregates of every sample
+        self.aggregator: Optional[StatsAggregator] = None
+        if aggregate_windows:
+            self.aggregator = StatsAggregator(
+                Li3TelemetryStats,
+                self.stat_preifx,
+                self.prom_registry,
+                aggregate_windows,
+            )
+
+    def _new_battery(self, settings: Dict[str, Any]) -> Li3Battery:
+        settings = dict(settings)
+        adapter = settings.pop("adapter", None)
+        battery = Li3Battery(**settings)
+        battery.gatt_cache = self.gatt_cache
+        battery.adapter_pool = self.adapter_pool
+        battery.adapter = adapter
+        return battery
+
+    def _detection_callback(
+        self, device: BLEDevice, advertisement_data: AdvertisementData
+    ) -> None:
+        battery = self.batteries_by_mac.get(device.address.upper())
+        if battery is None:
+            return
+
+        battery.bleak_device = device
+        battery.bleak_devices[details_adapter(device.details)] = device
+        if not battery.seen.is_set():
+            LOG.info(f"Discovered {battery.dev_name} ({device.address})")
+            self._set_seen(battery)
+
+    def _set_seen(self, battery: Li3Battery) -> None:
+        battery.seen.set()
+        if all(b.seen.is_set() for b in self.batteries):
+            self.all_seen.set()
+
+    def _add_stats_callbacks(self, battery: Li3Battery) -> None:
+        # First so alerts aren't delayed by any other callback
+        if self.alerts.rules:
+            battery.stats_callbacks.append(self.alerts_callback)
+        if self.aggregator:
+            battery.stats_callbacks.append(self.aggregator.add_sample)
+        if self.derived:
+            battery.stats_callbacks.append(self.derived.add_sample)
+        if self.event_stats:
+            battery.stats_callbacks.append(self.update_prom_stats)
+        battery.stats_callbacks.append(self.history.add_sample)
+        battery.stats_callbacks.append(self.dashboard_callback)
+        # Last so it includes every other callback
+        battery.stats_callbacks.append(self.observe_latency)
+
+    def _start_supervising(self, battery: Li3Battery) -> None:
+        self.supervise_tasks[battery.mac_address.upper()] = asyncio.create_task(
+            self.connection_manager.supervise(battery)
+        )
+
+    async def _stop_supervising(self, battery: Li3Battery) -> None:
+        """Cancel the battery's supervise() - which stops notify + disconnects"""
+        task = self.supervise_tasks.pop(battery.mac_address.upper(), None)
+        if task is None:
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def supervise_batteries(self) -> None:
+        """Supervise every battery's BLE session - reload() adds + removes them"""
+        for battery in self.batteries:
+            self._start_supervising(battery)
+        try:
+            await asyncio.Future()
+        finally:
+            tasks = list(self.supervise_tasks.values())
+            self.supervise_tasks.clear()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def reload(self, conf: Dict[str, Any]) -> None:
+        """Diff conf's li3 section - only (dis)connecting batteries that changed"""
+        wanted = {
+            settings["mac_address"].upper(): settings
+            for settings in conf.get("li3", {}).values()
         }
+        service_uuids = {b.service_uuid for b in self.batteries}
+
+        for mac_address, battery in list(self.batteries_by_mac.items()):
+            settings = wanted.get(mac_address)
+            if (
+                settings is None
+                or settings["service_uuid"] != battery.service_uuid
+                or settings["characteristic"] != battery.characteristic
+            ):
+                LOG.info(f"Removing {battery.dev_name} ({battery.mac_address})")
+                await self._stop_supervising(battery)
+                self.batteries.remove(battery)
+                del self.batteries_by_mac[mac_address]
+                self.published_stats.pop(battery.mac_address, None)
+                if self.aggregator:
+                    self.aggregator.device_windows.pop(battery.mac_address, None)
+                self.history.remove(battery.mac_address)
+                self.alerts.remove(battery.mac_address)
+                self.dashboard.remove(battery.mac_address)
+                if self.derived:
+                    self.derived.remove(battery.mac_address)
+                self.staleness.remove(battery.mac_address)
+                remove_series(self.prom_registry, {"mac_address": battery.mac_address})
+            elif settings["dev_name"] != battery.dev_name:
+                LOG.info(f"Renaming {battery.dev_name} to {settings['dev_name']}")
+                relabel_series(
+                    self.prom_registry,
+                    {"mac_address": battery.mac_address},
+                    {"dev_name": settings["dev_name"]},
+                )
+                battery.dev_name = settings["dev_name"]
+                # Shared with the ConnectionManager so update in place
+                battery.prom_labels["dev_name"] = settings["dev_name"]
+                if self.aggregator:
+                    self.aggregator.device_windows.pop(battery.mac_address, None)
+            if settings is not None:
+                battery.timeout = settings["timeout"]
+                # Used from the next connect
+                battery.adapter = settings.get("adapter")
+
+        for mac_address, settings in wanted.items():
+            if mac_address in self.batteries_by_mac:
+                continue
+            LOG.info(f"Adding {settings['dev_name']} ({settings['mac_address']})")
+            battery = self._new_battery(settings)
+            self._add_stats_callbacks(battery)
+            self.batteries.append(battery)
+            self.batteries_by_mac[mac_address] = battery
+            self._start_supervising(battery)
+
+        self.config = conf
+        if service_uuids != {b.service_uuid for b in self.batteries}:
+            self.rescan.set()
+
+    async def _discover_on(self, adapter: str, retry_interval: float) -> None:
+        service_uuids = {b.service_uuid for b in self.batteries}
+        while True:
+            try:
+                async with get_backend().scanner(
+                    self._detection_callback,
+                    service_uuids=list(service_uuids),
+                    adapter=adapter,
+                ):
+                    await asyncio.Future()
+            except BleakError as be:
+                LOG.error(
+                    f"BLE discovery on {adapter} failed: {be} - retrying in "
+                    + f"{retry_interval}s"
+                )
+                await asyncio.sleep(retry_interval)
+
+    async def discover(self, retry_interval: float = 10.0) -> None:
+        """Scan for the life of the daemon so late or returning batteries get seen
+
+        Every adapter scans so connects can go through any that sees the battery.
+        The scans restart in here when reload() sets rescan - so the Supervisor
+        keeps owning this one task."""
+        while True:
+            self.rescan.clear()
+            scans = asyncio.gather(
+                *(
+                    self._discover_on(adapter, retry_interval)
+                    for adapter in self.adapter_pool.adapters
+                )
+            )
+            rescan = asyncio.ensure_future(self.rescan.wait())
+            try:
+                await asyncio.wait((scans, rescan), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                scans.cancel()
+                rescan.cancel()
+                await asyncio.gather(scans, rescan, return_exceptions=True)
+            if not self.rescan.is_set():
+                # A scan crashed - for the Supervisor to restart us
+                scans.result()
+            LOG.info("Restarting BLE discovery for changed service_uuids")
 
     async def scan_devices(self, scan_time: float) -> None:
+        """Discover for at most scan_time or until every battery is seen
+
+        get_awaitables()' discover() then scans for the life of the daemon"""
         service_uuids = {b.service_uuid for b in self.batteries}
         LOG.info(f"Scanning for BLE Batteries with service_uuids {service_uuids}")
-        scanner = BleakScanner(service_uuids=list(service_uuids))
-        discovered_devices = await scanner.discover(timeout=scan_time)
-        found_devs = 0
-        for dd in discovered_devices:
-            for b in self.batteries:
-                if dd.address == b.mac_address:
-                    b.bleak_device = dd
-                    found_devs += 1
-                    continue
+        for battery in self.batteries:
+            # Connect straight away - a failed connect waits for discovery
+            if battery.cached_gatt():
+                LOG.info(f"Using cached GATT details for {battery.dev_name}")
+                self._set_seen(battery)
+        discovery = asyncio.create_task(self.discover())
+        try:
+            await asyncio.wait_for(self.all_seen.wait(), timeout=scan_time)
+        except asyncio.TimeoutError:
+            missing = [b.dev_name for b in self.batteries if not b.seen.is_set()]
+            LOG.warning(f"Still looking for {missing} in the background")
+        finally:
+            discovery.cancel()
+            await asyncio.gather(discovery, return_exceptions=True)
+        found_devs = sum(b.seen.is_set() for b in self.batteries)
         LOG.info(f"Found {found_devs} BLE Batteries with service_uuids {service_uuids}")
 
+    def refresh_prom_stats(self) -> None:
+        """Set every gauge from every device's latest stats"""
+        for battery in self.batteries:
+            if not battery.stats:
+                LOG.error(f"{battery.dev_name} does not have valid stats ... skipping.")
+                continue
+            if not self.staleness.fresh(battery):
+                continue
+
+            for stat_name, prom_metric in self.prom_stats.items():
+                prom_metric.set(battery.prom_labels, getattr(battery.stats, stat_name))
+            if self.derived:
+                self.derived.publish(battery)
+            LOG.debug(f"Updated {battery.dev_name} stats")
+
     async def stats_refresh(self, refresh_interval: float) -> None:
         while True:
-            stat_collect_start_time = time()
-            for battery in self.batteries:
-                if not battery.stats:
-                    LOG.error(
-                        f"{battery.dev_name} does not have valid stats ... skipping."
-                    )
-                    continue
-
-                for stat_name, prom_metric in self.prom_stats.items():
-                    prom_metric.set(
-                        {
-                            "dev_name": battery.dev_name,
-                            "mac_address": battery.mac_address,
-                            "characteristic": battery.characteristic,
-                            "service_uuid": battery.service_uuid,
-                        },
-                        getattr(battery.stats, stat_name),
-                    )
-                LOG.info(f"Updated {battery.dev_name} stats")
-            run_time = time() - stat_collect_start_time
+            stat_collect_start_time = perf_counter()
+            self.refresh_prom_stats()
+            run_time = perf_counter() - stat_collect_start_time
+            self.metrics.histograms["stats_refresh_duration"].observe(
+                {"module": "li3"}, run_time
+            )
             sleep_time = (
                 refresh_interval - run_time if run_time < refresh_interval else 0
             )
-            LOG.info(
+            LOG.debug(
                 f"{RevelBatteries.__name__} has refreshed prometheus stats in {run_time}s. "
                 + f"Sleeping for {sleep_time}s"
             )
             await asyncio.sleep(sleep_time)
 
-    async def get_awaitables(self, refresh_interval: float) -> Sequence[Awaitable[Any]]:
-        coros = [self.stats_refresh(refresh_interval)]
-        coros.extend([b.listen() for b in self.batteries])
+    def _expire(self, battery: Li3Battery) -> None:
+        """Free a silent battery's samples + wait for discovery to see it again"""
+        self.published_stats.pop(battery.mac_address, None)
+        if self.aggregator:
+            self.aggregator.device_windows.pop(battery.mac_address, None)
+        if self.derived:
+            self.derived.evict(battery.mac_address)
+        self.history.remove(battery.mac_address)
+        self.alerts.remove(battery.mac_address)
+        self.dashboard.remove(battery.mac_address)
+        battery.seen.clear()
+        self.all_seen.clear()
+
+    def collect_metrics(self) -> None:
+        """Copy frame parser counters into the vand_ metrics + expire silent batteries"""
+        for battery in self.staleness.check(self.batteries):
+            self._expire(battery)
+        for battery in self.batteries:
+            if not self.staleness.fresh(battery):
+                continue
+            for stat_name, count in (
+                ("frames_dropped", battery.parser.frames_partial),
+                ("frames_malformed", battery.parser.frames_malformed),
+                ("frames_parsed", battery.parser.frames_parsed),
+            ):
+                self.metrics.prom_stats[stat_name].set(battery.prom_labels, count)
+
+    def observe_latency(self, battery: Li3Battery) -> None:
+        self.metrics.observe_latency("li3", battery.notification_received)
+
+    def update_prom_stats(self, battery: Li3Battery) -> None:
+        """Set only the gauges whose value changed since we last published"""
+        if not battery.stats:
+            return
+
+        previous = self.published_stats.get(battery.mac_address)
+        for stat_name, prom_metric in self.prom_stats.items():
+            value = getattr(battery.stats, stat_name)
+            if previous is None or getattr(previous, stat_name) != value:
+                prom_metric.set(battery.prom_labels, value)
+        self.published_stats[battery.mac_address] = battery.stats
+        if self.derived:
+            self.derived.publish(battery)
+
+    async def get_awaitables(
+        self, refresh_interval: float, event_stats: bool = False
+    ) -> Sequence[Awaitable[Any]]:
+        coros: List[Awaitable[Any]] = [Restartable(self.discover, name="li3_discovery")]
+        self.event_stats = event_stats
+        if not event_stats:
+            coros.append(Restartable(partial(self.stats_refresh, refresh_interval)))
+        if self.derived:
+            coros.append(Restartable(self.derived.run))
+        for b in self.batteries:
+            self._add_stats_callbacks(b)
+        coros.append(Restartable(self.supervise_batteries))
         return coros
+
+
+async def load_module(
+    conf: Dict[str, Any], prom_registry: Registry
+) -> Sequence[Awaitable[Any]]:
+    """vand.modules entry point: Monitor Li3 Batteries"""
+    rb = RevelBatteries(
+        conf, prom_registry, aggregate_windows=conf["vanD"].get("aggregate_windows", [])
+    )
+    await rb.scan_devices(conf["vanD"]["scan_time"])
+    config_reloader(prom_registry).handlers.append(rb.reload)
+    return await rb.get_awaitables(
+        conf["vanD"]["statistics_refresh_interval"],
+        conf["vanD"].get("stats_update_mode", "poll") == "event",
+    )
@@ -3,18 +3,45 @@
 import asyncio
 import json
 import logging
+import signal
+from functools import partial
+from importlib.metadata import entry_points, EntryPoint
 from pathlib import Path
-from typing import Any, Awaitable, Dict, List, Tuple, Union
+from time import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+    Union,
+)
 
 import click
 from aioprometheus.collectors import Registry
 from aioprometheus.service import Service
 
-from vand.govee import Hygrometers
-from vand.li3 import RevelBatteries
+from vand.supervisor import Restartable, Supervisor
+
+if TYPE_CHECKING:  # pragma: no cover
+    from vand.remote_write import SampleSource
 
 
 LOG = logging.getLogger(__name__)
+# Modules are async callables taking (config, registry) returning awaitables to run
+# They're only imported if their config key is present
+MODULE_ENTRY_POINT_GROUP = "vand.modules"
+# Cleanly stop on systemd's SIGTERM or a ctrl-c
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+BUILTIN_MODULES = {
+    "HS075S": "vand.govee:load_module",
+    "li3": "vand.li3:load_module",
+}
+ModuleLoader = Callable[[Dict[str, Any], Registry], Awaitable[Sequence[Awaitable]]]
 
 
 def _handle_debug(
@@ -45,39 +72,201 @@ def _load_config(conf_path: Path) -> Dict:
         return dict(json.load(cfp))
 
 
-async def _load_modules(
-    conf: Dict[str, Any]
+def _module_entry_points() -> Dict[str, EntryPoint]:
+    """Builtin modules overridden by any installed vand.modules entry points"""
+    modules = {
+        name: EntryPoint(name, value, MODULE_ENTRY_POINT_GROUP)
+        for name, value in BUILTIN_MODULES.items()
+    }
+    for ep in entry_points(group=MODULE_ENTRY_POINT_GROUP):
+        modules[ep.name] = ep
+    return modules
+
+
+def _import_modules(conf: Dict[str, Any]) -> Dict[str, ModuleLoader]:
+    """Only import modules that are configured"""
+    module_loaders: Dict[str, ModuleLoader] = {}
+    module_entry_points = _module_entry_points()
+    for name in conf.keys():
+        if name == "vanD":
+            continue
+        if name not in module_entry_points:
+            LOG.debug(f"No vanD module registered for {name} config - ignoring")
+            continue
+
+        import_start_time = time()
+        module_loaders[name] = module_entry_points[name].load()
+        LOG.info(
+            f"Imported {name} module ({module_entry_points[name].value}) in "
+            + f"{time() - import_start_time:.3f}s"
+        )
+    return module_loaders
+
+
+async def _init_module(
+    name: str,
+    module_loader: ModuleLoader,
+    conf: Dict[str, Any],
+    prom_registry: Registry,
+) -> Sequence[Awaitable]:
+    init_start_time = time()
+    coros = await module_loader(conf, prom_registry)
+    LOG.info(
+        f"Initialized {name} module in {time() - init_start_time:.3f}s "
+        + f"with {len(coros)} awaitables"
+    )
+    return coros
+
+
+def _load_sample_forwarding(
+    conf: Dict[str, Any], prom_registry: Registry
 ) -> Tuple[List[Awaitable], List[Awaitable]]:
     cleanup_coros: List[Awaitable] = []
     main_coros: List[Awaitable] = []
-    no_modules = True
-    prom_registry = Registry()
 
-    # Monitor HS0755 Hygrometers if configured
-    if "HS075S" in conf.keys():
-        h = Hygrometers(conf["HS075S"], prom_registry)
-        main_coros.extend(
-            await h.get_awaitables(conf["vanD"]["statistics_refresh_interval"])
+    # Buffer samples on disk for when we have no connectivity
+    sample_source: Optional["SampleSource"] = None
+    if "sample_buffer" in conf["vanD"]:
+        from vand.sample_buffer import SampleBuffer
+
+        sample_buffer = SampleBuffer(**conf["vanD"]["sample_buffer"])
+        main_coros.append(
+            Restartable(
+                partial(
+                    sample_buffer.run,
+                    prom_registry,
+                    conf["vanD"]["statistics_refresh_interval"],
+                )
+            )
         )
-        LOG.info("Loaded HS0755 awaitables ...")
-        no_modules = False
-
-    # Monitor Li3 Batteries if configured
-    if "li3" in conf.keys():
-        rb = RevelBatteries(conf, prom_registry)
-        await rb.scan_devices(conf["vanD"]["scan_time"])
-        main_coros.extend(
-            await rb.get_awaitables(conf["vanD"]["statistics_refresh_interval"])
+        cleanup_coros.append(sample_buffer.close())
+        sample_source = sample_buffer
+
+    # Push samples to a remote_write endpoint - drains sample_buffer if configured
+    if "remote_write" in conf["vanD"]:
+        from vand.remote_write import RemoteWriteClient, SampleQueue
+
+        remote_write_conf = dict(conf["vanD"]["remote_write"])
+        max_queue = remote_write_conf.pop("max_queue", 100000)
+        if sample_source is None:
+            sample_queue = SampleQueue(max_queue)
+            main_coros.append(
+                Restartable(
+                    partial(
+                        sample_queue.run,
+                        prom_registry,
+                        conf["vanD"]["statistics_refresh_interval"],
+                    )
+                )
+            )
+            sample_source = sample_queue
+        remote_write = RemoteWriteClient(
+            source=sample_source, registry=prom_registry, **remote_write_conf
         )
-        LOG.info("Loaded li3 awaitables ...")
-        no_modules = False
+        main_coros.append(Restartable(remote_write.run))
+
+    return main_coros, cleanup_coros
+
+
+async def _load_modules(
+    conf: Dict[str, Any],
+    config_path: Optional[Path] = None,
+    prom_registry: Optional[Registry] = None,
+) -> Tuple[List[Awaitable], List[Awaitable]]:
+    cleanup_coros: List[Awaitable] = []
+    main_coros: List[Awaitable] = []
+    prom_registry = prom_registry or Registry()
+
+    # Point modules at fake, replayed or recorded radios - e.g. for load testing
+    if "ble_backend" in conf["vanD"]:
+        from vand.replay import configure_backend
+
+        main_coros, cleanup_coros = configure_backend(conf)
+
+    module_loaders = _import_modules(conf)
+
+    # HCI adapters to spread BLE connections + scanning across
+    if "adapters" in conf["vanD"]:
+        from vand.adapters import adapter_pool
+
+        adapter_pool(prom_registry).configure(conf["vanD"]["adapters"])
+
+    # Memory budget for recent samples kept for local consumers - e.g. the dashboard
+    if "history" in conf["vanD"]:
+        from vand.history import history_store
+
+        history_store(prom_registry).configure(**conf["vanD"]["history"])
+
+    # Alert rules evaluated as samples arrive + the queue feeding their sinks
+    if "alerts" in conf["vanD"]:
+        from vand.alerts import alert_engine
+
+        alert_engine(prom_registry).configure(**conf["vanD"]["alerts"])
+        main_coros.append(Restartable(alert_engine(prom_registry).run))
+
+    # Initialize all modules concurrently - e.g. scanning for BLE devices
+    for coros in await asyncio.gather(
+        *[
+            _init_module(name, module_loader, conf, prom_registry)
+            for name, module_loader in module_loaders.items()
+        ]
+    ):
+        main_coros.extend(coros)
 
     # Hack for developing locally to block exiting
-    if no_modules:
+    if not module_loaders:
         main_coros.append(_blocking_coro())
 
-    # Start prometheus server
+    # Reload module config on SIGHUP
+    if config_path:
+        from vand.reload import config_reloader
+
+        main_coros.append(
+            Restartable(
+                partial(
+                    config_reloader(prom_registry).watch,
+                    partial(_load_config, config_path),
+                )
+            )
+        )
+
+    # vanD's own health metrics - e.g. event loop lag
+    from vand.instrumentation import vand_metrics
+
+    main_coros.append(
+        Restartable(
+            partial(
+                vand_metrics(prom_registry).run,
+                conf["vanD"].get("metrics_probe_interval", 1.0),
+            )
+        )
+    )
+
+    # On box dashboard for when we have no uplink to reach Grafana
+    if "web_port" in conf["vanD"]:
+        from vand.dashboard import dashboard
+
+        main_coros.append(
+            Restartable(
+                partial(
+                    dashboard(prom_registry).run,
+                    conf["vanD"]["web_port"],
+                    **conf["vanD"].get("dashboard", {}),
+                )
+            )
+        )
+
+    # Store and forward samples for when we have no connectivity
+    forward_coros, forward_cleanup_coros = _load_sample_forwarding(conf, prom_registry)
+    main_coros.extend(forward_coros)
+    cleanup_coros.extend(forward_cleanup_coros)
+
+    # Start prometheus server - optionally only re-rendering what changed
     prom_service = Service(registry=prom_registry)
+    if "exporter_cache" in conf["vanD"]:
+        from vand.exposition import CachedService
+
+        prom_service = CachedService(prom_registry, **conf["vanD"]["exporter_cache"])
     main_coros.append(prom_service.start(port=conf["vanD"]["prometheus_exporter_port"]))
     cleanup_coros.append(prom_service.stop())
 
@@ -95,12 +284,49 @@ async def async_main(
     conf = _load_config(Path(config_path))
     if not conf:
         return 1
-    main_coros, cleanup_coros = await _load_modules(conf)
-    # TODO: Handle cleanup and exiting cleanly from signals - e.g. SIGTERM
+    prom_registry = Registry()
+    main_coros, cleanup_coros = await _load_modules(
+        conf, Path(config_path), prom_registry
+    )
+    shutdown_timeout = conf["vanD"].get("shutdown_timeout", 10.0)
+
+    # Restart crashed tasks while the rest keep running
+    supervisor = Supervisor(prom_registry, **conf["vanD"].get("supervisor", {}))
+    supervisor.add(main_coros)
+
+    loop = asyncio.get_running_loop()
+    stop_requested = asyncio.Event()
+    for signum in STOP_SIGNALS:
+        loop.add_signal_handler(signum, stop_requested.set)
+    main_task: "asyncio.Future[Any]" = asyncio.ensure_future(supervisor.run())
+    stop_task: "asyncio.Future[Any]" = asyncio.ensure_future(stop_requested.wait())
     try:
-        await asyncio.gather(*main_coros)
+        await asyncio.wait([main_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+        if stop_requested.is_set():
+            LOG.info(f"Asked to stop - stopping within {shutdown_timeout}s")
+        else:
+            main_task.result()
     finally:
-        await asyncio.gather(*cleanup_coros)
+        for signum in STOP_SIGNALS:
+            loop.remove_signal_handler(signum)
+        stop_task.cancel()
+        # Cancelled tasks clean up - e.g. stop BLE notifies + disconnect
+        shutdown_start_time = time()
+        main_task.cancel()
+        await asyncio.wait({main_task}, timeout=shutdown_timeout)
+        if not main_task.done():
+            LOG.error(f"Tasks did not stop within {shutdown_timeout}s")
+        elif main_task.cancelled() or isinstance(
+            main_task.exception(), asyncio.CancelledError
+        ):
+            LOG.debug("All tasks cancelled")
+        remaining_time = shutdown_timeout - (time() - shutdown_start_time)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*cleanup_coros), timeout=max(remaining_time, 0.1)
+            )
+        except asyncio.TimeoutError:
+            LOG.error(f"Cleanup did not finish within {shutdown_timeout}s")
     return 0
 
 
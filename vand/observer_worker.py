@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+
+"""bleson observer in its own (privileged) process feeding a shared memory ring
+
+The daemon creates the ring and runs `python -m vand.observer_worker` (or a
+configured command - e.g. via sudo) which observes advertisements from the
+MAC addresses it's sent on stdin. The worker drops advertisements without
+the service UUID16 and repeats of the last reading, decodes the rest with
+the module's FrameDecoder and writes fixed size samples to the ring. The
+daemon drains samples in batches on its event loop, so bleson's thread
+never contends for the daemon's GIL, the loop's work scales with new
+readings not advertisement volume and only the worker needs raw HCI
+sockets."""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import mmap
+import os
+import select
+import struct
+import sys
+import tempfile
+from dataclasses import fields
+from operator import attrgetter
+from pathlib import Path
+from time import monotonic, perf_counter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from bleson import get_provider, Observer
+
+from vand.decoders import ARRAY_TYPECODES, FrameDecoder
+
+LOG = logging.getLogger(__name__)
+# write index, read index, samples dropped as the ring was full,
+# advertisements without the service UUID16 or undecodable
+RING_HEADER = struct.Struct("<QQQQ")
+RING_HEADER_SIZE = 64
+# sequence (index + 1), monotonic() received, MAC then the decoded stats fields
+RING_SAMPLE_PREFIX = "<Qd6s"
+SampleHandler = Callable[[Any], None]
+
+
+def load_decoder(path: str) -> FrameDecoder:
+    """module:attribute of a FrameDecoder - e.g. vand.govee:HS075S_DECODER"""
+    module, _, attribute = path.partition(":")
+    decoder: FrameDecoder = getattr(importlib.import_module(module), attribute)
+    return decoder
+
+
+def sample_record(decoder: FrameDecoder) -> struct.Struct:
+    """A ring record - each stats field (in stats class order) as a float64 / int64"""
+    types = {f.name: f.type for f in decoder.fields}
+    return struct.Struct(
+        RING_SAMPLE_PREFIX
+        + "".join(ARRAY_TYPECODES[types[f.name]] for f in fields(decoder.stats_class))
+    )
+
+
+class SampleRing:
+    """Single producer / single consumer ring of decoded samples in a mmap'd file
+
+    The worker only writes the write index + its counters and the daemon only
+    writes the read index, so neither needs a lock. A record's sequence is
+    written with it so a half written record is never read."""
+
+    def __init__(
+        self, path: Path, slots: int, record: struct.Struct, create: bool = False
+    ) -> None:
+        self.path = path
+        self.slots = slots
+        self.record = record
+        size = RING_HEADER_SIZE + slots * record.size
+        fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o600)
+        try:
+            if create:
+                os.ftruncate(fd, size)
+            self.mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    @classmethod
+    def create(cls, slots: int, record: struct.Struct) -> "SampleRing":
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, path = tempfile.mkstemp(prefix="vand-observer-", dir=shm_dir)
+        os.close(fd)
+        return cls(Path(path), slots, record, create=True)
+
+    def close(self, unlink: bool = False) -> None:
+        self.mmap.close()
+        if unlink:
+            self.path.unlink(missing_ok=True)
+
+    @property
+    def dropped(self) -> int:
+        return int(RING_HEADER.unpack_from(self.mmap)[2])
+
+    @property
+    def ignored(self) -> int:
+        return int(RING_HEADER.unpack_from(self.mmap)[3])
+
+    def count_ignored(self) -> None:
+        """Producer side"""
+        ignored = RING_HEADER.unpack_from(self.mmap)[3]
+        struct.pack_into("<Q", self.mmap, 24, ignored + 1)
+
+    def push(self, mac_address: bytes, received: float, values: Tuple) -> bool:
+        """Producer side - False (and counted) if the ring is full"""
+        write_idx, read_idx, dropped, _ = RING_HEADER.unpack_from(self.mmap)
+        if write_idx - read_idx >= self.slots:
+            struct.pack_into("<Q", self.mmap, 16, dropped + 1)
+            return False
+        self.record.pack_into(
+            self.mmap,
+            RING_HEADER_SIZE + (write_idx % self.slots) * self.record.size,
+            write_idx + 1,
+            received,
+            mac_address,
+            *values,
+        )
+        # Only the write index - the daemon owns the read index
+        struct.pack_into("<Q", self.mmap, 0, write_idx + 1)
+        return True
+
+    def drain(self, max_records: int) -> List[Tuple[Any, ...]]:
+        """Consumer side - up to max_records (sequence, received, MAC, *values)"""
+        write_idx, read_idx, _, _ = RING_HEADER.unpack_from(self.mmap)
+        records: List[Tuple[Any, ...]] = []
+        while read_idx < write_idx and len(records) < max_records:
+            record = self.record.unpack_from(
+                self.mmap, RING_HEADER_SIZE + (read_idx % self.slots) * self.record.size
+            )
+            if record[0] != read_idx + 1:
+                break
+            records.append(record)
+            read_idx += 1
+        struct.pack_into("<Q", self.mmap, 8, read_idx)
+        return records
+
+
+class SampleWriter:
+    """Worker side - filter, deduplicate + decode advertisements into the ring
+
+    Like HS075S.process_data: a repeat of a MAC's last manufacturer data is
+    only written if its RSSI changed."""
+
+    def __init__(
+        self, ring: SampleRing, decoder: FrameDecoder, service_uuid16: int
+    ) -> None:
+        self.ring = ring
+        self.decode = decoder.decode
+        self.service_uuid16 = service_uuid16
+        self.get_values = attrgetter(*(f.name for f in fields(decoder.stats_class)))
+        # Swapped whole so bleson's thread never sees a half updated set
+        self.allowed: FrozenSet[bytes] = frozenset()
+        # MAC -> (manufacturer data, RSSI) last written
+        self.last: Dict[bytes, Tuple[bytes, int]] = {}
+
+    def forget(self, mac_address: bytes) -> None:
+        """Write the MAC's next advertisement even if it repeats the last one"""
+        self.last.pop(mac_address, None)
+
+    def write(
+        self,
+        mac_address: bytes,
+        rssi: int,
+        uuid16s: Iterable[int],
+        mfg_data: bytes,
+        received: float,
+    ) -> bool:
+        if mac_address not in self.allowed:
+            return False
+        if self.service_uuid16 not in uuid16s:
+            self.ring.count_ignored()
+            return False
+        if self.last.get(mac_address) == (mfg_data, rssi):
+            return False
+        try:
+            stats = self.decode(mfg_data, rssi)
+        except struct.error:
+            self.ring.count_ignored()
+            return False
+        self.last[mac_address] = (mfg_data, rssi)
+        return self.ring.push(mac_address, received, self.get_values(stats))
+
+
+class ObserverProcess:
+    """Run and restart the observer worker + hand its samples to handlers
+
+    handlers is the AdvertisementScanner's MAC -> sample handler dict (called
+    with a decoder stats_class instance) - send_allowlist() after changing
+    it so the worker filters on the new set."""
+
+    def __init__(
+        self,
+        handlers: Dict[str, SampleHandler],
+        on_dispatch: Callable[[float], None],
+        decoder: str,
+        service_uuid16: int,
+        command: Optional[List[str]] = None,
+        ring_slots: int = 4096,
+        drain_interval: float = 0.05,
+        max_batch: int = 1024,
+        restart_delay: float = 1.0,
+    ) -> None:
+        self.handlers = handlers
+        # Called with each dispatched sample's perf_counter() received time
+        self.on_dispatch = on_dispatch
+        # module:attribute of the FrameDecoder the worker decodes with
+        self.decoder = decoder
+        frame_decoder = load_decoder(decoder)
+        self.stats_class = frame_decoder.stats_class
+        self.record = sample_record(frame_decoder)
+        self.service_uuid16 = service_uuid16
+        self.command = command or [sys.executable, "-m", "vand.observer_worker"]
+        self.ring_slots = ring_slots
+        self.drain_interval = drain_interval
+        self.max_batch = max_batch
+        self.restart_delay = restart_delay
+        self.ring: Optional[SampleRing] = None
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.restarts = 0
+        self._mac_addresses: Dict[bytes, str] = {}
+
+    def send(self, command: Dict[str, Any]) -> None:
+        if self.process and self.process.stdin and self.process.returncode is None:
+            self.process.stdin.write(json.dumps(command).encode() + b"\n")
+
+    def send_allowlist(self) -> None:
+        self.send({"mac_addresses": sorted(self.handlers)})
+
+    def forget(self, mac_address: str) -> None:
+        """Have the worker send the MAC's next reading even if it's a repeat"""
+        self.send({"forget": mac_address})
+
+    def drain(self) -> int:
+        """Dispatch a batch of samples from the ring - returns how many were read"""
+        if self.ring is None:
+            return 0
+        records = self.ring.drain(self.max_batch)
+        # monotonic() is system wide - latency is measured in perf_counter()
+        clock_offset = perf_counter() - monotonic()
+        stats_class = self.stats_class
+        for record in records:
+            mac_address = self._mac_address(record[2])
+            handler = self.handlers.get(mac_address)
+            if handler is None:
+                continue
+            handler(stats_class(*record[3:]))
+            self.on_dispatch(record[1] + clock_offset)
+        return len(records)
+
+    def _mac_address(self, mac: bytes) -> str:
+        mac_address = self._mac_addresses.get(mac)
+        if mac_address is None:
+            mac_address = self._mac_addresses[mac] = mac.hex(":").upper()
+        return mac_address
+
+    async def _run_worker(self, adapter_id: int, scan_window: float) -> int:
+        assert self.ring is not None
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            "--ring",
+            str(self.ring.path),
+            "--slots",
+            str(self.ring_slots),
+            "--decoder",
+            self.decoder,
+            "--service-uuid16",
+            str(self.service_uuid16),
+            "--adapter",
+            str(adapter_id),
+            "--scan-window",
+            str(scan_window),
+            stdin=asyncio.subprocess.PIPE,
+        )
+        LOG.info(f"Started observer worker {self.process.pid} on hci{adapter_id}")
+        self.send_allowlist()
+        while self.process.returncode is None:
+            self.drain()
+            await asyncio.sleep(self.drain_interval)
+        # Whatever it wrote before exiting
+        while self.drain():
+            pass
+        return self.process.returncode
+
+    async def _stop_worker(self) -> None:
+        if self.process is None or self.process.returncode is not None:
+            return
+        if self.process.stdin:
+            # EOF on stdin asks the worker to stop
+            self.process.stdin.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout=2)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+    async def run(
+        self, select_adapter: Callable[[], int], scan_window: float = 2.0
+    ) -> None:
+        """Run the worker until cancelled - select_adapter is called each (re)start"""
+        self.ring = SampleRing.create(self.ring_slots, self.record)
+        try:
+            while True:
+                returncode = await self._run_worker(select_adapter(), scan_window)
+                self.restarts += 1
+                LOG.error(
+                    f"Observer worker exited with {returncode} - restarting in "
+                    + f"{self.restart_delay}s"
+                )
+                await asyncio.sleep(self.restart_delay)
+        finally:
+            await asyncio.shield(self._stop_worker())
+            self.ring.close(unlink=True)
+            self.ring = None
+
+
+def mac_bytes(mac_address: str) -> bytes:
+    return bytes.fromhex(mac_address.replace(":", ""))
+
+
+def _observe(
+    writer: SampleWriter, adapter_id: int, scan_window: float
+) -> None:  # pragma: no cover
+    """Worker main loop - needs a real HCI adapter"""
+
+    def on_advertising_data(advertisement: Any) -> None:
+        # Ran in bleson's HCI socket thread
+        writer.write(
+            mac_bytes(advertisement.address.address),
+            advertisement.rssi or 0,
+            [int(u.uuid) for u in advertisement.uuid16s],
+            bytes(advertisement.mfg_data or b""),
+            monotonic(),
+        )
+
+    observer = Observer(get_provider().get_adapter(adapter_id))
+    observer.on_advertising_data = on_advertising_data
+    observer.start()
+    try:
+        for command in commands(scan_window):
+            if command is None:
+                # Restart scanning each scan_window like AdvertisementScanner
+                observer.stop()
+                observer.start()
+            else:
+                run_command(writer, command)
+    finally:
+        observer.stop()
+
+
+def run_command(writer: SampleWriter, command: Dict[str, Any]) -> None:
+    if "mac_addresses" in command:
+        writer.allowed = frozenset(mac_bytes(m) for m in command["mac_addresses"])
+    if "forget" in command:
+        writer.forget(mac_bytes(command["forget"]))
+
+
+def commands(timeout: float) -> Iterable[Optional[Dict[str, Any]]]:
+    """stdin JSON commands - None each timeout without one - until EOF"""
+    while True:
+        readable, _, _ = select.select([sys.stdin], [], [], timeout)
+        if not readable:
+            yield None
+            continue
+        line = sys.stdin.readline()
+        if not line:
+            return
+        yield json.loads(line)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    cli = argparse.ArgumentParser(description=__doc__)
+    cli.add_argument("--ring", type=Path, required=True)
+    cli.add_argument("--slots", type=int, required=True)
+    cli.add_argument("--decoder", required=True, help="module:FrameDecoder")
+    cli.add_argument("--service-uuid16", type=int, required=True)
+    cli.add_argument("--adapter", type=int, default=0)
+    cli.add_argument("--scan-window", type=float, default=2.0)
+    return cli.parse_args(argv)
+
+
+def main() -> int:  # pragma: no cover
+    args = parse_args()
+    logging.basicConfig(format="[%(asctime)s] %(levelname)s: %(message)s")
+    decoder = load_decoder(args.decoder)
+    ring = SampleRing(args.ring, args.slots, sample_record(decoder))
+    try:
+        _observe(
+            SampleWriter(ring, decoder, args.service_uuid16),
+            args.adapter,
+            args.scan_window,
+        )
+    finally:
+        ring.close()
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
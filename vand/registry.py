@@ -0,0 +1,23 @@
+from functools import wraps
+from typing import Callable, TypeVar
+from weakref import WeakKeyDictionary
+
+from aioprometheus.collectors import Registry
+
+T = TypeVar("T")
+
+
+def per_registry(factory: Callable[[Registry], T]) -> Callable[[Registry], T]:
+    """Share the one object factory makes per Registry - created on first use
+
+    Keyed weakly so a Registry (e.g. a unit test's) takes its objects with it."""
+    instances: "WeakKeyDictionary[Registry, T]" = WeakKeyDictionary()
+
+    @wraps(factory)
+    def get(registry: Registry) -> T:
+        instance = instances.get(registry)
+        if instance is None:
+            instance = instances[registry] = factory(registry)
+        return instance
+
+    return get
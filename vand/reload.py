@@ -0,0 +1,98 @@
+import asyncio
+import json
+import logging
+import signal
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Tuple
+
+from aioprometheus.collectors import Collector, Registry
+
+from vand.registry import per_registry
+
+
+LOG = logging.getLogger(__name__)
+ReloadHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def _matching_series(
+    registry: Registry, labels: Dict[str, str]
+) -> Iterator[Tuple[Collector, bytes, Dict[str, Any]]]:
+    """Yield (collector, labels key, series labels) for series with all of labels"""
+    for collector in registry.get_all():
+        for labels_key in list(collector.values.store):
+            if labels_key == collector.values.EMPTY_KEY:
+                continue
+            series_labels = json.loads(labels_key)
+            if labels.items() <= series_labels.items():
+                yield collector, labels_key, series_labels
+
+
+def remove_series(registry: Registry, labels: Dict[str, str]) -> int:
+    """Drop every series of every metric labeled with (at least) labels"""
+    removed = 0
+    for collector, labels_key, _ in _matching_series(registry, labels):
+        del collector.values.store[labels_key]
+        removed += 1
+    return removed
+
+
+def relabel_series(
+    registry: Registry, labels: Dict[str, str], new_labels: Dict[str, str]
+) -> int:
+    """Move every series labeled with labels to new_labels keeping its value"""
+    relabeled = 0
+    for collector, labels_key, series_labels in _matching_series(registry, labels):
+        value = collector.values.store.pop(labels_key)
+        collector.values[{**series_labels, **new_labels}] = value
+        relabeled += 1
+    return relabeled
+
+
+class ConfigReloader:
+    """Re-read the config on SIGHUP and hand it to every module's reload handler
+
+    The prometheus Registry is all modules share, so they register with
+    config_reloader(registry).handlers.append(...) and are expected to diff
+    their section - only touching devices that changed."""
+
+    def __init__(self) -> None:
+        self.handlers: List[ReloadHandler] = []
+        self.reloads = 0
+
+    async def reload(self, conf: Dict[str, Any]) -> None:
+        for handler in self.handlers:
+            try:
+                await handler(conf)
+            except (KeyError, TypeError, ValueError) as e:
+                LOG.error(f"Failed to reload config with {handler}: {e}")
+        self.reloads += 1
+
+    async def watch(
+        self,
+        load_config: Callable[[], Dict[str, Any]],
+        signum: int = signal.SIGHUP,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        reload_requested = asyncio.Event()
+        loop.add_signal_handler(signum, reload_requested.set)
+        try:
+            while True:
+                await reload_requested.wait()
+                reload_requested.clear()
+                LOG.info(f"Got {signal.Signals(signum).name} - reloading config")
+                try:
+                    conf = load_config()
+                except ValueError as ve:
+                    LOG.error(f"Keeping the running config - bad config: {ve}")
+                    continue
+                if not conf:
+                    LOG.error("Keeping the running config - new config is empty")
+                    continue
+                await self.reload(conf)
+        finally:
+            loop.remove_signal_handler(signum)
+
+
+@per_registry
+def config_reloader(registry: Registry) -> ConfigReloader:
+    """The ConfigReloader for registry - created on first use"""
+    return ConfigReloader()
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import random
+import struct
+from collections import deque
+from itertools import islice
+from time import time
+from typing import Any, Deque, Dict, List, Optional, Protocol, Tuple
+
+import aiohttp
+import snappy  # Optional dependency - pip install vand[remote_write]
+from aioprometheus import Counter
+from aioprometheus.collectors import Registry
+
+from vand.sample_buffer import iter_registry, Sample, series_key_labels, SeriesKey
+
+
+LOG = logging.getLogger(__name__)
+USER_AGENT = "vanD"
+
+
+class SampleSource(Protocol):
+    def peek(self, limit: int) -> Tuple[int, List[Sample]]:
+        """First sequence number + the oldest unconsumed samples in order"""
+
+    def consume(self, start: int, count: int) -> None:
+        """Mark count samples from sequence number start as delivered"""
+
+    def series_labels(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """(metric name, labels) indexed by series id"""
+
+
+class SampleQueue:
+    """Bounded in memory SampleSource for when no SampleBuffer is configured
+
+    record_registry waits for room, so while we can't push, sampling backs
+    off instead of growing memory."""
+
+    def __init__(self, max_samples: int = 100000) -> None:
+        self.max_samples = max_samples
+        self.samples: Deque[Sample] = deque()
+        # Sequence number of samples[0]
+        self.tail = 0
+        self.series: Dict[SeriesKey, int] = {}
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def series_labels(self) -> List[Tuple[str, Dict[str, Any]]]:
+        series = sorted(self.series.items(), key=lambda s: s[1])
+        return [(key[0], series_key_labels(key)) for key, _ in series]
+
+    async def record_registry(
+        self, registry: Registry, timestamp: Optional[float] = None
+    ) -> int:
+        timestamp = timestamp or time()
+        batch = []
+        for series_key, value in iter_registry(registry):
+            series_id = self.series.get(series_key)
+            if series_id is None:
+                series_id = self.series[series_key] = len(self.series)
+            batch.append(Sample(timestamp, series_id, value))
+
+        while self.samples and len(self.samples) + len(batch) > self.max_samples:
+            self._has_room.clear()
+            await self._has_room.wait()
+        self.samples.extend(batch)
+        return len(batch)
+
+    def peek(self, limit: int) -> Tuple[int, List[Sample]]:
+        return self.tail, list(islice(self.samples, limit))
+
+    def consume(self, start: int, count: int) -> None:
+        for _ in range(min(start + count - self.tail, len(self.samples))):
+            self.samples.popleft()
+            self.tail += 1
+        self._has_room.set()
+
+    async def run(self, registry: Registry, sample_interval: float) -> None:
+        while True:
+            await self.record_registry(registry)
+            await asyncio.sleep(sample_interval)
+
+
+def _varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _length_delimited(field_number: int, data: bytes) -> bytes:
+    return _varint((field_number << 3) | 2) + _varint(len(data)) + data
+
+
+class RemoteWriteClient:
+    """Batch samples from a SampleSource and push them to a Prometheus remote_write URL
+
+    WriteRequest protobufs are hand encoded (the schema is tiny) and snappy
+    block compressed. One keep-alive connection is reused and a batch is
+    only consumed from the source once delivered, so a flaky link just means
+    retrying with exponential backoff + full jitter."""
+
+    SAMPLE_VALUE_TAG = b"\x09"  # field 1 - double
+    SAMPLE_TIMESTAMP_TAG = b"\x10"  # field 2 - int64 varint
+    DOUBLE = struct.Struct("<d")
+
+    def __init__(
+        self,
+        url: str,
+        source: SampleSource,
+        registry: Registry,
+        batch_size: int = 500,
+        push_interval: float = 15.0,
+        timeout: float = 10.0,
+        min_backoff: float = 0.5,
+        max_backoff: float = 300.0,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+    ) -> None:
+        self.url = url
+        self.source = source
+        self.batch_size = batch_size
+        self.push_interval = push_interval
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.auth = aiohttp.BasicAuth(username, password or "") if username else None
+        # Encoded Label messages per series id
+        self._series_labels: List[bytes] = []
+
+        self.prom_stats = {
+            "batches": Counter(
+                "vand_remote_write_batches_total",
+                "remote_write requests delivered",
+                registry=registry,
+            ),
+            "dropped_samples": Counter(
+                "vand_remote_write_dropped_samples_total",
+                "Samples dropped as the remote_write endpoint rejected them",
+                registry=registry,
+            ),
+            "retries": Counter(
+                "vand_remote_write_retries_total",
+                "remote_write requests retried",
+                registry=registry,
+            ),
+            "samples": Counter(
+                "vand_remote_write_samples_total",
+                "Samples delivered via remote_write",
+                registry=registry,
+            ),
+            "sent_bytes": Counter(
+                "vand_remote_write_sent_bytes_total",
+                "Snappy compressed remote_write bytes delivered",
+                registry=registry,
+            ),
+            "uncompressed_bytes": Counter(
+                "vand_remote_write_uncompressed_bytes_total",
+                "Uncompressed remote_write protobuf bytes delivered",
+                registry=registry,
+            ),
+        }
+
+    def _encode_labels(self, name: str, labels: Dict[str, Any]) -> bytes:
+        all_labels = {"__name__": name, **labels}
+        return b"".join(
+            _length_delimited(
+                1,
+                _length_delimited(1, k.encode())
+                + _length_delimited(2, str(v).encode()),
+            )
+            for k, v in sorted(all_labels.items())
+        )
+
+    def encode(self, samples: List[Sample]) -> bytes:
+        """Encode samples as a prometheus.WriteRequest protobuf"""
+        if any(s.series_id >= len(self._series_labels) for s in samples):
+            self._series_labels = [
+                self._encode_labels(name, labels)
+                for name, labels in self.source.series_labels()
+            ]
+
+        series_samples: Dict[int, List[bytes]] = {}
+        for sample in samples:
+            series_samples.setdefault(sample.series_id, []).append(
+                _length_delimited(
+                    2,
+                    self.SAMPLE_VALUE_TAG
+                    + self.DOUBLE.pack(sample.value)
+                    + self.SAMPLE_TIMESTAMP_TAG
+                    + _varint(int(sample.timestamp * 1000)),
+                )
+            )
+        return b"".join(
+            _length_delimited(
+                1, self._series_labels[series_id] + b"".join(encoded_samples)
+            )
+            for series_id, encoded_samples in series_samples.items()
+        )
+
+    async def _post(self, session: aiohttp.ClientSession, body: bytes) -> int:
+        async with session.post(
+            self.url,
+            data=body,
+            headers={
+                "Content-Encoding": "snappy",
+                "Content-Type": "application/x-protobuf",
+                "User-Agent": USER_AGENT,
+                "X-Prometheus-Remote-Write-Version": "0.1.0",
+            },
+        ) as resp:
+            if resp.status >= 400:
+                LOG.debug(f"remote_write returned {resp.status}: {await resp.text()}")
+            return resp.status
+
+    async def send(self, session: aiohttp.ClientSession, samples: List[Sample]) -> None:
+        """Deliver samples - retrying until they're accepted or rejected"""
+        payload = self.encode(samples)
+        body = snappy.compress(payload)
+        attempt = 0
+        while True:
+            try:
+                status = await self._post(session, body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                LOG.debug(f"remote_write to {self.url} failed: {e}")
+                status = 0
+
+            if 200 <= status < 300:
+                self.prom_stats["batches"].inc({})
+                self.prom_stats["samples"].add({}, len(samples))
+                self.prom_stats["sent_bytes"].add({}, len(body))
+                self.prom_stats["uncompressed_bytes"].add({}, len(payload))
+                return
+            if 400 <= status < 500 and status != 429:
+                LOG.error(
+                    f"remote_write rejected {len(samples)} samples ({status}) - dropping"
+                )
+                self.prom_stats["dropped_samples"].add({}, len(samples))
+                return
+
+            backoff = random.uniform(
+                0, min(self.max_backoff, self.min_backoff * (2**attempt))
+            )
+            attempt += 1
+            self.prom_stats["retries"].inc({})
+            LOG.info(f"remote_write attempt {attempt} failed - retrying in {backoff}s")
+            await asyncio.sleep(backoff)
+
+    async def run(self) -> None:
+        async with aiohttp.ClientSession(
+            auth=self.auth,
+            connector=aiohttp.TCPConnector(limit=1),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as session:
+            while True:
+                start, samples = self.source.peek(self.batch_size)
+                if samples:
+                    await self.send(session, samples)
+                    # The source may have dropped samples while we were sending
+                    self.source.consume(start, len(samples))
+                # Go straight back for more if we have a backlog
+                if len(samples) < self.batch_size:
+                    await asyncio.sleep(self.push_interval)
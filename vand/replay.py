@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import struct
+import threading
+from pathlib import Path
+from time import perf_counter, time
+from typing import (
+    Any,
+    Awaitable,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from bleak.backends.device import BLEDevice
+
+from vand.backends import BleBackend, FakeBackend, set_backend
+
+
+LOG = logging.getLogger(__name__)
+
+ADVERTISEMENT = 1
+NOTIFICATION = 2
+
+
+class RecordedEvent(NamedTuple):
+    offset: float  # Seconds since the recording started
+    kind: int
+    mac_address: str
+    rssi: int
+    payload: bytes
+
+
+def _mac_to_bytes(mac_address: str) -> bytes:
+    return bytes.fromhex(mac_address.replace(":", ""))
+
+
+def _bytes_to_mac(mac_bytes: bytes) -> str:
+    return ":".join(f"{b:02X}" for b in mac_bytes)
+
+
+def clone_mac(mac_address: str, clone: int) -> str:
+    """MAC address of synthetic copy number clone (0 is the original)"""
+    if not clone:
+        return mac_address
+    return f"{(clone >> 8) & 0xFF:02X}:{clone & 0xFF:02X}{mac_address[5:]}"
+
+
+class Recorder:
+    """Append raw advertisements and notifications to a compact binary log
+
+    File header is MAGIC + start time (float64) then per event a 14 byte
+    record (ms since start, kind, MAC, RSSI, payload length) + payload.
+    bleson calls us from its HCI thread so writes are locked."""
+
+    MAGIC = b"VANDREC1"
+    HEADER = struct.Struct("<d")
+    RECORD = struct.Struct("<IB6sbH")
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.start_time = time()
+        self.events = 0
+        self._lock = threading.Lock()
+        self._fp: BinaryIO = self.path.open("wb")
+        self._fp.write(self.MAGIC + self.HEADER.pack(self.start_time))
+
+    def record(self, kind: int, mac_address: str, rssi: int, payload: bytes) -> None:
+        offset_ms = int((time() - self.start_time) * 1000)
+        record = self.RECORD.pack(
+            offset_ms, kind, _mac_to_bytes(mac_address), rssi, len(payload)
+        )
+        with self._lock:
+            self._fp.write(record + payload)
+            self.events += 1
+
+    async def close(self) -> None:
+        with self._lock:
+            self._fp.close()
+        LOG.info(f"Recorded {self.events} BLE events to {self.path}")
+
+
+def read_recording(path: str) -> Iterator[RecordedEvent]:
+    with open(path, "rb") as fp:
+        if fp.read(len(Recorder.MAGIC)) != Recorder.MAGIC:
+            raise ValueError(f"{path} is not a vanD BLE recording")
+        fp.read(Recorder.HEADER.size)
+        while record := fp.read(Recorder.RECORD.size):
+            if len(record) != Recorder.RECORD.size:
+                LOG.warning(f"{path} has a truncated last record")
+                return
+            offset_ms, kind, mac_bytes, rssi, length = Recorder.RECORD.unpack(record)
+            yield RecordedEvent(
+                offset_ms / 1000, kind, _bytes_to_mac(mac_bytes), rssi, fp.read(length)
+            )
+
+
+class _RecordingObserver:
+    def __init__(self, observer: Any, recorder: Recorder) -> None:
+        self.observer = observer
+        self.recorder = recorder
+
+    def start(self) -> None:
+        self.observer.start()
+
+    def stop(self) -> None:
+        self.observer.stop()
+
+    @property
+    def on_advertising_data(self) -> Any:
+        return self.observer.on_advertising_data
+
+    @on_advertising_data.setter
+    def on_advertising_data(self, callback: Callable[[Any], None]) -> None:
+        def _record(advertisement: Any) -> None:
+            self.recorder.record(
+                ADVERTISEMENT,
+                advertisement.address.address,
+                advertisement.rssi or 0,
+                bytes(advertisement.mfg_data or b""),
+            )
+            callback(advertisement)
+
+        self.observer.on_advertising_data = _record
+
+
+class _RecordingClient:
+    def __init__(self, client: Any, mac_address: str, recorder: Recorder) -> None:
+        self.client = client
+        self.mac_address = mac_address
+        self.recorder = recorder
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
+
+    async def start_notify(
+        self, characteristic: Any, callback: Callable[[Any, bytearray], None]
+    ) -> None:
+        def _record(sender: Any, data: bytearray) -> None:
+            self.recorder.record(NOTIFICATION, self.mac_address, 0, bytes(data))
+            callback(sender, data)
+
+        await self.client.start_notify(characteristic, _record)
+
+
+class RecordingBackend(BleBackend):
+    """Real radios with every advertisement and notification recorded"""
+
+    name = "record"
+
+    def __init__(self, recorder: Recorder) -> None:
+        self.recorder = recorder
+
+    def observer(self, adapter_id: int = 0) -> Any:
+        return _RecordingObserver(super().observer(adapter_id), self.recorder)
+
+    def client(
+        self, device: BLEDevice, timeout: float, services: Optional[List[str]] = None
+    ) -> Any:
+        return _RecordingClient(
+            super().client(device, timeout, services), device.address, self.recorder
+        )
+
+
+def synthetic_events(
+    li3_macs: List[str],
+    hs075s_macs: List[str],
+    duration: float,
+    interval: float = 1.0,
+) -> Iterator[RecordedEvent]:
+    """A Li3 frame and a HS075S advertisement per device per interval
+
+    Devices are staggered across the interval like real radios would be."""
+    devices = len(li3_macs) + len(hs075s_macs)
+    stagger = interval / devices if devices else 0
+    tick = 0
+    while tick * interval < duration:
+        for idx, mac_address in enumerate(li3_macs):
+            offset = (tick * interval) + (idx * stagger)
+            power = (tick + idx) % 200 - 100
+            for payload in (
+                f"{1300 + (tick % 20)},327,327,328,327".encode("ascii"),
+                b"&,1,114,006880",
+                f",32,39,{power},79,000000".encode("ascii"),
+            ):
+                yield RecordedEvent(offset, NOTIFICATION, mac_address, 0, payload)
+        for idx, mac_address in enumerate(hs075s_macs, start=len(li3_macs)):
+            offset = (tick * interval) + (idx * stagger)
+            encoded = 210000 + ((tick * 1009) % 50000) + (tick % 1000)
+            mfg_data = b"\x88\xec\x00" + encoded.to_bytes(3, "big") + b"\x64\x00"
+            yield RecordedEvent(offset, ADVERTISEMENT, mac_address, -60, mfg_data)
+        tick += 1
+
+
+class Replayer:
+    """Feed recorded (or synthetic) events into a FakeBackend
+
+    clones > 1 replays every device that many times with clone_mac()
+    addresses (configure the clones for the daemon to use them) and speed
+    multiplies how fast the recording plays."""
+
+    def __init__(
+        self,
+        backend: FakeBackend,
+        events: List[RecordedEvent],
+        speed: float = 1.0,
+        clones: int = 1,
+        repeat: bool = False,
+    ) -> None:
+        self.backend = backend
+        self.events = events
+        self.speed = speed
+        self.clones = clones
+        self.repeat = repeat
+        # How far behind schedule injection got - shows a saturated loop
+        self.max_lag = 0.0
+
+    async def run(self) -> None:
+        while True:
+            start_time = perf_counter()
+            for event in self.events:
+                due = start_time + (event.offset / self.speed)
+                delay = due - perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+                for clone in range(self.clones):
+                    mac_address = clone_mac(event.mac_address, clone)
+                    if event.kind == NOTIFICATION:
+                        self.backend.notify(mac_address, event.payload)
+                    else:
+                        self.backend.advertise(mac_address, event.payload, event.rssi)
+            if not self.repeat:
+                return
+            # Let the loop breathe between passes of a tiny recording
+            await asyncio.sleep(0)
+
+
+def configure_backend(conf: Dict[str, Any]) -> Tuple[List[Awaitable], List[Awaitable]]:
+    """Set the BLE backend from the vanD ble_backend config
+
+    Returns any (main, cleanup) coros the backend needs running."""
+    backend_conf = conf["vanD"]["ble_backend"]
+    backend_type = backend_conf.get("type", "ble")
+    if backend_type == "ble":
+        set_backend(BleBackend())
+        return [], []
+    if backend_type == "record":
+        recorder = Recorder(backend_conf["path"])
+        set_backend(RecordingBackend(recorder))
+        return [], [recorder.close()]
+    if backend_type not in ("fake", "replay"):
+        raise ValueError(f"Unknown ble_backend type {backend_type}")
+
+    fake_backend = FakeBackend()
+    fake_backend.add_gatt_devices(
+        [
+            (d["mac_address"], d["service_uuid"], d["characteristic"])
+            for d in conf.get("li3", {}).values()
+        ]
+    )
+    set_backend(fake_backend)
+    if backend_type == "fake":
+        return [], []
+
+    clones = backend_conf.get("clones", 1)
+    if "path" in backend_conf:
+        events = list(read_recording(backend_conf["path"]))
+    else:
+        # Synthetic traffic for every configured device
+        events = list(
+            synthetic_events(
+                [d["mac_address"] for d in conf.get("li3", {}).values()],
+                [d["mac_address"] for d in conf.get("HS075S", {}).values()],
+                duration=backend_conf.get("duration", 60.0),
+                interval=backend_conf.get("interval", 1.0),
+            )
+        )
+        clones = 1
+    replayer = Replayer(
+        fake_backend,
+        events,
+        speed=backend_conf.get("speed", 1.0),
+        clones=clones,
+        repeat=backend_conf.get("repeat", True),
+    )
+    return [replayer.run()], []
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import logging
+import mmap
+import struct
+import zlib
+from pathlib import Path
+from time import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from aioprometheus.collectors import Registry
+
+
+LOG = logging.getLogger(__name__)
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    series_id: int
+    value: float
+
+
+SeriesKey = Tuple[str, bytes]
+
+
+def iter_registry(registry: Registry) -> Iterator[Tuple[SeriesKey, float]]:
+    """Yield ((metric name, labels key), value) for every single value series"""
+    for collector in registry.get_all():
+        for labels_key in collector.values:
+            value = collector.values[labels_key]
+            # Histograms / Summaries are not a single value
+            if not isinstance(value, (int, float)):
+                continue
+
+            if isinstance(labels_key, str):
+                labels_key = labels_key.encode()
+            yield (collector.name, labels_key), value
+
+
+def series_key_labels(series_key: SeriesKey) -> Dict[str, Any]:
+    return {} if series_key[1] == b"__EMPTY__" else json.loads(series_key[1])
+
+
+class SampleBuffer:
+    """Append only memory mapped ring file of (timestamp, series id, value) records
+
+    Samples are snapshotted from the prometheus Registry every interval and
+    batched in memory. Every flush_interval the batch is copied into the ring,
+    msync'd and then the header is rewritten - with the tail consume() moved
+    since, so draining never adds SD card writes of its own. The header has two CRC'd slots
+    written alternately so a torn header write falls back to the previous one.
+    Writing the header last means a crash only loses the unflushed batch.
+
+    head / tail are ever increasing sequence numbers - `seq % capacity` is the
+    record slot and the oldest records are overwritten once the ring is full.
+    Series ids map to (metric name, labels) in a JSON sidecar file."""
+
+    MAGIC = b"VANDSBUF"
+    VERSION = 1
+    HEADER = struct.Struct("<8sIIQQQQI")
+    HEADER_SLOT_SIZE = 64
+    DATA_OFFSET = 2 * HEADER_SLOT_SIZE
+    RECORD = struct.Struct("<dId")
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int = 1000000,
+        flush_interval: float = 300.0,
+    ) -> None:
+        self.path = Path(path)
+        self.series_path = self.path.with_suffix(".series.json")
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+
+        self.generation = 0
+        self.head = 0
+        self.tail = 0
+        self.series: Dict[SeriesKey, int] = {}
+        self._pending = bytearray()
+        self._pending_count = 0
+        # consume() moved the tail since the header was last written
+        self._tail_dirty = False
+        self._last_flush = time()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._load_series()
+        self.mmap = self._open()
+
+    def __len__(self) -> int:
+        """Durable records not yet consumed"""
+        return self.head - self.tail
+
+    @property
+    def pending(self) -> int:
+        """Records batched in memory waiting for the next flush"""
+        return self._pending_count
+
+    def _open(self) -> mmap.mmap:
+        file_size = self.DATA_OFFSET + (self.capacity * self.RECORD.size)
+        new_file = not self.path.exists() or self.path.stat().st_size != file_size
+        with self.path.open("a+b") as fp:
+            fp.truncate(file_size)
+            mm = mmap.mmap(fp.fileno(), file_size)
+
+        if new_file or not self._recover(mm):
+            LOG.info(f"Initializing sample buffer {self.path} ({file_size} bytes)")
+            self.generation = self.head = self.tail = 0
+            mm[: self.DATA_OFFSET] = bytes(self.DATA_OFFSET)
+            self._write_header(mm)
+            mm.flush()
+        return mm
+
+    def _recover(self, mm: mmap.mmap) -> bool:
+        valid_headers = []
+        for slot in range(2):
+            offset = slot * self.HEADER_SLOT_SIZE
+            raw = mm[offset : offset + self.HEADER.size]
+            header = self.HEADER.unpack(raw)
+            magic, version, record_size, capacity, _gen, head, tail, crc = header
+            if (
+                magic != self.MAGIC
+                or version != self.VERSION
+                or record_size != self.RECORD.size
+                or capacity != self.capacity
+                or crc != zlib.crc32(raw[:-4])
+                or tail > head
+            ):
+                continue
+            valid_headers.append(header)
+
+        if not valid_headers:
+            LOG.error(f"{self.path} has no valid header - discarding backlog")
+            return False
+
+        _, _, _, _, self.generation, self.head, self.tail, _ = max(
+            valid_headers, key=lambda h: h[4]
+        )
+        LOG.info(f"Recovered {len(self)} buffered samples from {self.path}")
+        return True
+
+    def _write_header(self, mm: mmap.mmap) -> None:
+        self.generation += 1
+        header = self.HEADER.pack(
+            self.MAGIC,
+            self.VERSION,
+            self.RECORD.size,
+            self.capacity,
+            self.generation,
+            self.head,
+            self.tail,
+            0,
+        )[:-4]
+        header += struct.pack("<I", zlib.crc32(header))
+        offset = (self.generation % 2) * self.HEADER_SLOT_SIZE
+        mm[offset : offset + len(header)] = header
+
+    def _load_series(self) -> None:
+        if not self.series_path.exists():
+            return
+        with self.series_path.open("rb") as sfp:
+            for series_id, (name, labels_key) in enumerate(json.load(sfp)):
+                self.series[(name, labels_key.encode())] = series_id
+
+    def _save_series(self) -> None:
+        series = sorted(self.series.items(), key=lambda s: s[1])
+        tmp_path = self.series_path.with_suffix(".tmp")
+        with tmp_path.open("w") as sfp:
+            json.dump([(name, key.decode()) for (name, key), _ in series], sfp)
+        tmp_path.replace(self.series_path)
+
+    def series_labels(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """(metric name, labels) indexed by series id"""
+        series = sorted(self.series.items(), key=lambda s: s[1])
+        return [(key[0], series_key_labels(key)) for key, _ in series]
+
+    def append(self, series_id: int, value: float, timestamp: float) -> None:
+        self._pending += self.RECORD.pack(timestamp, series_id, value)
+        self._pending_count += 1
+
+    def record_registry(
+        self, registry: Registry, timestamp: Optional[float] = None
+    ) -> int:
+        """Batch a sample of every series in the registry - returns samples taken"""
+        timestamp = timestamp or time()
+        new_series = False
+        samples = 0
+        for series_key, value in iter_registry(registry):
+            series_id = self.series.get(series_key)
+            if series_id is None:
+                series_id = self.series[series_key] = len(self.series)
+                new_series = True
+            self.append(series_id, value, timestamp)
+            samples += 1
+        if new_series:
+            self._save_series()
+        return samples
+
+    def flush(self) -> None:
+        """Write the pending batch into the ring and sync it to disk"""
+        self._last_flush = time()
+        if not self._pending_count:
+            if self._tail_dirty:
+                self._write_header(self.mmap)
+                self.mmap.flush()
+                self._tail_dirty = False
+            return
+
+        # Only the newest capacity records can survive
+        pending_start = 0
+        if self._pending_count > self.capacity:
+            skip = self._pending_count - self.capacity
+            pending_start = skip * self.RECORD.size
+            self.head += skip
+            self._pending_count = self.capacity
+
+        start = self.head % self.capacity
+        first_part = min(self._pending_count, self.capacity - start)
+        first_end = pending_start + (first_part * self.RECORD.size)
+        offset = self.DATA_OFFSET + (start * self.RECORD.size)
+        self.mmap[offset : offset + first_end - pending_start] = self._pending[
+            pending_start:first_end
+        ]
+        if first_part < self._pending_count:
+            rest = self._pending[first_end:]
+            self.mmap[self.DATA_OFFSET : self.DATA_OFFSET + len(rest)] = rest
+
+        self.head += self._pending_count
+        if self.head - self.tail > self.capacity:
+            self.tail = self.head - self.capacity
+        # Records must be on disk before the header points at them
+        self.mmap.flush()
+        self._write_header(self.mmap)
+        self.mmap.flush()
+        self._pending.clear()
+        self._pending_count = 0
+        self._tail_dirty = False
+
+    def peek(self, limit: int) -> Tuple[int, List[Sample]]:
+        """First sequence number + the oldest unconsumed samples with their timestamps
+
+        Durable records come first then the in memory batch (which follows on
+        from head), so when we're online samples get forwarded before they ever
+        need to hit the disk."""
+        samples = []
+        for seq in range(self.tail, min(self.tail + limit, self.head)):
+            offset = self.DATA_OFFSET + ((seq % self.capacity) * self.RECORD.size)
+            samples.append(Sample(*self.RECORD.unpack_from(self.mmap, offset)))
+        for idx in range(min(limit - len(samples), self._pending_count)):
+            samples.append(
+                Sample(*self.RECORD.unpack_from(self._pending, idx * self.RECORD.size))
+            )
+        return self.tail, samples
+
+    def consume(self, start: int, count: int) -> None:
+        """Mark the count samples peek()'d from sequence number start as delivered
+
+        Anything the ring overwrote since (i.e. below the tail) is already
+        gone, so it must not release newer samples that were never sent.
+        The tail is persisted at the next flush() - a crash before then only
+        re-sends these samples."""
+        end = start + count
+        durable = min(end, self.head) - self.tail
+        if durable > 0:
+            self.tail += durable
+            self._tail_dirty = True
+
+        pending = min(end - self.head, self._pending_count)
+        if pending > 0:
+            # Delivered before hitting the disk - skip their sequence numbers
+            del self._pending[: pending * self.RECORD.size]
+            self._pending_count -= pending
+            self.head += pending
+            self.tail = self.head
+            self._tail_dirty = True
+
+    async def run(self, registry: Registry, sample_interval: float) -> None:
+        while True:
+            self.record_registry(registry)
+            if time() - self._last_flush >= self.flush_interval:
+                self.flush()
+            await asyncio.sleep(sample_interval)
+
+    async def close(self) -> None:
+        self.flush()
+        self.mmap.close()
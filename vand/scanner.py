@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional, TYPE_CHECKING
+
+from vand.adapters import Adapter, AdapterPool
+from vand.backends import get_backend
+from vand.instrumentation import VandMetrics
+
+if TYPE_CHECKING:  # pragma: no cover
+    from vand.observer_worker import ObserverProcess
+
+
+LOG = logging.getLogger(__name__)
+AdvertisementHandler = Callable[[Any], None]
+SampleHandler = Callable[[Any], None]
+
+
+class AdvertisementScanner:
+    """One bleson Observer per HCI adapter shared by every advertisement consumer
+
+    bleson calls us from its HCI socket thread. We look the MAC up in
+    `self.handlers` there (so unwanted advertisements never wake the loop) and
+    hand matching ones to the owning handler on the asyncio event loop.
+    Given an AdapterPool we move to its least busy adapter each scan_window.
+    With worker settings bleson runs in an ObserverProcess instead, which
+    filters + decodes there and calls the MAC's sample handler with stats."""
+
+    def __init__(
+        self,
+        adapter_id: int = 0,
+        scan_window: float = 2.0,
+        metrics: Optional[VandMetrics] = None,
+        module: str = "",
+        adapter_pool: Optional[AdapterPool] = None,
+        worker: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.adapter_id = adapter_id
+        self.adapter_pool = adapter_pool
+        # The pool's adapter we're observing on
+        self.adapter: Optional[Adapter] = None
+        self.scan_window = scan_window
+        self.metrics = metrics
+        self.module = module
+        self.handlers: Dict[str, AdvertisementHandler] = {}
+        # MAC -> handler of samples the ObserverProcess decoded
+        self.sample_handlers: Dict[str, SampleHandler] = {}
+        # Advertisements from MACs nobody registered
+        self.ignored = 0
+        self.observer: Optional[Any] = None
+        # ObserverProcess settings - None observes in this process
+        self.worker = worker
+        self.worker_process: Optional["ObserverProcess"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(
+        self,
+        mac_address: str,
+        handler: AdvertisementHandler,
+        sample_handler: Optional[SampleHandler] = None,
+    ) -> None:
+        self.handlers[mac_address.upper()] = handler
+        if sample_handler:
+            self.sample_handlers[mac_address.upper()] = sample_handler
+        if self.worker_process:
+            self.worker_process.send_allowlist()
+
+    def unregister(self, mac_address: str) -> None:
+        self.handlers.pop(mac_address.upper(), None)
+        self.sample_handlers.pop(mac_address.upper(), None)
+        if self.worker_process:
+            self.worker_process.send_allowlist()
+
+    # Ran in bleson's HCI socket thread
+    def on_advertising_data(self, advertisement: Any) -> None:
+        handler = self.handlers.get(advertisement.address.address)
+        if handler is None:
+            self.ignored += 1
+            LOG.debug(f"Ignoring advertisement from {advertisement.address.address}")
+            return
+
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(
+            self._dispatch, handler, advertisement, perf_counter()
+        )
+
+    def _dispatch(
+        self, handler: AdvertisementHandler, advertisement: Any, received_time: float
+    ) -> None:
+        handler(advertisement)
+        self._observe_latency(received_time)
+
+    def _observe_latency(self, received_time: float) -> None:
+        if self.metrics:
+            self.metrics.observe_latency(self.module, received_time)
+
+    def _select_adapter(self) -> int:
+        """The pool's least busy adapter's id"""
+        if not self.adapter_pool:
+            return self.adapter_id
+        if self.adapter:
+            self.adapter_pool.release_observer(self.adapter)
+        self.adapter = self.adapter_pool.acquire_observer()
+        return self.adapter.id
+
+    def _select_observer(self) -> Any:
+        """Observer on the least busy adapter - only replaced when that changes"""
+        adapter_id = self._select_adapter()
+        if self.observer is None or adapter_id != self.adapter_id:
+            self.adapter_id = adapter_id
+            self.observer = get_backend().observer(adapter_id)
+            self.observer.on_advertising_data = self.on_advertising_data
+            LOG.info(f"Scanning hci{adapter_id} for {len(self.handlers)} advertisers")
+        return self.observer
+
+    async def _listen_in_worker(self) -> None:
+        from vand.observer_worker import ObserverProcess
+
+        self.worker_process = ObserverProcess(
+            self.sample_handlers, self._observe_latency, **(self.worker or {})
+        )
+        LOG.info(f"Observing for {len(self.handlers)} advertisers in a worker process")
+        await self.worker_process.run(self._select_adapter, self.scan_window)
+
+    async def listen(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        try:
+            if self.worker is not None:
+                await self._listen_in_worker()
+                return
+            while True:
+                observer = self._select_observer()
+                observer.start()
+                await asyncio.sleep(self.scan_window)
+                observer.stop()
+        finally:
+            if self.observer:
+                self.observer.stop()
+            self.worker_process = None
+            if self.adapter_pool and self.adapter:
+                self.adapter_pool.release_observer(self.adapter)
+                self.adapter = None
+            self._loop = None
@@ -0,0 +1,104 @@
+import logging
+from time import time
+from typing import Dict, Iterable, List, Optional, Protocol, Set, TypeVar, Union
+
+from aioprometheus import Counter, Gauge
+from aioprometheus.collectors import Registry
+
+from vand.aggregates import StatsDevice
+from vand.reload import remove_series
+
+
+LOG = logging.getLogger(__name__)
+
+
+class SampledDevice(StatsDevice, Protocol):
+    dev_name: str
+    # time() the device's latest sample arrived - 0 if it never has
+    last_seen: float
+
+
+Device = TypeVar("Device", bound=SampledDevice)
+
+
+class StalenessTracker:
+    """Export each device's last sample time + age and expire silent devices
+
+    check() runs from the vand_ metrics probe, so it costs O(devices) once a
+    probe - nothing per sample. A device that's sent nothing for ttl seconds
+    is expired: every series labeled with its MAC address is dropped from
+    the registry, so the exposition only holds live devices, and the module
+    frees its state + stops re-exporting its last stats until a new sample
+    arrives."""
+
+    def __init__(
+        self,
+        registry: Registry,
+        stat_prefix: str,
+        ttl: Optional[float] = None,
+    ) -> None:
+        self.registry = registry
+        # None never expires
+        self.ttl = ttl
+        # MAC addresses of expired devices
+        self.expired: Set[str] = set()
+
+        self.prom_stats: Dict[str, Union[Counter, Gauge]] = {
+            "expired": Counter(
+                f"{stat_prefix}devices_expired_total",
+                "Devices expired as they sent nothing for the staleness ttl",
+                registry=registry,
+            ),
+            "last_seen": Gauge(
+                f"{stat_prefix}last_seen_timestamp_seconds",
+                "Unix time the device's latest sample arrived",
+                registry=registry,
+            ),
+            "sample_age": Gauge(
+                f"{stat_prefix}sample_age_seconds",
+                "Seconds since the device's latest sample arrived",
+                registry=registry,
+            ),
+        }
+
+    def fresh(self, device: SampledDevice) -> bool:
+        """False while the device is expired - don't export its stats"""
+        return device.mac_address not in self.expired
+
+    def check(
+        self, devices: Iterable[Device], now: Optional[float] = None
+    ) -> List[Device]:
+        """Update the last seen + age gauges - returns the newly expired devices"""
+        now = time() if now is None else now
+        newly_expired: List[Device] = []
+        for device in devices:
+            if not device.last_seen:
+                continue
+            age = now - device.last_seen
+            stale = self.ttl is not None and age > self.ttl
+            if device.mac_address in self.expired:
+                if stale:
+                    continue
+                LOG.info(f"{device.dev_name} is sending samples again")
+                self.expired.discard(device.mac_address)
+            elif stale:
+                LOG.warning(
+                    f"{device.dev_name} has sent nothing for {age:.0f}s - "
+                    + "dropping its series"
+                )
+                self.expire(device)
+                newly_expired.append(device)
+                continue
+            self.prom_stats["last_seen"].set(device.prom_labels, device.last_seen)
+            self.prom_stats["sample_age"].set(device.prom_labels, age)
+        return newly_expired
+
+    def expire(self, device: SampledDevice) -> None:
+        """Drop every series of the device - the module frees its own state"""
+        self.expired.add(device.mac_address)
+        self.prom_stats["expired"].inc({})
+        remove_series(self.registry, {"mac_address": device.mac_address})
+
+    def remove(self, mac_address: str) -> None:
+        """Forget a device - e.g. removed from the config"""
+        self.expired.discard(mac_address)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+from collections import deque
+from time import monotonic
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+from aioprometheus import Counter, Gauge
+from aioprometheus.collectors import Registry
+
+LOG = logging.getLogger(__name__)
+TASK_STATES = ("running", "backoff", "finished", "failed")
+
+
+class RestartPolicy(NamedTuple):
+    # always / on-failure / never
+    restart: str = "on-failure"
+    min_backoff: float = 1.0
+    max_backoff: float = 60.0
+    # Crash budget - give up after more than max_restarts in restart_window
+    max_restarts: int = 5
+    restart_window: float = 300.0
+    # Stop vanD (for systemd to restart) once out of budget - else just this task
+    critical: bool = False
+
+
+class Restartable:
+    """An awaitable the Supervisor can run again - factory makes a fresh one
+
+    Modules return these from get_awaitables() for their long running loops.
+    Anything awaiting it directly (e.g. tests) just runs it once."""
+
+    def __init__(
+        self, factory: Callable[[], Awaitable[Any]], name: Optional[str] = None
+    ) -> None:
+        self.factory = factory
+        func = getattr(factory, "func", factory)
+        self.name = name or str(getattr(func, "__qualname__", func))
+
+    def __await__(self) -> Generator[Any, None, Any]:
+        return self.factory().__await__()
+
+    def close(self) -> None:
+        """Like a never awaited coroutine's close() - nothing was made yet"""
+
+
+class SupervisedTask:
+    def __init__(self, name: str, awaitable: Awaitable[Any], policy: RestartPolicy):
+        self.name = name
+        self.awaitable = awaitable
+        self.policy = policy
+        self.state = "running"
+        self.restarts = 0
+        # monotonic() of crashes within the policy's restart_window
+        self.crashes: Deque[float] = deque()
+        self.prom_labels = {"task": name}
+
+    @property
+    def restartable(self) -> bool:
+        return isinstance(self.awaitable, Restartable)
+
+    def out_of_budget(self, now: float) -> bool:
+        while self.crashes and now - self.crashes[0] > self.policy.restart_window:
+            self.crashes.popleft()
+        return len(self.crashes) > self.policy.max_restarts
+
+    def backoff(self) -> float:
+        return min(
+            self.policy.max_backoff,
+            self.policy.min_backoff * 2.0 ** max(len(self.crashes) - 1, 0),
+        )
+
+
+class CrashBudgetExceeded(Exception):
+    pass
+
+
+class Supervisor:
+    """Own every module task in a TaskGroup + restart them per RestartPolicy
+
+    A crashed task is restarted with exponential backoff while the others
+    keep running, until it's used its crash budget. Plain coroutines can't
+    be re-run so only Restartable awaitables restart - a plain one crashing
+    is critical, as before. Cancelling run() cancels every task so their
+    finally blocks stop BLE sessions, observers + worker processes."""
+
+    def __init__(
+        self,
+        registry: Registry,
+        default: Optional[Dict[str, Any]] = None,
+        tasks: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> None:
+        self.default_policy = RestartPolicy(**(default or {}))
+        # Task name -> RestartPolicy overrides - e.g. HS075S.listen
+        self.task_policies = tasks or {}
+        self.tasks: Dict[str, SupervisedTask] = {}
+
+        self.prom_stats: Dict[str, Union[Counter, Gauge]] = {
+            "restarts": Counter(
+                "vand_task_restarts_total",
+                "Times the supervised task crashed (or finished) and was restarted",
+                registry=registry,
+            ),
+            "state": Gauge(
+                "vand_task_state",
+                "1 for the supervised task's current state - running, backoff, "
+                + "finished or failed",
+                registry=registry,
+            ),
+        }
+
+    def _name(self, awaitable: Awaitable[Any]) -> str:
+        if isinstance(awaitable, Restartable):
+            name = awaitable.name
+        elif isinstance(awaitable, asyncio.Task):
+            name = awaitable.get_name()
+        else:
+            name = getattr(awaitable, "__qualname__", type(awaitable).__name__)
+        unique_name, count = name, 1
+        while unique_name in self.tasks:
+            count += 1
+            unique_name = f"{name}#{count}"
+        return unique_name
+
+    def add(self, awaitables: Iterable[Awaitable[Any]]) -> None:
+        for awaitable in awaitables:
+            name = self._name(awaitable)
+            policy = self.default_policy._replace(**self.task_policies.get(name, {}))
+            self.tasks[name] = SupervisedTask(name, awaitable, policy)
+
+    def _set_state(self, task: SupervisedTask, state: str) -> None:
+        task.state = state
+        for task_state in TASK_STATES:
+            self.prom_stats["state"].set(
+                {**task.prom_labels, "state": task_state}, int(task_state == state)
+            )
+
+    def _should_restart(self, task: SupervisedTask, failed: bool) -> bool:
+        policy = task.policy
+        if policy.restart == "never" or (policy.restart == "on-failure" and not failed):
+            return False
+        if not task.restartable:
+            LOG.error(f"{task.name} is not restartable")
+            return False
+        return not task.out_of_budget(monotonic())
+
+    async def _supervise(self, task: SupervisedTask) -> None:
+        while True:
+            self._set_state(task, "running")
+            try:
+                await task.awaitable
+                failed = False
+            except Exception:
+                LOG.exception(f"{task.name} crashed")
+                task.crashes.append(monotonic())
+                failed = True
+
+            if not self._should_restart(task, failed):
+                self._set_state(task, "failed" if failed else "finished")
+                if failed and (task.policy.critical or not task.restartable):
+                    raise CrashBudgetExceeded(f"{task.name} crashed + won't restart")
+                if failed:
+                    LOG.error(
+                        f"{task.name} crashed {len(task.crashes)} times in "
+                        + f"{task.policy.restart_window}s - giving up on it"
+                    )
+                return
+
+            backoff = task.backoff()
+            LOG.info(f"Restarting {task.name} in {backoff:.1f}s")
+            self._set_state(task, "backoff")
+            await asyncio.sleep(backoff)
+            task.restarts += 1
+            self.prom_stats["restarts"].inc(task.prom_labels)
+
+    async def run(self) -> None:
+        """Run every added task until they're all done or a critical one fails"""
+        async with asyncio.TaskGroup() as tg:
+            for task in self.tasks.values():
+                tg.create_task(self._supervise(task), name=task.name)
+        LOG.debug(f"All {len(self.tasks)} supervised tasks finished")
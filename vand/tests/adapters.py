@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import asyncio
+import copy
+import unittest
+from typing import Any, Dict
+
+from aioprometheus.collectors import Registry
+from bleak.exc import BleakError
+
+from vand import govee, li3
+from vand.adapters import adapter_pool, details_adapter
+from vand.backends import BleBackend, FakeBackend, set_backend
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+from vand.tests.li3_fixtures import TEST_LI3_CONFIG
+
+
+class TestAdapterPool(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.registry = Registry()
+        self.pool = adapter_pool(self.registry)
+        self.pool.configure(
+            {
+                "hci0": {"max_connections": 2},
+                "hci1": {"max_connections": 2},
+                "hci2": {"max_connections": 2, "observe": False},
+            }
+        )
+        self.backend = FakeBackend()
+        set_backend(self.backend)
+
+    def tearDown(self) -> None:
+        set_backend(BleBackend())
+
+    def test_details_adapter(self) -> None:
+        self.assertEqual("hci2", details_adapter({"path": "/org/bluez/hci2/dev_FF"}))
+        self.assertEqual("hci0", details_adapter(None))
+        self.assertEqual("hci0", details_adapter({"path": "/org/bluez"}))
+        with self.assertRaises(ValueError):
+            self.pool.configure({"usb0": {}})
+
+    def test_balancing(self) -> None:
+        hci0, hci1, hci2 = self.pool.adapters.values()
+        # hci2 never observes
+        self.assertIs(hci0, self.pool.acquire_observer())
+        self.assertIs(hci1, self.pool.acquire_observer())
+
+        seen_on = ("hci0", "hci1", "hci2")
+        self.assertIs(hci2, self.pool.acquire_connection("AA", seen_on))
+        self.assertIs(hci2, self.pool.acquire_connection("AA", seen_on))
+        self.assertIs(hci0, self.pool.acquire_connection("BB", seen_on))
+        self.assertIs(hci1, self.pool.acquire_connection("CC", ("hci1",)))
+        # Pinned to an adapter it hasn't been seen on yet
+        with self.assertRaises(BleakError):
+            self.pool.acquire_connection("DD", ("hci0",), pinned="hci1")
+        self.assertIs(hci1, self.pool.acquire_connection("DD", seen_on, "hci1"))
+        with self.assertRaises(BleakError):
+            self.pool.acquire_connection("EE", ("hci1",))
+
+        self.assertEqual(1.0, hci1.utilization)
+        self.pool.release_connection("CC", failed=True)
+        self.assertEqual(0.5, hci1.utilization)
+        failures = self.pool.prom_stats["connect_failures"]
+        self.assertEqual(1, failures.get(hci1.prom_labels))
+        # Observers move off the busier adapters
+        self.pool.release_observer(hci0)
+        self.assertIs(hci0, self.pool.acquire_observer())
+
+    async def test_li3_and_hs075s(self) -> None:
+        conf: Dict[str, Any] = copy.deepcopy(TEST_LI3_CONFIG)
+        conf["li3"]["3"] = {
+            **conf["li3"]["1"],
+            "mac_address": "FF:69:4E:00:00:03",
+            "adapter": "hci2",
+        }
+        rb = li3.RevelBatteries(conf, self.registry)
+        self.backend.add_gatt_devices(
+            [(b.mac_address, b.service_uuid, b.characteristic) for b in rb.batteries]
+        )
+        await rb.scan_devices(1)
+        h = govee.Hygrometers(TEST_HS075S_CONFIG["HS075S"], self.registry)
+
+        tasks = [
+            asyncio.ensure_future(coro)
+            for coro in await rb.get_awaitables(30, event_stats=True)
+        ]
+        try:
+            while len(self.backend.clients) < 3:
+                await asyncio.sleep(0)
+            self.assertEqual(
+                {"FF:69:4E:38:44:B3": "hci0", "FF:69:4E:35:CE:71": "hci1"},
+                {
+                    mac: client.adapter
+                    for mac, client in self.backend.clients.items()
+                    if mac != "FF:69:4E:00:00:03"
+                },
+            )
+            self.assertEqual("hci2", self.backend.clients["FF:69:4E:00:00:03"].adapter)
+
+            # Every adapter has a connection - hci2 never observes
+            h.scanner._select_observer()
+            self.assertEqual(0, h.scanner.adapter_id)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertEqual(
+            [0, 0, 0], [a.connections for a in self.pool.adapters.values()]
+        )
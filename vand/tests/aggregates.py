@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from aioprometheus.collectors import Registry
+
+from vand import li3
+from vand.tests.li3_fixtures import FAKE_LI3_BINARY_DATA, TEST_LI3_CONFIG
+
+
+class TestStatsAggregator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.prom_registry = Registry()
+        self.rb = li3.RevelBatteries(
+            TEST_LI3_CONFIG, self.prom_registry, aggregate_windows=[60]
+        )
+        self.battery = self.rb.batteries[0]
+        for data in FAKE_LI3_BINARY_DATA:
+            self.battery._telementary_handler("unittest", data)
+        self.aggregator = self.rb.aggregator
+        assert self.aggregator is not None
+        # Drop the window the handler made with the real time
+        self.aggregator.device_windows.clear()
+
+    def _set_power(self, power: float, timestamp: float) -> None:
+        assert self.battery.stats
+        self.battery.stats = li3.Li3TelemetryStats(
+            **{**self.battery.stats.__dict__, "battery_power": power}
+        )
+        assert self.aggregator
+        self.aggregator.add_sample(self.battery, timestamp)
+
+    def test_windows(self) -> None:
+        for power, timestamp in ((1, 60), (-100, 70), (4, 119), (2, 120)):
+            self._set_power(power, timestamp)
+
+        assert self.aggregator
+        power_gauge = self.aggregator.prom_stats[
+            self.aggregator.field_names.index("battery_power")
+        ]
+        labels = {**self.battery.prom_labels, "window": "60s"}
+        # The 60 - 120 window is published when the sample at 120 arrives
+        self.assertEqual(3, power_gauge.get({**labels, "agg": "count"}))
+        self.assertEqual(4, power_gauge.get({**labels, "agg": "last"}))
+        self.assertEqual(4, power_gauge.get({**labels, "agg": "max"}))
+        self.assertEqual(-95 / 3, power_gauge.get({**labels, "agg": "mean"}))
+        self.assertEqual(-100, power_gauge.get({**labels, "agg": "min"}))
+
+        window = self.aggregator.device_windows[self.battery.mac_address][0]
+        self.assertEqual(120, window.start)
+        self.assertEqual(1, window.count)
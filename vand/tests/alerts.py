@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import sys
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List
+
+from aiohttp import web
+from aioprometheus.collectors import Registry
+
+from vand import govee, li3
+from vand.alerts import alert_engine
+from vand.backends import fake_advertisement
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+from vand.tests.li3_fixtures import FAKE_LI3_BINARY_DATA, TEST_LI3_CONFIG
+
+
+class FakeWebhook:
+    """Local stand-in for an alert webhook - /fail always 500s"""
+
+    def __init__(self) -> None:
+        self.alerts: List[Dict[str, Any]] = []
+        self.app = web.Application()
+        self.app.router.add_post("/alert", self.handle_alert)
+        self.app.router.add_post("/fail", self.handle_fail)
+        self.runner = web.AppRunner(self.app)
+
+    async def start(self) -> str:
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        return f"http://127.0.0.1:{self.runner.addresses[0][1]}"
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+    async def handle_alert(self, request: web.Request) -> web.Response:
+        self.alerts.append(await request.json())
+        return web.Response(status=204)
+
+    async def handle_fail(self, request: web.Request) -> web.Response:
+        return web.Response(status=500)
+
+
+class TestAlertEngine(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.prom_registry = Registry()
+        self.engine = alert_engine(self.prom_registry)
+        self.engine.configure(
+            {
+                "cell_low": {
+                    "module": "li3",
+                    "field": "cell_1_voltage",
+                    "below": 2.9,
+                    "hysteresis": 0.1,
+                    "severity": "critical",
+                },
+                "fault": {"field": "fault_code", "changes": True},
+                "temperature_rising": {
+                    "module": "HS075S",
+                    "field": "temperature_c",
+                    "devices": ["HS075S-Test-1"],
+                    "above": 0.02,
+                    "rate_window": 60.0,
+                },
+            },
+            max_queue=4,
+        )
+
+    def _alerts(self) -> List[str]:
+        alerts = []
+        while not self.engine.queue.empty():
+            alert = self.engine.queue.get_nowait()
+            alerts.append(f"{alert['rule']} {alert['state']} {alert['value']}")
+        return alerts
+
+    async def test_li3_threshold_and_changes(self) -> None:
+        rb = li3.RevelBatteries(TEST_LI3_CONFIG, self.prom_registry)
+        for coro in await rb.get_awaitables(30, event_stats=True):
+            coro.close()  # type: ignore
+        battery = rb.batteries[0]
+        for data in FAKE_LI3_BINARY_DATA:
+            battery._telementary_handler("unittest", data)
+        self.assertEqual([], self._alerts())
+        self.assertIn(("cell_low", battery.mac_address), self.engine.states)
+
+        assert battery.stats
+        for cell_voltage, fault_code in (
+            (2.8, 0),
+            (2.95, 0),
+            (3.01, 16),
+            (3.01, 16),
+        ):
+            battery.stats = replace(
+                battery.stats, cell_1_voltage=cell_voltage, fault_code=fault_code
+            )
+            self.engine.add_sample("li3", battery)
+        self.assertEqual(
+            ["cell_low firing 2.8", "cell_low resolved 3.01", "fault changed 16"],
+            self._alerts(),
+        )
+        labels = {**battery.prom_labels, "rule": "cell_low"}
+        self.assertEqual(0, self.engine.prom_stats["firing"].get(labels))
+
+        # A full queue drops rather than grows
+        for cell_voltage in (2.8, 3.1) * 3:
+            battery.stats = replace(battery.stats, cell_1_voltage=cell_voltage)
+            self.engine.add_sample("li3", battery)
+        self.assertEqual(2, self.engine.prom_stats["dropped"].get({}))
+
+    def test_unknown_field(self) -> None:
+        # Would never fire - so refuse it like any other bad rule
+        for rule in (
+            {"field": "cell_1_voltag", "below": 2.9},
+            {"module": "HS075S", "field": "cell_1_voltage", "below": 2.9},
+        ):
+            with self.assertRaises(ValueError):
+                self.engine.configure({"typo": rule})
+        # Modules without a registered stats class can't be checked
+        self.engine.configure(
+            {"plugin": {"module": "plugin", "field": "a", "above": 1}}
+        )
+        self.assertEqual(1, len(self.engine.rules))
+
+    async def test_hs075s_rate(self) -> None:
+        h = govee.Hygrometers(TEST_HS075S_CONFIG["HS075S"], self.prom_registry)
+        first, second = h.hygrometers
+        for temperature_c, timestamp in (
+            (20.0, 0),
+            (25.0, 30),
+            (22.0, 60),
+            (22.0, 120),
+        ):
+            for hygrometer in h.hygrometers:
+                hygrometer.stats = replace(
+                    hygrometer.stats, temperature_c=temperature_c
+                )
+                self.engine.add_sample("HS075S", hygrometer, timestamp)
+        self.assertEqual(
+            ["temperature_rising firing 22.0", "temperature_rising resolved 22.0"],
+            self._alerts(),
+        )
+        # Only the configured device
+        self.assertNotIn(("temperature_rising", second.mac_address), self.engine.states)
+
+        # Advertisements are evaluated as they're handled
+        for coro in await h.get_awaitables(30, event_stats=True):
+            coro.close()  # type: ignore
+        first.process_data(fake_advertisement(first.mac_address))
+        self.assertEqual(
+            21.75, self.engine.states[("temperature_rising", first.mac_address)].value
+        )
+
+    async def test_sinks(self) -> None:
+        webhook = FakeWebhook()
+        url = await webhook.start()
+        with TemporaryDirectory() as td:
+            command_output = Path(td) / "alert.json"
+            self.engine.configure(
+                {"cell_low": {"field": "cell_1_voltage", "below": 2.9}},
+                {
+                    "command": {
+                        "type": "command",
+                        "command": [
+                            sys.executable,
+                            "-c",
+                            "import shutil, sys; "
+                            + f"shutil.copyfileobj(sys.stdin, open('{command_output}', 'w'))",
+                        ],
+                    },
+                    "log": {"type": "log"},
+                    "failing": {"type": "webhook", "url": f"{url}/fail"},
+                    "webhook": {"type": "webhook", "url": f"{url}/alert"},
+                },
+            )
+            run = asyncio.ensure_future(self.engine.run())
+            rb = li3.RevelBatteries(TEST_LI3_CONFIG, self.prom_registry)
+            battery = rb.batteries[0]
+            for data in FAKE_LI3_BINARY_DATA:
+                battery._telementary_handler("unittest", data)
+            assert battery.stats
+            battery.stats = replace(battery.stats, cell_1_voltage=2.5)
+            self.engine.add_sample("li3", battery)
+            try:
+                with self.assertLogs("vand.alerts", "WARNING"):
+                    await asyncio.wait_for(self.engine.queue.join(), 5)
+                self.assertEqual(
+                    1, self.engine.prom_stats["sink_failures"].get({"sink": "failing"})
+                )
+                self.assertEqual("firing", webhook.alerts[0]["state"])
+                self.assertEqual(battery.dev_name, webhook.alerts[0]["dev_name"])
+                with command_output.open() as cfp:
+                    self.assertEqual(webhook.alerts, [json.load(cfp)])
+            finally:
+                run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+                await webhook.stop()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, List
+
+from aioprometheus.collectors import Registry
+
+from vand import govee, li3
+from vand.backends import BleBackend, FAKE_HS075S_MFG_DATA, FakeBackend, set_backend
+from vand.replay import (
+    ADVERTISEMENT,
+    NOTIFICATION,
+    read_recording,
+    RecordedEvent,
+    Recorder,
+    Replayer,
+    synthetic_events,
+)
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+from vand.tests.li3_fixtures import FAKE_LI3_BINARY_DATA, TEST_LI3_CONFIG
+
+
+class TestFakeBackend(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.backend = FakeBackend()
+        set_backend(self.backend)
+
+    def tearDown(self) -> None:
+        set_backend(BleBackend())
+
+    async def test_li3_end_to_end(self) -> None:
+        rb = li3.RevelBatteries(TEST_LI3_CONFIG, Registry())
+        self.backend.add_gatt_devices(
+            [(b.mac_address, b.service_uuid, b.characteristic) for b in rb.batteries]
+        )
+        await rb.scan_devices(1)
+        self.assertTrue(rb.all_seen.is_set())
+
+        tasks = [
+            asyncio.ensure_future(coro)
+            for coro in await rb.get_awaitables(30, event_stats=True)
+        ]
+        try:
+            battery = rb.batteries[0]
+            while battery.mac_address not in self.backend.clients:
+                await asyncio.sleep(0)
+            for data in FAKE_LI3_BINARY_DATA:
+                self.backend.notify(battery.mac_address, data)
+            self.backend.notify("00:11:22:33:44:55", FAKE_LI3_BINARY_DATA[0])
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.assertEqual(79.0, rb.prom_stats["battery_soc"].get(battery.prom_labels))
+        self.assertEqual(4, self.backend.injected)
+        self.assertEqual(1, self.backend.dropped)
+        self.assertEqual(3, len(self.backend.latencies))
+
+    async def test_hygrometers_end_to_end(self) -> None:
+        h = govee.Hygrometers(TEST_HS075S_CONFIG["HS075S"], Registry())
+        tasks = [
+            asyncio.ensure_future(coro)
+            for coro in await h.get_awaitables(30, event_stats=True)
+        ]
+        try:
+            hygrometer = h.hygrometers[0]
+            await asyncio.sleep(0)
+            self.backend.advertise(hygrometer.mac_address, FAKE_HS075S_MFG_DATA)
+            await asyncio.sleep(0)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.assertEqual(50.2, h.prom_stats["humidity"].get(hygrometer.prom_labels))
+        self.assertEqual(1, len(self.backend.latencies))
+
+    async def test_record_replay(self) -> None:
+        with TemporaryDirectory() as td:
+            recorder = Recorder(str(Path(td) / "ble.rec"))
+            recorder.record(ADVERTISEMENT, "A4:C1:38:31:7D:5D", -60, b"\x88\xec")
+            recorder.record(NOTIFICATION, "FF:69:4E:38:44:B3", 0, b"1309,327")
+            await recorder.close()
+            events = list(read_recording(str(recorder.path)))
+
+        self.assertEqual(
+            [
+                (ADVERTISEMENT, "A4:C1:38:31:7D:5D", -60, b"\x88\xec"),
+                (NOTIFICATION, "FF:69:4E:38:44:B3", 0, b"1309,327"),
+            ],
+            [(e.kind, e.mac_address, e.rssi, e.payload) for e in events],
+        )
+
+        observer = self.backend.observer()
+        observer.start()
+        advertisements: List[Any] = []
+        observer.on_advertising_data = advertisements.append
+        replayer = Replayer(
+            self.backend,
+            [RecordedEvent(0.001, ADVERTISEMENT, "A4:C1:38:31:7D:5D", -60, b"")],
+            speed=10,
+            clones=3,
+        )
+        await replayer.run()
+        self.assertEqual(
+            ["A4:C1:38:31:7D:5D", "00:01:38:31:7D:5D", "00:02:38:31:7D:5D"],
+            [a.address.address for a in advertisements],
+        )
+
+    def test_synthetic_events(self) -> None:
+        events = list(synthetic_events(["FF:69:4E:38:44:B3"], ["A4:C1:38:31:7D:5D"], 2))
+        # 3 Li3 fragments + 1 advertisement per second
+        self.assertEqual(8, len(events))
+        self.assertEqual(sorted(e.offset for e in events), [e.offset for e in events])
+        parser = li3.Li3FrameParser()
+        frames = [parser.feed(e.payload) for e in events if e.kind == NOTIFICATION]
+        self.assertEqual(2, parser.frames_parsed)
+        self.assertEqual(13.0, frames[2].battery_voltage)  # type: ignore
@@ -2,13 +2,48 @@
 
 import json
 import unittest
+from importlib.metadata import EntryPoint
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import Any, Awaitable, Dict, Sequence
+from unittest.mock import patch
 
+from aioprometheus.collectors import Registry
 from click.testing import CliRunner
 
-from vand.main import _load_config, main
-from vand.tests.li3 import TestLi3Battery, TestRevelBatteries  # noqa: F401
+from vand.main import (
+    _load_config,
+    _load_modules,
+    _module_entry_points,
+    main,
+    MODULE_ENTRY_POINT_GROUP,
+)
+from vand.tests.adapters import TestAdapterPool  # noqa: F401
+from vand.tests.aggregates import TestStatsAggregator  # noqa: F401
+from vand.tests.alerts import TestAlertEngine  # noqa: F401
+from vand.tests.backends import TestFakeBackend  # noqa: F401
+from vand.tests.benchmarks import TestBenchmarks  # noqa: F401
+from vand.tests.connections import TestConnectionManager  # noqa: F401
+from vand.tests.dashboard import TestDashboard  # noqa: F401
+from vand.tests.decoders import TestFrameDecoder  # noqa: F401
+from vand.tests.derived import TestDerivedMetrics  # noqa: F401
+from vand.tests.exposition import TestCachedExposition  # noqa: F401
+from vand.tests.gatt_cache import TestGattCache  # noqa: F401
+from vand.tests.govee import TestHygrometers  # noqa: F401
+from vand.tests.history import TestHistoryStore  # noqa: F401
+from vand.tests.instrumentation import TestVandMetrics  # noqa: F401
+from vand.tests.li3 import (  # noqa: F401
+    TestLi3Battery,
+    TestLi3FrameParser,
+    TestRevelBatteries,
+)
+from vand.tests.observer_worker import TestObserverWorker  # noqa: F401
+from vand.tests.registry import TestPerRegistry  # noqa: F401
+from vand.tests.reload import TestConfigReload  # noqa: F401
+from vand.tests.remote_write import TestRemoteWriteClient  # noqa: F401
+from vand.tests.sample_buffer import TestSampleBuffer  # noqa: F401
+from vand.tests.staleness import TestStalenessTracker  # noqa: F401
+from vand.tests.supervisor import TestSupervisor  # noqa: F401
 
 
 class TestCLI(unittest.TestCase):
@@ -29,5 +64,43 @@ class TestCLI(unittest.TestCase):
         self.assertFalse(_load_config(Path("/does/not/exist.json")))
 
 
+async def _fake_coro() -> None:
+    pass
+
+
+async def fake_load_module(
+    conf: Dict[str, Any], prom_registry: Registry
+) -> Sequence[Awaitable[Any]]:
+    return [_fake_coro()]
+
+
+class TestModuleLoading(unittest.IsolatedAsyncioTestCase):
+    def test_module_entry_points(self) -> None:
+        module_entry_points = _module_entry_points()
+        self.assertEqual("vand.govee:load_module", module_entry_points["HS075S"].value)
+        self.assertEqual("vand.li3:load_module", module_entry_points["li3"].value)
+
+    async def test_load_modules(self) -> None:
+        conf = {
+            "vanD": {"prometheus_exporter_port": 31337},
+            "fake": {},
+            "fake2": {},
+            "not_a_module": "",
+        }
+        fake_entry_points = {
+            name: EntryPoint(
+                name, "vand.tests.base:fake_load_module", MODULE_ENTRY_POINT_GROUP
+            )
+            for name in ("fake", "fake2", "unconfigured")
+        }
+        with patch("vand.main._module_entry_points", return_value=fake_entry_points):
+            main_coros, cleanup_coros = await _load_modules(conf)
+        # 2 fake module coros + vand_ metrics probe + prometheus service
+        self.assertEqual(4, len(main_coros))
+        self.assertEqual(1, len(cleanup_coros))
+        for coro in main_coros + cleanup_coros:
+            coro.close()  # type: ignore
+
+
 if __name__ == "__main__":  # pragma: no cover
     unittest.main()
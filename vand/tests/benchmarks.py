@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+
+from vand import benchmarks
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_benchmarks_run(self) -> None:
+        results = benchmarks.run_benchmarks(number=2, repeat=1, memory_ops=2)
+        runs = sum(len(counts) for _, counts in benchmarks.BENCHMARKS.values())
+        self.assertEqual(runs, len(results))
+        for result in results:
+            self.assertGreater(result.ops_per_sec, 0)
+        self.assertIn(result.key, benchmarks.load_baseline()["results"])
+
+    def test_find_regressions(self) -> None:
+        result = benchmarks.BenchmarkResult("bench", 4, 1000.0, 100000, 0.0)
+        baseline = {"results": {result.key: result._asdict()}}
+        self.assertEqual([], benchmarks.find_regressions([result], baseline))
+
+        slower = result._replace(ops_per_sec=700.0, peak_memory_bytes=140000)
+        regressions = benchmarks.find_regressions([slower], baseline, threshold=0.25)
+        self.assertEqual(2, len(regressions))
+        self.assertIn("ops/s", regressions[0])
+        self.assertEqual([], benchmarks.find_regressions([slower], baseline, 0.5))
+
+    @unittest.skipUnless(
+        os.environ.get("VAND_BENCHMARKS"), "Set VAND_BENCHMARKS=1 to gate on benchmarks"
+    )
+    def test_no_regressions(self) -> None:
+        threshold = float(
+            os.environ.get("VAND_BENCHMARK_THRESHOLD", benchmarks.DEFAULT_THRESHOLD)
+        )
+        regressions = benchmarks.find_regressions(
+            benchmarks.run_benchmarks(), benchmarks.load_baseline(), threshold
+        )
+        self.assertEqual([], regressions)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from time import time
+from types import SimpleNamespace
+from typing import Any, List
+
+from aioprometheus.collectors import Registry
+from bleak.exc import BleakError
+
+from vand.connections import ConnectionManager
+
+
+class FakeGattDevice:
+    def __init__(self, dev_name: str, connect_failures: int = 0) -> None:
+        self.dev_name = dev_name
+        self.prom_labels = {"dev_name": dev_name}
+        self.last_notification = 0.0
+        self.connect_failures = connect_failures
+        self.connects = 0
+        self.disconnects = 0
+        self.client = SimpleNamespace(is_connected=False)
+        self.seen = asyncio.Event()
+        self.seen.set()
+
+    async def connect(self) -> Any:
+        await asyncio.sleep(0.01)
+        if self.connect_failures:
+            self.connect_failures -= 1
+            # Discovery sees us again straight away
+            asyncio.get_running_loop().call_soon(self.seen.set)
+            raise BleakError(f"{self.dev_name} was not found in bleak scan!")
+        self.connects += 1
+        self.last_notification = time()
+        self.client.is_connected = True
+        return self.client
+
+    async def disconnect(self, client: Any) -> None:
+        self.disconnects += 1
+        client.is_connected = False
+
+
+class TestConnectionManager(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.cm = ConnectionManager(
+            Registry(),
+            "unittest_",
+            min_backoff=0.01,
+            max_backoff=0.01,
+            inactivity_timeout=10,
+            check_interval=0.01,
+        )
+
+    async def test_reconnect(self) -> None:
+        device = FakeGattDevice("flaky", connect_failures=2)
+        task = asyncio.create_task(self.cm.supervise(device))
+        await asyncio.sleep(0.1)
+        self.assertEqual(1, device.connects)
+        prom_stats = self.cm.prom_stats
+        self.assertEqual(2, prom_stats["connect_failures"].get(device.prom_labels))
+        self.assertEqual(1, prom_stats["connected"].get(device.prom_labels))
+        self.assertNotEqual(0, prom_stats["connect_latency"].get(device.prom_labels))
+
+        # Going silent forces a reconnect
+        self.cm.inactivity_timeout = 0
+        await asyncio.sleep(0.1)
+        self.assertGreaterEqual(device.disconnects, 1)
+        self.assertGreaterEqual(device.connects, 2)
+
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertFalse(device.client.is_connected)
+
+    async def test_connect_concurrency(self) -> None:
+        in_flight: List[int] = []
+        devices = [FakeGattDevice(f"dev{i}") for i in range(3)]
+        for device in devices:
+            connect = device.connect
+
+            async def tracked_connect(connect: Any = connect) -> Any:
+                in_flight.append(self.cm.connect_semaphore._value)
+                return await connect()
+
+            device.connect = tracked_connect  # type: ignore
+        tasks = [asyncio.create_task(self.cm.supervise(d)) for d in devices]
+        await asyncio.sleep(0.05)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Semaphore of 1 means every connect ran with no free slots
+        self.assertEqual([0, 0, 0], in_flight[:3])
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import socket
+import unittest
+from typing import Any, Tuple
+
+from aiohttp import ClientSession
+from aioprometheus.collectors import Registry
+
+from vand import govee
+from vand.backends import fake_advertisement
+from vand.dashboard import dashboard
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+
+
+def _parse_event(message: bytes) -> Tuple[str, Any]:
+    event, data = message.decode().strip().split("\n")
+    return event[len("event: ") :], json.loads(data[len("data: ") :])
+
+
+class TestDashboard(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.prom_registry = Registry()
+        self.h = govee.Hygrometers(TEST_HS075S_CONFIG["HS075S"], self.prom_registry)
+        self.hygrometer = self.h.hygrometers[0]
+        self.mac = self.hygrometer.mac_address
+        self.dashboard = dashboard(self.prom_registry)
+        self.h._add_stats_callbacks(self.hygrometer)
+
+    def test_deltas(self) -> None:
+        self.hygrometer.process_data(fake_advertisement(self.mac))
+        self.hygrometer.process_data(fake_advertisement(self.mac, rssi=-61))
+        # Only the latest sample is kept until the next push
+        deltas = self.dashboard.collect_deltas(69)
+        self.assertEqual("HS075S", deltas[self.mac]["module"])
+        self.assertEqual("HS075S-Test-1", deltas[self.mac]["dev_name"])
+        self.assertEqual(-61, deltas[self.mac]["stats"]["rssi"])
+        self.assertEqual(5, len(deltas[self.mac]["stats"]))
+
+        self.hygrometer.process_data(fake_advertisement(self.mac, rssi=-70))
+        self.assertEqual(
+            {self.mac: {"stats": {"rssi": -70}, "updated": 70}},
+            self.dashboard.collect_deltas(70),
+        )
+        self.assertEqual({}, self.dashboard.collect_deltas(71))
+
+        # Served from the history store - every sample, not just pushed ones
+        history = self.dashboard.history_json(self.mac)[self.mac]
+        self.assertEqual(3, len(history["time"]))
+        self.assertEqual([-60, -61, -70], history["rssi"])
+        self.assertEqual(
+            [-61, -70], self.dashboard.history_json(last=2)[self.mac]["rssi"]
+        )
+        self.assertEqual({}, self.dashboard.history_json("00:00:00:00:00:00"))
+
+    def test_slow_viewer_resyncs(self) -> None:
+        viewer: "asyncio.Queue[bytes]" = asyncio.Queue(1)
+        self.dashboard.viewers.add(viewer)
+        self.dashboard.broadcast(b"one")
+        self.dashboard.broadcast(b"two")
+        self.assertEqual("snapshot", _parse_event(viewer.get_nowait())[0])
+
+    async def test_event_stream(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        run_task = asyncio.create_task(self.dashboard.run(port, push_interval=0))
+        try:
+            await asyncio.sleep(0.1)
+            async with ClientSession(f"http://127.0.0.1:{port}") as session:
+                async with session.get("/") as resp:
+                    self.assertIn("EventSource", await resp.text())
+
+                async with session.get("/events") as resp:
+                    self.assertEqual("text/event-stream", resp.content_type)
+                    event, data = _parse_event(await resp.content.readuntil(b"\n\n"))
+                    self.assertEqual(("snapshot", {}), (event, data))
+                    self.assertEqual(1, len(self.dashboard.viewers))
+
+                    self.hygrometer.process_data(fake_advertisement(self.mac))
+                    event, data = _parse_event(await resp.content.readuntil(b"\n\n"))
+                    self.assertEqual("delta", event)
+                    self.assertEqual(50.2, data[self.mac]["stats"]["humidity"])
+
+                async with session.get("/api/state") as resp:
+                    state = await resp.json()
+                    self.assertEqual(21.75, state[self.mac]["stats"]["temperature_c"])
+                async with session.get("/api/history") as resp:
+                    self.assertEqual([50.2], (await resp.json())[self.mac]["humidity"])
+                async with session.get("/api/history?last=x") as resp:
+                    self.assertEqual(400, resp.status)
+                query = {"mac": self.mac, "field": "humidity", "last": "1"}
+                async with session.get("/api/query", params=query) as resp:
+                    self.assertEqual([50.2], (await resp.json())["value"])
+                query = {"mac": self.mac, "field": "humidity", "step": "60"}
+                async with session.get("/api/query", params=query) as resp:
+                    self.assertEqual([50.2], (await resp.json())["mean"])
+                query["step"] = "0"
+                async with session.get("/api/query", params=query) as resp:
+                    self.assertEqual(400, resp.status)
+        finally:
+            run_task.cancel()
+            await asyncio.gather(run_task, return_exceptions=True)
+        self.assertEqual(0, len(self.dashboard.viewers))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import struct
+import unittest
+
+from aioprometheus.collectors import Registry
+
+from vand.decoders import compile_decoder
+from vand.govee import HS075S_DECODER, WeatherMetrics
+from vand.li3 import LI3_DECODER, Li3TelemetryStats
+
+
+class TestFrameDecoder(unittest.TestCase):
+    def test_li3_decode(self) -> None:
+        self.assertEqual(
+            Li3TelemetryStats(13.09, 3.27, 3.27, 3.28, 3.27, 32, 39, 0, 79, 0),
+            LI3_DECODER.decode(b"1309,327,327,328,327,32,39,0,79,000000"),
+        )
+        self.assertEqual(
+            0x1A,
+            LI3_DECODER.decode(b"1309,327,327,328,327,32,39,0,79,00001A").fault_code,
+        )
+
+    def test_li3_decode_bad_frames(self) -> None:
+        with self.assertRaises(ValueError):
+            LI3_DECODER.decode(b"1309,327,327,328,327,32,39,0,79")
+        with self.assertRaises(ValueError):
+            LI3_DECODER.decode(b"1309,327,327,328,327,32,39,0,79,0,0")
+        with self.assertRaises(ValueError):
+            LI3_DECODER.decode(b"1309,327,BAD,328,327,32,39,0,79,000000")
+
+    def test_hs075s_decode(self) -> None:
+        payloads = []
+        for encoded_data in range(0, 0xFFFFFF, 7919):
+            mfg_data = struct.pack(">HIBB", 0xEC88, encoded_data, 64, 0)
+            payloads.append(mfg_data)
+            # H5075 scaling as the hand written decoding had it
+            expected = WeatherMetrics(
+                battery_pct_left=64,
+                humidity=round((encoded_data % 1000) / 10, 2),
+                rssi=-42,
+                temperature_c=round(encoded_data / 10000, 2),
+                temperature_f=round(((encoded_data / 10000) * 1.8) + 32, 2),
+            )
+            self.assertEqual(expected, HS075S_DECODER.decode(mfg_data, -42))
+
+        # decode_batch() runs the same spec a column at a time
+        columns = HS075S_DECODER.decode_batch(b"".join(payloads), 8)
+        self.assertNotIn("rssi", columns)
+        for idx, mfg_data in enumerate(payloads):
+            stats = HS075S_DECODER.decode(mfg_data, -42)
+            for field_name, column in columns.items():
+                self.assertEqual(getattr(stats, field_name), column[idx])
+
+    def test_decode_batch_errors(self) -> None:
+        with self.assertRaises(ValueError):
+            LI3_DECODER.decode_batch(b"1309,327")
+        with self.assertRaises(ValueError):
+            HS075S_DECODER.decode_batch(b"", 4)
+        self.assertEqual(0, len(HS075S_DECODER.decode_batch(b"", 10)["temperature_c"]))
+
+    def test_generated_stats_class(self) -> None:
+        decoder = compile_decoder(
+            {
+                "name": "ShuntStats",
+                "separator": ";",
+                "fields": [
+                    {"name": "volts", "column": 0, "divide": 1000, "unit": "volts"},
+                    {"name": "amps", "column": 2, "scale": -1, "offset": 0.5},
+                    {"name": "alarms", "column": 1, "type": "hex", "mask": 0xF0},
+                ],
+            }
+        )
+        self.assertEqual("ShuntStats", decoder.stats_class.__name__)
+        self.assertEqual(3, decoder.columns)
+        stats = decoder.decode(b"12800;FF;3")
+        self.assertEqual((12.8, 0xF0, -2.5), (stats.volts, stats.alarms, stats.amps))
+
+    def test_gauges(self) -> None:
+        gauges = HS075S_DECODER.gauges(Registry(), "unittest_")
+        self.assertEqual(
+            ["battery_pct_left", "humidity", "rssi", "temperature_c", "temperature_f"],
+            sorted(gauges),
+        )
+        self.assertEqual("unittest_humidity", gauges["humidity"].name)
+        self.assertEqual("Humidity percentage", gauges["humidity"].doc)
+
+    def test_invalid_specs(self) -> None:
+        for spec in (
+            {"name": "Bad", "format": "xml", "fields": []},
+            {"name": "Bad", "fields": [{"name": "class", "column": 0}]},
+            {"name": "Bad", "fields": [{"name": "volts", "type": "str"}]},
+            {"name": "Bad", "fields": [{"name": "volts", "divide": "10"}]},
+            {"name": "Bad", "fields": [{"name": "volts"}]},
+            {
+                "name": "Bad",
+                "format": "struct",
+                "layout": ">H",
+                "fields": [{"name": "a"}],
+            },
+        ):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                compile_decoder(spec)
+        with self.assertRaises(ValueError):
+            compile_decoder(
+                {"name": "WeatherMetrics", "fields": [{"name": "rssi", "column": 0}]},
+                WeatherMetrics,
+            )
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import copy
+import json
+import unittest
+from math import inf
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict
+
+from aioprometheus.collectors import Registry
+
+from vand import li3
+from vand.tests.li3_fixtures import FAKE_LI3_BINARY_DATA, TEST_LI3_CONFIG
+
+
+class TestDerivedMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.td = TemporaryDirectory()
+        self.state_path = Path(self.td.name) / "derived.json"
+        self.conf: Dict[str, Any] = copy.deepcopy(TEST_LI3_CONFIG)
+        self.conf["vanD"] = {
+            "derived_metrics": {
+                "state_path": str(self.state_path),
+                "capacity_ah": 100.0,
+                "smoothing": 60.0,
+            }
+        }
+        self.rb = li3.RevelBatteries(self.conf, Registry())
+        for battery in self.rb.batteries:
+            for data in FAKE_LI3_BINARY_DATA:
+                battery._telementary_handler("unittest", data)
+        assert self.rb.derived is not None
+        self.derived = self.rb.derived
+        # Drop the state the handler made with the real time
+        self.derived.states.clear()
+        self.battery = self.rb.batteries[0]
+
+    def tearDown(self) -> None:
+        self.td.cleanup()
+
+    def _sample(self, battery: li3.Li3Battery, amps: float, timestamp: float) -> None:
+        assert battery.stats
+        battery.stats = li3.Li3TelemetryStats(
+            **{**battery.stats.__dict__, "battery_power": amps}
+        )
+        self.derived.add_sample(battery, timestamp)
+
+    def test_integration(self) -> None:
+        # 10A out for 6 minutes is 1Ah
+        for timestamp in range(1, 362, 10):
+            self._sample(self.battery, -10.0, timestamp)
+        state = self.derived.states[self.battery.mac_address]
+        self.assertAlmostEqual(1.0, state.charge_out)
+        self.assertEqual(0.0, state.charge_in)
+        assert self.battery.stats
+        self.assertAlmostEqual(self.battery.stats.battery_voltage, state.energy_out)
+
+        # Trapezoid between the 2 samples + a disconnect's gap isn't integrated
+        self._sample(self.battery, 10.0, 371)
+        self._sample(self.battery, 20.0, 401)
+        self.assertAlmostEqual(0.125, state.charge_in)
+        self._sample(self.battery, 20.0, 1000)
+        self.assertAlmostEqual(0.125, state.charge_in)
+        self.assertEqual(20.0, state.current)
+
+    def test_imbalance_and_time_to(self) -> None:
+        self._sample(self.battery, -50.0, 1)
+        self.derived.publish(self.battery)
+        assert self.battery.stats
+        stats = self.battery.stats
+        cells = [getattr(stats, f"cell_{i}_voltage") for i in range(1, 5)]
+        labels = self.battery.prom_labels
+        self.assertAlmostEqual(
+            max(cells) - min(cells),
+            self.derived.prom_stats["cell_imbalance"].get(labels),
+        )
+        time_to_empty = self.derived.prom_stats["time_to_empty"].get(labels)
+        assert isinstance(time_to_empty, float)
+        self.assertAlmostEqual(100 * stats.battery_soc / 100 / 50 * 3600, time_to_empty)
+        self.assertEqual(inf, self.derived.prom_stats["time_to_full"].get(labels))
+        self.assertEqual((inf, inf), self.derived.time_to(50, 0.1))
+        self.assertEqual((inf, 3600.0), self.derived.time_to(50, 50))
+
+        # Bank wide across both batteries
+        self._sample(self.rb.batteries[1], 30.0, 1)
+        self.derived.collect()
+        self.assertEqual(
+            (100 * 2 * stats.battery_soc / 100 / 20 * 3600, inf),
+            (
+                self.derived.prom_stats["bank_time_to_empty"].get({}),
+                self.derived.prom_stats["bank_time_to_full"].get({}),
+            ),
+        )
+        self.assertAlmostEqual(
+            max(cells) - min(cells),
+            self.derived.prom_stats["bank_cell_imbalance"].get({}),
+        )
+
+    def test_persistence(self) -> None:
+        for timestamp in range(1, 362, 10):
+            self._sample(self.battery, 10.0, timestamp)
+        self.derived.save()
+        with self.state_path.open() as sfp:
+            saved = json.load(sfp)
+        self.assertAlmostEqual(1.0, saved[self.battery.mac_address]["charge_in"])
+
+        # Counters carry on from the saved totals after a restart
+        rb = li3.RevelBatteries(self.conf, Registry())
+        assert rb.derived is not None
+        self.derived = rb.derived
+        for timestamp in range(1, 362, 10):
+            self._sample(self.battery, 10.0, timestamp)
+        self.derived.publish(self.battery)
+        charge_in = self.derived.prom_stats["charge"].get(
+            {**self.battery.prom_labels, "direction": "in"}
+        )
+        assert isinstance(charge_in, float)
+        self.assertAlmostEqual(2.0, charge_in)
+
+        self.derived.remove(self.battery.mac_address)
+        self.derived.save()
+        with self.state_path.open() as sfp:
+            self.assertEqual({}, json.load(sfp))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()
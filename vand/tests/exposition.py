@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import gzip
+import socket
+import unittest
+
+from aiohttp import ClientSession
+from aioprometheus import Gauge, Histogram
+from aioprometheus.collectors import Registry
+from aioprometheus.renderer import render
+
+from vand.exposition import CachedExposition, CachedService
+
+
+class TestCachedExposition(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.registry = Registry()
+        self.gauge = Gauge("unittest", "Unit test gauge", registry=self.registry)
+        self.histogram = Histogram(
+            "unittest_seconds", "Unit test histogram", registry=self.registry
+        )
+        self.gauge.set({"dev_name": "one"}, 1)
+        self.gauge.set({"dev_name": "two"}, 2)
+        self.histogram.observe({}, 0.1)
+        self.exposition = CachedExposition(self.registry, coalesce_interval=0)
+
+    def test_refresh(self) -> None:
+        self.exposition.refresh()
+        self.assertEqual(render(self.registry, [])[0], self.exposition.body)
+        self.assertEqual(
+            (1, 2), (self.exposition.renders, self.exposition.block_renders)
+        )
+        etag = self.exposition.etag
+
+        # Setting the same value is not a change
+        self.gauge.set({"dev_name": "one"}, 1)
+        self.exposition.refresh()
+        self.assertEqual(
+            (1, 2), (self.exposition.renders, self.exposition.block_renders)
+        )
+        self.assertEqual(etag, self.exposition.etag)
+
+        # Only the changed collector is re-rendered
+        self.gauge.set({"dev_name": "one"}, 69)
+        self.exposition.refresh()
+        self.assertEqual(
+            (2, 3), (self.exposition.renders, self.exposition.block_renders)
+        )
+        self.assertNotEqual(etag, self.exposition.etag)
+        self.histogram.observe({}, 0.1)
+        self.exposition.refresh()
+        self.assertEqual(
+            (3, 4), (self.exposition.renders, self.exposition.block_renders)
+        )
+        self.assertEqual(render(self.registry, [])[0], self.exposition.body)
+        self.assertEqual(
+            self.exposition.body, gzip.decompress(self.exposition.gzip_body)
+        )
+
+    def test_coalesce(self) -> None:
+        self.exposition.coalesce_interval = 60
+        self.exposition.refresh()
+        self.gauge.set({"dev_name": "one"}, 69)
+        self.exposition.refresh()
+        self.assertEqual(1, self.exposition.renders)
+        self.exposition.refresh(force=True)
+        self.assertEqual(2, self.exposition.renders)
+
+    async def test_service(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        service = CachedService(self.registry, coalesce_interval=0)
+        await service.start(port=port)
+        try:
+            async with ClientSession(f"http://127.0.0.1:{port}") as session:
+                async with session.get("/metrics") as resp:
+                    self.assertEqual("gzip", resp.headers["Content-Encoding"])
+                    self.assertEqual(render(self.registry, [])[0], await resp.read())
+                    etag = resp.headers["ETag"]
+
+                headers = {"If-None-Match": f'"nope", W/{etag}'}
+                async with session.get("/metrics", headers=headers) as resp:
+                    self.assertEqual(304, resp.status)
+
+                self.gauge.set({"dev_name": "two"}, 69)
+                async with session.get("/metrics", headers=headers) as resp:
+                    self.assertEqual(200, resp.status)
+                    self.assertIn(b'unittest{dev_name="two"} 69', await resp.read())
+        finally:
+            await service.stop()
+        self.assertEqual(2, service.exposition.renders)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import asyncio
+import copy
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict
+from unittest.mock import patch
+
+from aioprometheus.collectors import Registry
+from bleak.backends.device import BLEDevice
+from bleak.exc import BleakError
+
+from vand import li3
+from vand.backends import BleBackend, FakeBackend, set_backend
+from vand.gatt_cache import GattCache
+from vand.tests.li3_fixtures import TEST_LI3_CONFIG
+
+
+MAC = "FF:69:4E:38:44:B3"
+BLUEZ_DETAILS = {"path": "/org/bluez/hci0/dev_FF_69_4E_38_44_B3", "props": {}}
+
+
+class TestGattCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.td = TemporaryDirectory()
+        self.cache_path = str(Path(self.td.name) / "gatt_cache.json")
+        self.backend = FakeBackend()
+        set_backend(self.backend)
+
+    def tearDown(self) -> None:
+        set_backend(BleBackend())
+        self.td.cleanup()
+
+    def test_cache(self) -> None:
+        cache = GattCache(self.cache_path)
+        cache.update(MAC, "Li3", BLUEZ_DETAILS, "FOO", "BAR", 14)
+        # Persisted + only the plain data needed to connect
+        cached = GattCache(self.cache_path).get(MAC.lower(), "FOO", "BAR")
+        assert cached is not None
+        self.assertEqual({"path": BLUEZ_DETAILS["path"]}, cached.details)
+        self.assertEqual(14, cached.handle)
+
+        # Config changed to another characteristic
+        self.assertIsNone(cache.get(MAC, "FOO", "BAZ"))
+        self.assertIsNone(GattCache(self.cache_path).get(MAC, "FOO", "BAR"))
+
+        cache.update(MAC, "Li3", BLUEZ_DETAILS, "FOO", "BAR", 14)
+        self.assertIsNone(GattCache(self.cache_path, max_age=-1).get(MAC, "FOO", "BAR"))
+
+        # Details we can't connect with later are not cached
+        cache.update("00:11:22:33:44:55", "Mac", (object(), None), "FOO", "BAR", 14)
+        self.assertNotIn("00:11:22:33:44:55", cache.devices)
+
+        Path(self.cache_path).write_text("{")
+        self.assertEqual({}, GattCache(self.cache_path).devices)
+
+    def test_unchanged_update_skips_write(self) -> None:
+        cache = GattCache(self.cache_path)
+        cache.update(MAC, "Li3", BLUEZ_DETAILS, "FOO", "BAR", 14)
+        mtime_ns = Path(self.cache_path).stat().st_mtime_ns
+        updated = cache.devices[MAC].updated
+        with patch.object(cache, "_save") as save:
+            cache.update(MAC, "Li3", BLUEZ_DETAILS, "FOO", "BAR", 14)
+            save.assert_not_called()
+            self.assertEqual(updated, cache.devices[MAC].updated)
+
+            # New handle, or an entry nearing max_age, is written
+            cache.update(MAC, "Li3", BLUEZ_DETAILS, "FOO", "BAR", 15)
+            self.assertEqual(1, save.call_count)
+            cache.devices[MAC] = replace(
+                cache.devices[MAC], updated=updated - cache.max_age
+            )
+            cache.update(MAC, "Li3", BLUEZ_DETAILS, "FOO", "BAR", 15)
+            self.assertEqual(2, save.call_count)
+        self.assertEqual(mtime_ns, Path(self.cache_path).stat().st_mtime_ns)
+
+    async def test_li3_connect(self) -> None:
+        settings = TEST_LI3_CONFIG["li3"]["1"]
+        self.backend.add_gatt_devices([(MAC, "FOO", "BAR")])
+        battery = li3.Li3Battery(**settings)  # type: ignore
+        battery.gatt_cache = GattCache(self.cache_path)
+        battery.bleak_device = BLEDevice(MAC, "Li3", BLUEZ_DETAILS)
+        client = await battery.connect()
+        await battery.disconnect(client)
+        self.assertIn(MAC, battery.gatt_cache.devices)
+
+        # Restart - connect without having been discovered
+        battery = li3.Li3Battery(**settings)  # type: ignore
+        battery.gatt_cache = GattCache(self.cache_path)
+        client = await battery.connect()
+        self.assertIs(client, self.backend.clients[MAC])
+        self.assertIsNotNone(client.notify_callback)
+        await battery.disconnect(client)
+
+        # Cached connect failing invalidates so the next does full discovery
+        self.backend.gatt_devices.clear()
+        with self.assertRaises(BleakError):
+            await battery.connect()
+        self.assertEqual({}, battery.gatt_cache.devices)
+
+    async def test_li3_skips_scan(self) -> None:
+        conf: Dict[str, Any] = copy.deepcopy(TEST_LI3_CONFIG)
+        conf["vanD"] = {"gatt_cache": {"path": self.cache_path}}
+        cache = GattCache(self.cache_path)
+        for settings in conf["li3"].values():
+            cache.update(
+                settings["mac_address"], "Li3", BLUEZ_DETAILS, "FOO", "BAR", 14
+            )
+
+        # Nothing advertising but every battery is cached
+        rb = li3.RevelBatteries(conf, Registry())
+        await asyncio.wait_for(rb.scan_devices(30), 1)
+        self.assertTrue(rb.all_seen.is_set())
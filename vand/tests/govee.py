@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from typing import List
+
+from aioprometheus.collectors import Registry
+
+from vand import govee
+from vand.backends import fake_advertisement, FAKE_HS075S_MFG_DATA
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+
+
+class TestHygrometers(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.prom_registry = Registry()
+        self.h = govee.Hygrometers(TEST_HS075S_CONFIG["HS075S"], self.prom_registry)
+
+    def test_init_worked(self) -> None:
+        self.assertEqual(2, len(self.h.hygrometers))
+        self.assertEqual(2, len(self.h.scanner.handlers))
+
+    async def test_scanner_dispatch(self) -> None:
+        self.h.scanner._loop = asyncio.get_running_loop()
+        first, second = self.h.hygrometers
+        self.h.scanner.on_advertising_data(fake_advertisement(first.mac_address))
+        self.h.scanner.on_advertising_data(fake_advertisement("00:11:22:33:44:55"))
+        await asyncio.sleep(0)
+
+        expected_stats = govee.WeatherMetrics(
+            battery_pct_left=100,
+            humidity=50.2,
+            rssi=-60,
+            temperature_c=21.75,
+            temperature_f=71.15,
+        )
+        self.assertEqual(expected_stats, first.stats)
+        self.assertEqual(0, second.stats.rssi)
+
+    async def test_event_stats(self) -> None:
+        coros = await self.h.get_awaitables(30, event_stats=True)
+        self.assertEqual(1, len(coros))
+        for coro in coros:
+            coro.close()  # type: ignore
+
+        hygrometer = self.h.hygrometers[0]
+        hygrometer.process_data(fake_advertisement(hygrometer.mac_address))
+        rssi_gauge = self.h.prom_stats["rssi"]
+        self.assertEqual(-60, rssi_gauge.get(hygrometer.prom_labels))
+
+        hygrometer.process_data(fake_advertisement(hygrometer.mac_address, rssi=-70))
+        self.assertEqual(-70, rssi_gauge.get(hygrometer.prom_labels))
+
+    def test_duplicate_suppression(self) -> None:
+        hygrometer = self.h.hygrometers[0]
+        samples: List[govee.WeatherMetrics] = []
+        hygrometer.stats_callbacks.append(lambda h: samples.append(h.stats))
+        hygrometer.process_data(fake_advertisement(hygrometer.mac_address))
+        hygrometer.process_data(fake_advertisement(hygrometer.mac_address))
+        self.assertEqual(1, len(samples))
+        self.assertEqual(1, hygrometer.duplicates_suppressed)
+
+        # Same payload with a new RSSI only updates the RSSI
+        hygrometer.process_data(fake_advertisement(hygrometer.mac_address, rssi=-70))
+        self.assertEqual(2, len(samples))
+        self.assertEqual(samples[0].humidity, samples[1].humidity)
+        self.assertEqual(-70, hygrometer.stats.rssi)
+
+    def test_decode_batch(self) -> None:
+        columns = govee.decode_batch(FAKE_HS075S_MFG_DATA * 3)
+        self.assertEqual([21.75] * 3, list(columns["temperature_c"]))
+        self.assertEqual([71.15] * 3, list(columns["temperature_f"]))
+        self.assertEqual([50.2] * 3, list(columns["humidity"]))
+        self.assertEqual([100] * 3, list(columns["battery_pct_left"]))
+
+        padded = govee.decode_batch(FAKE_HS075S_MFG_DATA + b"\x00\x00", 10)
+        self.assertEqual([21.75], list(padded["temperature_c"]))
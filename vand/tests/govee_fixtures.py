@@ -0,0 +1,18 @@
+TEST_HS075S_CONFIG = {
+    "HS075S": {
+        "1": {
+            "dev_name": "HS075S-Test-1",
+            "mac_address": "A4:C1:38:31:7D:5D",
+            "service_uuid": "0000ec88-0000-1000-8000-00805f9b34fb",
+            "characteristic": "",
+            "timeout": 0.1,
+        },
+        "2": {
+            "dev_name": "HS075S-Test-2",
+            "mac_address": "A4:C1:38:17:54:34",
+            "service_uuid": "0000ec88-0000-1000-8000-00805f9b34fb",
+            "characteristic": "",
+            "timeout": 0.1,
+        },
+    }
+}
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from aioprometheus.collectors import Registry
+
+from vand import govee
+from vand.backends import fake_advertisement
+from vand.history import BYTES_PER_SAMPLE, history_store, Series
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.series = Series(4)
+        for timestamp in range(10, 16):
+            self.series.append(timestamp, timestamp * 2)
+
+    def test_series(self) -> None:
+        # Oldest 2 samples overwritten
+        self.assertEqual(4, len(self.series))
+        timestamps, values = self.series.last(3)
+        self.assertEqual([13, 14, 15], timestamps.tolist())
+        self.assertEqual([26, 28, 30], values.tolist())
+        self.assertEqual([12, 13, 14, 15], self.series.last(69)[0].tolist())
+
+        timestamps, values = self.series.between(11, 14)
+        self.assertEqual([12, 13, 14], timestamps.tolist())
+        self.assertEqual([24, 26, 28], values.tolist())
+        self.assertEqual([], self.series.between(16, 20)[0].tolist())
+
+    def test_downsample(self) -> None:
+        downsampled = self.series.downsample(12, 15, 2)
+        self.assertEqual([12, 14], downsampled.timestamps.tolist())
+        self.assertEqual([24, 28], downsampled.mins.tolist())
+        self.assertEqual([26, 30], downsampled.maxs.tolist())
+        self.assertEqual([25, 29], downsampled.means.tolist())
+
+    def test_store(self) -> None:
+        registry = Registry()
+        store = history_store(registry)
+        # Room for exactly one hygrometer's 5 fields
+        store.configure(capacity=10, max_memory=5 * 10 * BYTES_PER_SAMPLE)
+        h = govee.Hygrometers(TEST_HS075S_CONFIG["HS075S"], registry)
+        for hygrometer in h.hygrometers:
+            h._add_stats_callbacks(hygrometer)
+            hygrometer.process_data(fake_advertisement(hygrometer.mac_address))
+            hygrometer.process_data(
+                fake_advertisement(hygrometer.mac_address, rssi=-61)
+            )
+
+        kept, dropped = h.hygrometers
+        humidity = store.get(kept.mac_address, "humidity")
+        rssi = store.get(kept.mac_address, "rssi")
+        assert humidity is not None and rssi is not None
+        self.assertEqual([50.2, 50.2], humidity.last(2)[1].tolist())
+        self.assertEqual([-60, -61], rssi.last(2)[1].tolist())
+        self.assertIsNone(store.get(dropped.mac_address, "humidity"))
+        self.assertEqual(1, store.prom_stats["devices_dropped"].get({}))
+        self.assertEqual(store.max_memory, store.memory_bytes)
+
+        store.remove(kept.mac_address)
+        self.assertEqual(0, store.memory_bytes)
+        self.assertIsNone(store.get(kept.mac_address, "humidity"))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from time import perf_counter
+from unittest.mock import patch
+
+from aioprometheus.collectors import Registry
+
+from vand import govee, li3
+from vand.backends import fake_advertisement
+from vand.instrumentation import vand_metrics
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+from vand.tests.li3_fixtures import FAKE_LI3_BINARY_DATA, TEST_LI3_CONFIG
+
+
+class TestVandMetrics(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.prom_registry = Registry()
+        self.metrics = vand_metrics(self.prom_registry)
+
+    def test_shared_per_registry(self) -> None:
+        self.assertIs(self.metrics, vand_metrics(self.prom_registry))
+        self.assertIsNot(self.metrics, vand_metrics(Registry()))
+
+    async def test_li3_metrics(self) -> None:
+        rb = li3.RevelBatteries(TEST_LI3_CONFIG, self.prom_registry)
+        for coro in await rb.get_awaitables(30, event_stats=True):
+            coro.close()  # type: ignore
+        battery = rb.batteries[0]
+        for data in FAKE_LI3_BINARY_DATA + [b"1309,327", b"1309,327"]:
+            battery._telementary_handler("unittest", data)
+        self.metrics.collect()
+
+        prom_stats = self.metrics.prom_stats
+        self.assertEqual(1, prom_stats["frames_parsed"].get(battery.prom_labels))
+        self.assertEqual(1, prom_stats["frames_dropped"].get(battery.prom_labels))
+        latency = self.metrics.histograms["handler_latency"].get({"module": "li3"})
+        self.assertEqual(1, latency["count"])
+
+    async def test_hs075s_metrics(self) -> None:
+        h = govee.Hygrometers(TEST_HS075S_CONFIG["HS075S"], self.prom_registry)
+        h.scanner._loop = asyncio.get_running_loop()
+        hygrometer = h.hygrometers[0]
+        h.scanner.on_advertising_data(fake_advertisement(hygrometer.mac_address))
+        h.scanner.on_advertising_data(fake_advertisement("00:11:22:33:44:55"))
+        wrong_uuid = fake_advertisement(hygrometer.mac_address)
+        wrong_uuid.uuid16s = []
+        h.scanner.on_advertising_data(wrong_uuid)
+        await asyncio.sleep(0)
+        self.metrics.collect()
+
+        ignored = self.metrics.prom_stats["advertisements_ignored"]
+        self.assertEqual(1, ignored.get({"module": "HS075S", "filter": "mac_address"}))
+        self.assertEqual(1, ignored.get({"module": "HS075S", "filter": "service_uuid"}))
+        latency = self.metrics.histograms["handler_latency"].get({"module": "HS075S"})
+        self.assertEqual(2, latency["count"])
+
+    async def test_event_loop_lag(self) -> None:
+        probe = asyncio.ensure_future(self.metrics.run(0.01))
+        await asyncio.sleep(0)
+        # Block the loop so the probe wakes late
+        block_start = perf_counter()
+        while perf_counter() - block_start < 0.05:
+            pass
+        await asyncio.sleep(0.02)
+        probe.cancel()
+        lag = self.metrics.histograms["event_loop_lag"].get({})
+        self.assertGreaterEqual(lag["sum"], 0.03)  # type: ignore
+
+    async def test_executor_queue_depth(self) -> None:
+        loop = asyncio.get_running_loop()
+        with patch.object(loop, "_default_executor", None):
+            self.metrics.collect()
+            with self.assertRaises(KeyError):
+                self.metrics.prom_stats["executor_queue_depth"].get({})
+
+        await loop.run_in_executor(None, lambda: None)
+        self.metrics.collect()
+        self.assertEqual(0, self.metrics.prom_stats["executor_queue_depth"].get({}))
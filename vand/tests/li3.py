@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
+import asyncio
 import unittest
 
 from aioprometheus.collectors import Registry
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
 
 from vand import li3
 from vand.tests.li3_fixtures import FAKE_LI3_BINARY_DATA, TEST_LI3_CONFIG
@@ -15,8 +18,10 @@ class TestLi3Battery(unittest.TestCase):
     def test_telementary_hander(self) -> None:
         for data in FAKE_LI3_BINARY_DATA:
             self.li3b._telementary_handler("unittest", data)
-        # See we have the str data we expect
-        self.assertEqual("1309,327,327,328,327,32,39,0,79,000000", self.li3b.str_data)
+        # See the parser assembled one frame around the & fragment
+        self.assertEqual(1, self.li3b.parser.frames_parsed)
+        self.assertEqual(1, self.li3b.parser.fragments_ignored)
+        self.assertEqual(0, len(self.li3b.parser.buffer))
         # Ensure stats is not None
         self.assertIsNotNone(self.li3b.stats)
         # Ensure Telemetry Stats are what we expect
@@ -35,6 +40,38 @@ class TestLi3Battery(unittest.TestCase):
         self.assertEqual(expected_li3ts, self.li3b.stats)
 
 
+class TestLi3FrameParser(unittest.TestCase):
+    def setUp(self) -> None:
+        self.parser = li3.Li3FrameParser()
+
+    def test_orphan_continuation(self) -> None:
+        self.assertIsNone(self.parser.feed(FAKE_LI3_BINARY_DATA[2]))
+        self.assertEqual(1, self.parser.frames_partial)
+        self.assertEqual(li3.Li3FrameParser.IDLE, self.parser.state)
+
+    def test_resync_after_lost_fragment(self) -> None:
+        # Lose the tail of the first frame - the next frame start resyncs
+        self.parser.feed(FAKE_LI3_BINARY_DATA[0])
+        for data in FAKE_LI3_BINARY_DATA:
+            stats = self.parser.feed(data)
+        self.assertIsNotNone(stats)
+        self.assertEqual(1, self.parser.frames_partial)
+        self.assertEqual(1, self.parser.frames_parsed)
+
+    def test_split_after_seperator(self) -> None:
+        for data in (b"1309,327,327,328,327,", b"32,39,0,79,", b"000000\r\n"):
+            stats = self.parser.feed(data)
+        self.assertIsNotNone(stats)
+        self.assertEqual(0x0, stats.fault_code if stats else None)
+
+    def test_malformed(self) -> None:
+        self.assertIsNone(self.parser.feed(b"1309,327,327,328,327,32,39,0,79,0,1"))
+        self.assertIsNone(self.parser.feed(b"1309,327,327,328,327,32,39,X,79,0"))
+        self.assertIsNone(self.parser.feed(b"\xff\x00"))
+        self.assertEqual(3, self.parser.frames_malformed)
+        self.assertEqual(0, self.parser.frames_parsed)
+
+
 class TestRevelBatteries(unittest.TestCase):
     def setUp(self) -> None:
         self.prom_registry = Registry()
@@ -42,3 +79,45 @@ class TestRevelBatteries(unittest.TestCase):
 
     def test_init_worked(self) -> None:
         self.assertEqual(2, len(self.rb.batteries))
+
+    def _detect(self, mac_address: str) -> None:
+        advertisement_data = AdvertisementData(None, {}, {}, [], None, -60, ())
+        self.rb._detection_callback(
+            BLEDevice(mac_address, "Li3", None), advertisement_data
+        )
+
+    def test_detection_callback(self) -> None:
+        first, second = self.rb.batteries
+        self._detect("00:11:22:33:44:55")
+        self.assertFalse(first.seen.is_set())
+
+        self._detect(first.mac_address)
+        self.assertTrue(first.seen.is_set())
+        assert first.bleak_device is not None
+        self.assertEqual(first.mac_address, first.bleak_device.address)
+        self.assertFalse(self.rb.all_seen.is_set())
+
+        self._detect(second.mac_address.lower())
+        self.assertTrue(self.rb.all_seen.is_set())
+
+    async def _get_event_awaitables(self) -> None:
+        coros = await self.rb.get_awaitables(30, event_stats=True)
+        # Only discovery + supervise_batteries - no stats_refresh loop
+        self.assertEqual(2, len(coros))
+        for coro in coros:
+            coro.close()  # type: ignore
+
+    def test_event_stats(self) -> None:
+        asyncio.run(self._get_event_awaitables())
+        battery = self.rb.batteries[0]
+        for data in FAKE_LI3_BINARY_DATA:
+            battery._telementary_handler("unittest", data)
+        soc_gauge = self.rb.prom_stats["battery_soc"]
+        self.assertEqual(79.0, soc_gauge.get(battery.prom_labels))
+        self.assertIs(battery.stats, self.rb.published_stats[battery.mac_address])
+
+        # Unchanged values are not written again
+        soc_gauge.set(battery.prom_labels, 1)
+        battery._telementary_handler("unittest", FAKE_LI3_BINARY_DATA[0])
+        battery._telementary_handler("unittest", FAKE_LI3_BINARY_DATA[2])
+        self.assertEqual(1, soc_gauge.get(battery.prom_labels))
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+"""Stand in observer worker - sends one advertisement per allowed MAC and dies"""
+
+import json
+import sys
+from time import monotonic
+
+from vand.backends import FAKE_HS075S_MFG_DATA
+from vand.observer_worker import (
+    load_decoder,
+    parse_args,
+    run_command,
+    sample_record,
+    SampleRing,
+    SampleWriter,
+)
+
+
+def main() -> int:
+    args = parse_args()
+    decoder = load_decoder(args.decoder)
+    ring = SampleRing(args.ring, args.slots, sample_record(decoder))
+    writer = SampleWriter(ring, decoder, args.service_uuid16)
+    run_command(writer, json.loads(sys.stdin.readline()))
+    for mac in writer.allowed:
+        # The repeat is suppressed here - never reaching the daemon
+        for _ in range(2):
+            writer.write(mac, -60, [0xEC88], FAKE_HS075S_MFG_DATA, monotonic())
+    ring.close()
+    return 1
+
+
+if __name__ == "__main__":  # pragma: no cover
+    raise SystemExit(main())
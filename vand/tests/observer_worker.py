@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+import unittest
+from time import monotonic
+from typing import Any, List
+
+from aioprometheus.collectors import Registry
+
+from vand import govee
+from vand.backends import FAKE_HS075S_MFG_DATA
+from vand.observer_worker import (
+    load_decoder,
+    mac_bytes,
+    ObserverProcess,
+    sample_record,
+    SampleRing,
+    SampleWriter,
+)
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+
+DECODER = "vand.govee:HS075S_DECODER"
+MAC_ADDRESS = "A4:C1:38:31:7D:5D"
+
+
+class TestObserverWorker(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.decoder = load_decoder(DECODER)
+        self.ring = SampleRing.create(4, sample_record(self.decoder))
+        self.writer = SampleWriter(self.ring, self.decoder, 0xEC88)
+        self.mac = mac_bytes(MAC_ADDRESS)
+        self.writer.allowed = frozenset([self.mac])
+
+    def tearDown(self) -> None:
+        self.ring.close(unlink=True)
+
+    def _write(self, rssi: int = -60, mfg_data: bytes = FAKE_HS075S_MFG_DATA) -> bool:
+        return self.writer.write(self.mac, rssi, [0xEC88], mfg_data, monotonic())
+
+    def test_ring(self) -> None:
+        for rssi in range(-60, -54):
+            self._write(rssi)
+        # Full after 4
+        self.assertEqual(2, self.ring.dropped)
+        records = self.ring.drain(3)
+        self.assertEqual([-60, -59, -58], [r[5] for r in records])
+        self.assertEqual(
+            (self.mac, 100, 50.2, -60, 21.75, 71.15), tuple(records[0][2:])
+        )
+
+        # Wraps around
+        self.assertTrue(self._write(-1))
+        self.assertEqual([-57, -1], [r[5] for r in self.ring.drain(69)])
+        self.assertEqual([], self.ring.drain(69))
+
+    def test_writer_filters(self) -> None:
+        self.assertTrue(self._write())
+        # Repeats only get through when the RSSI changed
+        self.assertFalse(self._write())
+        self.assertTrue(self._write(-61))
+        self.writer.forget(self.mac)
+        self.assertTrue(self._write(-61))
+        # Other MACs, other service UUIDs + undecodable data
+        self.assertFalse(
+            self.writer.write(
+                mac_bytes("00:11:22:33:44:55"), -60, [0xEC88], b"", monotonic()
+            )
+        )
+        self.assertFalse(
+            self.writer.write(self.mac, -60, [], FAKE_HS075S_MFG_DATA, monotonic())
+        )
+        self.assertFalse(self._write(mfg_data=b"\x88"))
+        self.assertEqual(2, self.ring.ignored)
+        self.assertEqual(3, len(self.ring.drain(69)))
+
+    def test_dispatch(self) -> None:
+        samples: List[Any] = []
+        latencies: List[float] = []
+        process = ObserverProcess(
+            {MAC_ADDRESS: samples.append}, latencies.append, DECODER, 0xEC88
+        )
+        process.ring = self.ring
+        self._write()
+        # Allowed when written but since unregistered
+        self.ring.push(mac_bytes("00:11:22:33:44:55"), monotonic(), (1, 2, 3, 4, 5))
+        self.assertEqual(2, process.drain())
+        self.assertEqual(1, len(latencies))
+        self.assertEqual(
+            [govee.HS075S_DECODER.decode(FAKE_HS075S_MFG_DATA, -60)], samples
+        )
+
+    async def test_worker_restarts(self) -> None:
+        h = govee.Hygrometers(
+            TEST_HS075S_CONFIG["HS075S"],
+            Registry(),
+            observer_worker={
+                "command": [sys.executable, "-m", "vand.tests.observer_fixtures"],
+                "drain_interval": 0.01,
+                "restart_delay": 0,
+            },
+        )
+        listen_task = asyncio.create_task(h.scanner.listen())
+        try:
+            while not h.scanner.worker_process or h.scanner.worker_process.restarts < 2:
+                await asyncio.sleep(0.01)
+        finally:
+            listen_task.cancel()
+            await asyncio.gather(listen_task, return_exceptions=True)
+        self.assertEqual([50.2, 50.2], [hm.stats.humidity for hm in h.hygrometers])
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import gc
+import unittest
+from typing import List
+from weakref import ref
+
+from aioprometheus.collectors import Registry
+
+from vand.registry import per_registry
+
+
+class TestPerRegistry(unittest.TestCase):
+    def test_one_per_registry(self) -> None:
+        created: List[Registry] = []
+
+        @per_registry
+        def thing(registry: Registry) -> object:
+            """Docstring is kept"""
+            created.append(registry)
+            return object()
+
+        registry = Registry()
+        self.assertIs(thing(registry), thing(registry))
+        self.assertIsNot(thing(registry), thing(Registry()))
+        self.assertEqual(2, len(created))
+        self.assertEqual("Docstring is kept", thing.__doc__)
+
+    def test_registry_not_kept_alive(self) -> None:
+        thing = per_registry(lambda registry: object())
+        registry = Registry()
+        thing(registry)
+        registry_ref = ref(registry)
+        del registry
+        gc.collect()
+        self.assertIsNone(registry_ref())
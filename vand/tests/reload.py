@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import asyncio
+import copy
+import json
+import os
+import signal
+import socket
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List
+
+from aioprometheus import Gauge
+from aioprometheus.collectors import Registry
+
+from vand import govee, li3
+from vand.backends import BleBackend, fake_advertisement, FakeBackend, set_backend
+from vand.main import async_main
+from vand.reload import config_reloader, relabel_series, remove_series
+from vand.supervisor import Supervisor
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+from vand.tests.li3_fixtures import FAKE_LI3_BINARY_DATA, TEST_LI3_CONFIG
+
+
+class TestConfigReload(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.prom_registry = Registry()
+        self.backend = FakeBackend()
+        set_backend(self.backend)
+
+    def tearDown(self) -> None:
+        set_backend(BleBackend())
+
+    def test_series_helpers(self) -> None:
+        gauge = Gauge("unittest", "unittest", registry=self.prom_registry)
+        gauge.set({"dev_name": "a", "mac_address": "1"}, 1)
+        gauge.set({"dev_name": "a", "mac_address": "1", "agg": "max"}, 2)
+        gauge.set({"dev_name": "b", "mac_address": "2"}, 3)
+
+        relabel_series(self.prom_registry, {"mac_address": "1"}, {"dev_name": "c"})
+        self.assertEqual(1, gauge.get({"dev_name": "c", "mac_address": "1"}))
+        self.assertEqual(
+            2, gauge.get({"dev_name": "c", "mac_address": "1", "agg": "max"})
+        )
+        self.assertEqual(2, remove_series(self.prom_registry, {"mac_address": "1"}))
+        self.assertEqual(1, len(gauge.values))
+
+    async def test_li3_reload(self) -> None:
+        conf = copy.deepcopy(TEST_LI3_CONFIG)
+        rb = li3.RevelBatteries(conf, self.prom_registry)
+        self.backend.add_gatt_devices(
+            [(b.mac_address, b.service_uuid, b.characteristic) for b in rb.batteries]
+        )
+        await rb.scan_devices(1)
+        discovery, supervise = (
+            asyncio.ensure_future(coro)
+            for coro in await rb.get_awaitables(30, event_stats=True)
+        )
+        try:
+            renamed, removed = rb.batteries
+            while len(self.backend.clients) < 2:
+                await asyncio.sleep(0)
+            for data in FAKE_LI3_BINARY_DATA:
+                self.backend.notify(renamed.mac_address, data)
+
+            new_conf = copy.deepcopy(conf)
+            new_conf["li3"]["1"]["dev_name"] = "Li3-Renamed"
+            del new_conf["li3"]["2"]
+            new_conf["li3"]["3"] = {
+                **conf["li3"]["2"],
+                "dev_name": "Li3-Test-3",
+                "mac_address": "FF:69:4E:00:00:03",
+            }
+            renamed_task = rb.supervise_tasks[renamed.mac_address]
+            await rb.reload(new_conf)
+            # Discovery is still running so sees the new battery advertise
+            self.backend.add_gatt_devices([("FF:69:4E:00:00:03", "FOO", "BAR")])
+            self.assertFalse(rb.rescan.is_set())
+
+            self.assertEqual(
+                ["Li3-Renamed", "Li3-Test-3"], [b.dev_name for b in rb.batteries]
+            )
+            # Renamed battery kept its BLE session + gauges under the new name
+            self.assertIs(renamed_task, rb.supervise_tasks[renamed.mac_address])
+            soc_gauge = rb.prom_stats["battery_soc"]
+            self.assertEqual(79, soc_gauge.get(renamed.prom_labels))
+            self.assertEqual("Li3-Renamed", renamed.prom_labels["dev_name"])
+            # Removed battery was disconnected and its series dropped
+            self.assertNotIn(removed.mac_address, rb.supervise_tasks)
+            self.assertNotIn(removed.mac_address, self.backend.clients)
+            connected = rb.connection_manager.prom_stats["connected"]
+            self.assertNotIn(removed.prom_labels, connected.values)
+            while "FF:69:4E:00:00:03" not in self.backend.clients:
+                await asyncio.sleep(0)
+        finally:
+            supervise.cancel()
+            discovery.cancel()
+            await asyncio.gather(supervise, discovery, return_exceptions=True)
+        self.assertEqual({}, self.backend.clients)
+
+    async def test_li3_reload_rescans_supervised(self) -> None:
+        conf = copy.deepcopy(TEST_LI3_CONFIG)
+        rb = li3.RevelBatteries(conf, self.prom_registry)
+        supervisor = Supervisor(self.prom_registry)
+        supervisor.add(await rb.get_awaitables(30, event_stats=True))
+        run = asyncio.ensure_future(supervisor.run())
+        try:
+            while not self.backend.scanners:
+                await asyncio.sleep(0)
+            scanner = self.backend.scanners[0]
+
+            new_conf = copy.deepcopy(conf)
+            new_conf["li3"]["1"]["service_uuid"] = "NEW-UUID"
+            await rb.reload(new_conf)
+            while scanner in self.backend.scanners or not self.backend.scanners:
+                await asyncio.sleep(0)
+
+            # Rescanned inside the one supervised discovery task
+            discovery = supervisor.tasks["li3_discovery"]
+            self.assertEqual("running", discovery.state)
+            self.assertEqual(0, discovery.restarts)
+        finally:
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+        self.assertEqual([], self.backend.scanners)
+
+    async def test_hygrometers_reload(self) -> None:
+        conf = copy.deepcopy(TEST_HS075S_CONFIG)
+        h = govee.Hygrometers(conf["HS075S"], self.prom_registry)
+        for coro in await h.get_awaitables(30, event_stats=True):
+            coro.close()  # type: ignore
+        renamed, removed = h.hygrometers
+        renamed.process_data(fake_advertisement(renamed.mac_address))
+
+        new_conf = copy.deepcopy(conf)
+        new_conf["HS075S"]["1"]["dev_name"] = "HS075S-Renamed"
+        new_conf["HS075S"]["1"]["service_uuid"] = "0000ec89-0000-1000-8000-00805f9b34fb"
+        del new_conf["HS075S"]["2"]
+        new_conf["HS075S"]["3"] = {
+            **conf["HS075S"]["2"],
+            "mac_address": "A4:C1:38:00:00:03",
+        }
+        await h.reload(new_conf)
+
+        self.assertEqual(
+            {renamed.mac_address, "A4:C1:38:00:00:03"}, set(h.scanner.handlers)
+        )
+        self.assertEqual(50.2, h.prom_stats["humidity"].get(renamed.prom_labels))
+        self.assertEqual(
+            ("HS075S-Renamed", "0000ec89-0000-1000-8000-00805f9b34fb"),
+            (renamed.prom_labels["dev_name"], renamed.prom_labels["service_uuid"]),
+        )
+        # Only the new labels are exported
+        self.assertEqual(1, len(h.prom_stats["humidity"].values))
+        added = h.hygrometers[-1]
+        added.process_data(fake_advertisement(added.mac_address))
+        self.assertEqual(50.2, h.prom_stats["humidity"].get(added.prom_labels))
+
+    async def test_sighup(self) -> None:
+        reloaded: List[Dict[str, Any]] = []
+
+        async def _handler(conf: Dict[str, Any]) -> None:
+            reloaded.append(conf)
+
+        reloader = config_reloader(self.prom_registry)
+        reloader.handlers.append(_handler)
+        watch = asyncio.ensure_future(reloader.watch(lambda: {"li3": {}}))
+        await asyncio.sleep(0)
+        os.kill(os.getpid(), signal.SIGHUP)
+        while not reloaded:
+            await asyncio.sleep(0.01)
+        watch.cancel()
+        await asyncio.gather(watch, return_exceptions=True)
+        self.assertEqual([{"li3": {}}], reloaded)
+
+    async def test_sigterm(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        with TemporaryDirectory() as td:
+            conf_path = Path(td) / "vand.json"
+            conf_path.write_text(
+                json.dumps(
+                    {"vanD": {"prometheus_exporter_port": port, "shutdown_timeout": 2}}
+                )
+            )
+            vand = asyncio.ensure_future(async_main(False, str(conf_path)))
+            await asyncio.sleep(0.2)
+            os.kill(os.getpid(), signal.SIGTERM)
+            self.assertEqual(0, await asyncio.wait_for(vand, 5))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from importlib.util import find_spec
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, List, Optional
+
+from aiohttp import ClientSession, web
+from aioprometheus import Gauge
+from aioprometheus.collectors import Registry
+
+HAVE_SNAPPY = find_spec("snappy") is not None
+
+
+class FakeRemoteWriteReceiver:
+    """Local stand-in for a Prometheus remote_write endpoint"""
+
+    def __init__(
+        self, fail_first: int = 0, on_write: Optional[Callable[[], None]] = None
+    ) -> None:
+        self.bodies: List[bytes] = []
+        self.fail_first = fail_first
+        self.on_write = on_write
+        self.app = web.Application()
+        self.app.router.add_post("/api/v1/write", self.handle_write)
+        self.runner = web.AppRunner(self.app)
+
+    async def start(self) -> str:
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f"http://127.0.0.1:{port}/api/v1/write"
+
+    async def stop(self) -> None:
+        await self.runner.cleanup()
+
+    async def handle_write(self, request: web.Request) -> web.Response:
+        import snappy
+
+        assert request.headers["Content-Encoding"] == "snappy"
+        if self.fail_first:
+            self.fail_first -= 1
+            return web.Response(status=503)
+        if self.on_write:
+            self.on_write()
+        self.bodies.append(snappy.decompress(await request.read()))
+        return web.Response(status=204)
+
+
+@unittest.skipUnless(HAVE_SNAPPY, "python-snappy is not installed")
+class TestRemoteWriteClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        from vand.remote_write import RemoteWriteClient, SampleQueue
+
+        self.registry = Registry()
+        self.gauge = Gauge("unittest", "Unit test gauge", registry=self.registry)
+        self.gauge.set({"dev_name": "one"}, 1)
+        self.queue = SampleQueue(max_samples=2)
+        self.receiver = FakeRemoteWriteReceiver(fail_first=1)
+        url = await self.receiver.start()
+        self.rwc = RemoteWriteClient(
+            url, self.queue, self.registry, min_backoff=0.01, max_backoff=0.01
+        )
+
+    async def asyncTearDown(self) -> None:
+        await self.receiver.stop()
+
+    def test_encode(self) -> None:
+        from vand.sample_buffer import Sample
+
+        self.queue.series[("unittest", b'{"dev_name":"one"}')] = 0
+        encoded = self.rwc.encode([Sample(1.5, 0, 2.0)])
+        # TimeSeries{Label __name__, Label dev_name, Sample{2.0, 1500ms}}
+        self.assertEqual(
+            b"\x0a\x35"
+            + b"\x0a\x14\x0a\x08__name__\x12\x08unittest"
+            + b"\x0a\x0f\x0a\x08dev_name\x12\x03one"
+            + b"\x12\x0c\x09\x00\x00\x00\x00\x00\x00\x00\x40\x10\xdc\x0b",
+            encoded,
+        )
+
+    async def test_send_with_retry(self) -> None:
+        await self.queue.record_registry(self.registry, timestamp=69)
+        async with ClientSession() as session:
+            await self.rwc.send(session, self.queue.peek(10)[1])
+        self.assertEqual(1, len(self.receiver.bodies))
+        self.assertIn(b"dev_name", self.receiver.bodies[0])
+        self.assertEqual(1, self.rwc.prom_stats["retries"].get({}))
+        self.assertEqual(1, self.rwc.prom_stats["samples"].get({}))
+
+    async def test_queue_backpressure(self) -> None:
+        self.gauge.set({"dev_name": "two"}, 2)
+        await self.queue.record_registry(self.registry)
+        blocked = asyncio.create_task(self.queue.record_registry(self.registry))
+        await asyncio.sleep(0)
+        self.assertFalse(blocked.done())
+        self.queue.consume(0, 2)
+        self.assertEqual(2, await blocked)
+
+    async def test_ring_overflow_during_send(self) -> None:
+        from vand.remote_write import RemoteWriteClient
+        from vand.sample_buffer import SampleBuffer
+
+        with TemporaryDirectory() as td:
+            sb = SampleBuffer(str(Path(td) / "samples.ring"), capacity=4)
+            for timestamp in range(2):
+                sb.record_registry(self.registry, timestamp=timestamp)
+            sb.flush()
+
+            def overflow() -> None:
+                for timestamp in range(2, 6):
+                    sb.record_registry(self.registry, timestamp=timestamp)
+                sb.flush()
+
+            receiver = FakeRemoteWriteReceiver(on_write=overflow)
+            url = await receiver.start()
+            rwc = RemoteWriteClient(url, sb, Registry(), push_interval=60)
+            run_task = asyncio.create_task(rwc.run())
+            while not receiver.bodies:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.1)
+            run_task.cancel()
+            await receiver.stop()
+            # Samples 0 + 1 were sent, 2 - 5 pushed them out of the ring mid send
+            self.assertEqual([2, 3, 4, 5], [s.timestamp for s in sb.peek(10)[1]])
+            sb.mmap.close()
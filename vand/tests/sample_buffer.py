@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from aioprometheus import Gauge
+from aioprometheus.collectors import Registry
+
+from vand.sample_buffer import Sample, SampleBuffer
+
+
+class TestSampleBuffer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.td = TemporaryDirectory()
+        self.ring_path = str(Path(self.td.name) / "samples.ring")
+        self.sb = SampleBuffer(self.ring_path, capacity=4, flush_interval=0)
+
+    def tearDown(self) -> None:
+        self.sb.mmap.close()
+        self.td.cleanup()
+
+    def test_record_registry(self) -> None:
+        registry = Registry()
+        gauge = Gauge("unittest", "Unit test gauge", registry=registry)
+        gauge.set({"dev_name": "one"}, 1)
+        gauge.set({"dev_name": "two"}, 2)
+        self.assertEqual(2, self.sb.record_registry(registry, timestamp=69))
+        # Nothing is durable until we flush
+        self.assertEqual(0, len(self.sb))
+        self.sb.flush()
+        self.assertEqual([Sample(69, 0, 1), Sample(69, 1, 2)], self.sb.peek(10)[1])
+        self.assertEqual(
+            [("unittest", {"dev_name": "one"}), ("unittest", {"dev_name": "two"})],
+            self.sb.series_labels(),
+        )
+
+    def test_ring_wraps_and_consume(self) -> None:
+        for i in range(6):
+            self.sb.append(0, i, i)
+        self.sb.flush()
+        self.assertEqual(4, len(self.sb))
+        self.assertEqual([2, 3, 4, 5], [s.value for s in self.sb.peek(10)[1]])
+
+        self.sb.consume(2, 3)
+        self.sb.append(0, 6, 6)
+        self.sb.flush()
+        self.assertEqual([5, 6], [s.value for s in self.sb.peek(10)[1]])
+
+    def test_consume_after_overflow(self) -> None:
+        for i in range(4):
+            self.sb.append(0, i, i)
+        self.sb.flush()
+        start, samples = self.sb.peek(2)
+        # The ring overflows while the batch is being sent
+        for i in range(4, 8):
+            self.sb.append(0, i, i)
+        self.sb.flush()
+        self.sb.consume(start, len(samples))
+        self.assertEqual([4, 5, 6, 7], [s.value for s in self.sb.peek(10)[1]])
+
+    def test_consume_pending(self) -> None:
+        self.sb.append(0, 0, 0)
+        self.sb.flush()
+        self.sb.append(0, 1, 1)
+        self.sb.append(0, 2, 2)
+        start, samples = self.sb.peek(2)
+        self.assertEqual([0, 1], [s.value for s in samples])
+        self.sb.consume(start, len(samples))
+        self.sb.flush()
+        self.assertEqual((2, [Sample(2, 0, 2)]), self.sb.peek(10))
+
+    def test_recovery(self) -> None:
+        for i in range(3):
+            self.sb.append(0, i, i)
+        self.sb.flush()
+        self.sb.consume(0, 1)
+        # Unflushed samples are lost on a crash + the unflushed tail re-sends
+        self.sb.append(0, 69, 69)
+        self.sb.mmap.close()
+
+        self.sb = SampleBuffer(self.ring_path, capacity=4)
+        self.assertEqual([0, 1, 2], [s.value for s in self.sb.peek(10)[1]])
+        generation = self.sb.generation
+        self.sb.consume(0, 1)
+        # Draining doesn't write the header - the next flush does
+        self.assertEqual(generation, self.sb.generation)
+        self.sb.flush()
+        self.assertEqual(generation + 1, self.sb.generation)
+        self.sb.mmap.close()
+
+        self.sb = SampleBuffer(self.ring_path, capacity=4)
+        self.assertEqual([1, 2], [s.value for s in self.sb.peek(10)[1]])
+
+    def test_torn_header(self) -> None:
+        self.sb.append(0, 1, 1)
+        self.sb.flush()
+        self.sb.append(0, 2, 2)
+        self.sb.flush()
+        # Corrupt the newest header slot - we should fall back to the older one
+        offset = (self.sb.generation % 2) * SampleBuffer.HEADER_SLOT_SIZE
+        self.sb.mmap[offset + 40 : offset + 44] = b"\xff\xff\xff\xff"
+        self.sb.mmap.close()
+
+        self.sb = SampleBuffer(self.ring_path, capacity=4)
+        self.assertEqual([1], [s.value for s in self.sb.peek(10)[1]])
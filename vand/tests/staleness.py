@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import copy
+import unittest
+from typing import Any, Dict, List
+
+from aioprometheus.collectors import Registry
+from aioprometheus.renderer import render
+
+from vand import govee, li3
+from vand.alerts import alert_engine
+from vand.backends import fake_advertisement
+from vand.tests.govee_fixtures import TEST_HS075S_CONFIG
+from vand.tests.li3_fixtures import FAKE_LI3_BINARY_DATA, TEST_LI3_CONFIG
+
+
+class TestStalenessTracker(unittest.TestCase):
+    def setUp(self) -> None:
+        conf: Dict[str, Any] = copy.deepcopy(TEST_LI3_CONFIG)
+        conf["vanD"] = {"derived_metrics": {}, "staleness": {"ttl": 60.0}}
+        self.prom_registry = Registry()
+        alert_engine(self.prom_registry).configure(
+            {"low": {"field": "battery_voltage", "below": 20}}
+        )
+        self.rb = li3.RevelBatteries(conf, self.prom_registry, aggregate_windows=[60])
+        assert self.rb.aggregator is not None and self.rb.derived is not None
+        self.aggregator = self.rb.aggregator
+        self.derived = self.rb.derived
+        for battery in self.rb.batteries:
+            self.rb._add_stats_callbacks(battery)
+            self._notify(battery)
+            battery.seen.set()
+        self.battery = self.rb.batteries[0]
+        self.labels = self.battery.prom_labels
+        self.rb.refresh_prom_stats()
+        self.rb.collect_metrics()
+
+    def _notify(self, battery: li3.Li3Battery) -> None:
+        for data in FAKE_LI3_BINARY_DATA:
+            battery._telementary_handler("unittest", data)
+
+    def test_timestamps(self) -> None:
+        self.assertGreater(self.battery.last_seen, 0)
+        self.assertEqual(self.battery.last_notification, self.battery.last_seen)
+        staleness = self.rb.staleness
+        self.assertEqual(
+            [], staleness.check(self.rb.batteries, self.battery.last_seen + 5)
+        )
+        self.assertEqual(
+            self.battery.last_seen, staleness.prom_stats["last_seen"].get(self.labels)
+        )
+        self.assertEqual(5, staleness.prom_stats["sample_age"].get(self.labels))
+
+    def _exposition(self) -> str:
+        return render(self.prom_registry, [])[0].decode()
+
+    def test_expire_and_return(self) -> None:
+        mac_address = self.battery.mac_address
+        voltage = self.rb.prom_stats["battery_voltage"]
+        staleness_stats = self.rb.staleness.prom_stats
+        self.assertIn(mac_address, self._exposition())
+        charge_in = self.derived.states[mac_address].charge_in
+        self.battery.last_seen -= 61
+        self.rb.collect_metrics()
+        # No series at all - stats, frames, alerts, derived, last seen + age ...
+        exposition = self._exposition()
+        self.assertNotIn(mac_address, exposition)
+        self.assertIn(self.rb.batteries[1].mac_address, exposition)
+        self.assertEqual(1, staleness_stats["expired"].get({}))
+        self.assertNotIn(mac_address, self.aggregator.device_windows)
+        self.assertNotIn(mac_address, self.rb.history._device_series)
+        self.assertNotIn(mac_address, self.rb.dashboard.state)
+        self.assertNotIn(("low", mac_address), self.rb.alerts.states)
+        # Energy counters carry on from where they were if it returns
+        self.assertNotIn(mac_address, self.derived.states)
+        self.assertEqual(charge_in, self.derived.saved_totals[mac_address]["charge_in"])
+        self.assertFalse(self.battery.seen.is_set())
+
+        # Not re-exported until it sends again + only expired once
+        self.rb.refresh_prom_stats()
+        self.rb.collect_metrics()
+        self.assertNotIn(mac_address, self._exposition())
+        self.assertEqual(1, staleness_stats["expired"].get({}))
+
+        self._notify(self.battery)
+        self.rb.collect_metrics()
+        self.rb.refresh_prom_stats()
+        self.assertEqual(13.09, voltage.get(self.labels))
+        # Last seen + age are exported again
+        age = staleness_stats["sample_age"].get(self.labels)
+        assert isinstance(age, float)
+        self.assertLess(age, 60)
+        self.assertEqual(
+            1, self.rb.alerts.prom_stats["firing"].get({**self.labels, "rule": "low"})
+        )
+
+    def test_no_ttl(self) -> None:
+        rb = li3.RevelBatteries(copy.deepcopy(TEST_LI3_CONFIG), Registry())
+        battery = rb.batteries[0]
+        self._notify(battery)
+        self.assertEqual([], rb.staleness.check(rb.batteries, battery.last_seen + 1e6))
+
+    def test_hygrometer_returns_with_same_reading(self) -> None:
+        h = govee.Hygrometers(
+            TEST_HS075S_CONFIG["HS075S"], Registry(), staleness={"ttl": 60.0}
+        )
+        hygrometer = h.hygrometers[0]
+        hygrometer.process_data(fake_advertisement(hygrometer.mac_address))
+        h.refresh_prom_stats()
+        humidity = h.prom_stats["humidity"]
+        self.assertEqual(50.2, humidity.get(hygrometer.prom_labels))
+
+        hygrometer.last_seen -= 61
+        h.collect_metrics()
+        with self.assertRaises(KeyError):
+            humidity.get(hygrometer.prom_labels)
+
+        samples: List[govee.HS075S] = []
+        hygrometer.stats_callbacks.append(samples.append)
+        hygrometer.process_data(fake_advertisement(hygrometer.mac_address))
+        self.assertEqual([hygrometer], samples)
+        h.collect_metrics()
+        h.refresh_prom_stats()
+        self.assertEqual(50.2, humidity.get(hygrometer.prom_labels))
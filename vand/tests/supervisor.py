@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from typing import List
+
+from aioprometheus.collectors import Registry
+
+from vand import li3
+from vand.supervisor import CrashBudgetExceeded, Restartable, Supervisor
+from vand.tests.li3_fixtures import TEST_LI3_CONFIG
+
+
+class TestSupervisor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.supervisor = Supervisor(
+            Registry(),
+            default={"min_backoff": 0.0, "max_restarts": 2},
+            tasks={"flaky": {"max_restarts": 3}},
+        )
+        self.runs: List[str] = []
+
+    async def _crash(self, name: str, times: int = 1000) -> None:
+        self.runs.append(name)
+        await asyncio.sleep(0)
+        if self.runs.count(name) <= times:
+            raise ValueError(f"{name} crashed")
+        await asyncio.Future()
+
+    async def _healthy(self) -> None:
+        self.runs.append("healthy")
+        await asyncio.Future()
+
+    def _state(self, name: str) -> str:
+        task = self.supervisor.tasks[name]
+        for state in ("running", "backoff", "finished", "failed"):
+            if self.supervisor.prom_stats["state"].get(
+                {**task.prom_labels, "state": state}
+            ):
+                return state
+        return ""
+
+    async def test_restarts(self) -> None:
+        self.supervisor.add(
+            [
+                Restartable(lambda: self._crash("flaky", 3), "flaky"),
+                Restartable(lambda: self._crash("broken"), "broken"),
+                Restartable(self._healthy),
+                Restartable(self._healthy),
+            ]
+        )
+        self.assertEqual(
+            ["flaky", "broken", "TestSupervisor._healthy", "TestSupervisor._healthy#2"],
+            list(self.supervisor.tasks),
+        )
+        run = asyncio.ensure_future(self.supervisor.run())
+        try:
+            while self.runs.count("flaky") < 4 or self._state("broken") != "failed":
+                await asyncio.sleep(0.01)
+            # Restarted within its own budget while the rest kept running
+            flaky = self.supervisor.tasks["flaky"]
+            self.assertEqual((3, "running"), (flaky.restarts, self._state("flaky")))
+            self.assertEqual(
+                3, self.supervisor.prom_stats["restarts"].get({"task": "flaky"})
+            )
+            self.assertEqual(3, self.runs.count("broken"))
+            self.assertEqual(2, self.runs.count("healthy"))
+            self.assertFalse(run.done())
+        finally:
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+
+    async def test_critical(self) -> None:
+        self.supervisor.task_policies["broken"] = {"critical": True}
+        self.supervisor.add(
+            [Restartable(lambda: self._crash("broken"), "broken"), self._healthy()]
+        )
+        with self.assertRaises(ExceptionGroup) as cm:
+            await asyncio.wait_for(self.supervisor.run(), 5)
+        self.assertIsInstance(cm.exception.exceptions[0], CrashBudgetExceeded)
+        self.assertEqual(3, self.runs.count("broken"))
+        self.assertEqual(1, self.runs.count("healthy"))
+
+    async def test_plain_coroutines(self) -> None:
+        # Can't be re-run - finishing is fine, crashing stops everything
+        self.supervisor.add([asyncio.sleep(0), self._crash("plain")])
+        with self.assertRaises(ExceptionGroup):
+            await self.supervisor.run()
+        self.assertEqual("finished", self._state("sleep"))
+        self.assertEqual("failed", self._state("TestSupervisor._crash"))
+        self.assertEqual(["plain"], self.runs)
+
+    async def test_li3_tasks_restartable(self) -> None:
+        rb = li3.RevelBatteries(TEST_LI3_CONFIG, Registry())
+        self.supervisor.add(await rb.get_awaitables(30))
+        # Stable names so restart policies can target them
+        self.assertEqual(
+            [
+                "li3_discovery",
+                "RevelBatteries.stats_refresh",
+                "RevelBatteries.supervise_batteries",
+            ],
+            list(self.supervisor.tasks),
+        )
+        self.assertTrue(all(t.restartable for t in self.supervisor.tasks.values()))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    unittest.main()